@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 # encoding:utf-8
 import sys
+import os
 import cv2
+import glob
 import time
+import hashlib
+import tempfile
 import threading
 import numpy as np
 from CameraCalibration.CalibrationConfig import *
@@ -13,26 +17,153 @@ if sys.version_info.major == 2:
     print('Please run this program with python3!')
     sys.exit(0)
 
+def scale_matrix(m, sx, sy):
+    # 图像缩放sx, sy倍后的相机矩阵(按像素中心对齐)
+    m = np.array(m, dtype=np.float64)
+    m[0, 0] *= sx
+    m[0, 1] *= sx
+    m[0, 2] = (m[0, 2] + 0.5) * sx - 0.5
+    m[1, 1] *= sy
+    m[1, 2] = (m[1, 2] + 0.5) * sy - 0.5
+    return m
+
+def undistort_maps(k, d, dim, src_size, dst_size, balance=0.0):
+    # 鱼眼畸变矫正映射表, 把缩放合并进映射表: 一次remap从采集尺寸src_size的画面直接得到dst_size的矫正画面
+    # 标定参数对应dim尺寸的画面, 采集和输出尺寸不同时分别缩放相机矩阵
+    p = cv2.fisheye.estimateNewCameraMatrixForUndistortRectify(k, d, dim, None, balance=balance)
+    k_src = scale_matrix(k, src_size[0] / dim[0], src_size[1] / dim[1])
+    p_dst = scale_matrix(p, dst_size[0] / dim[0], dst_size[1] / dim[1])
+    return cv2.fisheye.initUndistortRectifyMap(k_src, d, np.eye(3), p_dst, tuple(dst_size), cv2.CV_16SC2)
+
+# 映射表缓存目录, 和标定参数放在一起
+maps_cache_path = os.path.join(os.path.dirname(calibration_param_path), 'undistort_maps')
+stale_tmp_age = 600  # 超过这个时间(秒)的临时文件是中断的写入留下的
+
+def cached_undistort_maps(k, d, dim, src_size, dst_size, balance=0.0, cache_path=maps_cache_path):
+    # 和undistort_maps()相同, 计算结果按参数的哈希值保存在cache_path中, 参数相同时用mmap直接加载, 不再计算
+    # 标定参数改变后哈希值不同, 重新计算并删除同样尺寸的旧缓存
+    key = hashlib.sha1()
+    for item in (np.asarray(k, dtype=np.float64), np.asarray(d, dtype=np.float64),
+                 np.asarray([*dim, *src_size, *dst_size], dtype=np.int64), np.asarray([balance], dtype=np.float64)):
+        key.update(item.tobytes())
+    key.update(cv2.__version__.encode())
+    prefix = os.path.join(cache_path, '%dx%d_%dx%d_' % (*src_size, *dst_size))
+    name = prefix + key.hexdigest()[:16]
+    try:
+        return np.load(name + '_map1.npy', mmap_mode='r'), np.load(name + '_map2.npy', mmap_mode='r')
+    except (OSError, ValueError):
+        pass
+
+    map1, map2 = undistort_maps(k, d, dim, src_size, dst_size, balance)
+    try:
+        os.makedirs(cache_path, exist_ok=True)
+        # 旧的标定参数的缓存, 以及写入时中断留下的临时文件
+        # 其他进程可能正在写入自己的临时文件, 只删除stale_tmp_age秒之前的
+        stale = glob.glob(prefix + '*.npy')
+        for path in glob.glob(os.path.join(cache_path, '*.tmp')):
+            try:
+                if time.time() - os.path.getmtime(path) > stale_tmp_age:
+                    stale.append(path)
+            except FileNotFoundError:
+                pass
+        for path in stale:
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # 已被其他进程删除
+                pass
+        # 先写入临时文件再改名, 其他进程不会读到写了一半的文件
+        for suffix, data in (('_map2.npy', map2), ('_map1.npy', map1)):
+            fd, tmp = tempfile.mkstemp(dir=cache_path, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, data)
+            os.replace(tmp, name + suffix)
+    except OSError as e:
+        print('保存畸变矫正映射表失败:', e)
+    return map1, map2
+
+class FrameRing:
+    # 预先分配的画面环形缓冲区, 摄像头线程直接把画面写入下一个位置, 每帧带序号和采集时间
+    # 读取得到的是只读视图, 不拷贝; 视图在被之后写入的size-1帧覆盖之前有效(30帧/秒, size=4时约100ms),
+    # 需要长期保存或在画面上画图时请自行copy()
+    def __init__(self, size=4):
+        self.size = size
+        self.slots = [None] * size
+        self.views = [None] * size
+        self.stamps = [0.0] * size
+        self.seq = -1        # 最新一帧的序号, 从0开始
+        self.valid = False   # 摄像头关闭或读取失败时为False
+        self.cond = threading.Condition()
+
+    def slot(self, shape):
+        # 下一帧要写入的缓冲区, 只在摄像头线程中调用
+        i = (self.seq + 1) % self.size
+        if self.slots[i] is None or self.slots[i].shape != shape:
+            self.slots[i] = np.empty(shape, dtype=np.uint8)
+            view = self.slots[i].view()
+            view.flags.writeable = False
+            self.views[i] = view
+        return self.slots[i]
+
+    def publish(self, timestamp):
+        # slot()返回的缓冲区写好之后调用
+        with self.cond:
+            i = (self.seq + 1) % self.size
+            self.stamps[i] = timestamp
+            self.seq += 1
+            self.valid = True
+            self.cond.notify_all()
+
+    def invalidate(self):
+        with self.cond:
+            self.valid = False
+
+    def latest(self):
+        # 最新一帧的 (序号, 采集时间, 只读画面), 没有画面时返回None
+        with self.cond:
+            if not self.valid:
+                return None
+            i = self.seq % self.size
+            return self.seq, self.stamps[i], self.views[i]
+
+    def wait_next(self, after_seq=-1, timeout=None):
+        # 等待序号大于after_seq的画面, 返回最新一帧的 (序号, 采集时间, 只读画面), 超时返回None
+        # 处理速度跟不上时中间的帧被跳过, 可以通过序号的差值知道跳过了多少帧
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.valid and self.seq > after_seq, timeout):
+                return None
+            i = self.seq % self.size
+            return self.seq, self.stamps[i], self.views[i]
+
 class Camera:
-    def __init__(self, resolution=(640, 480)):
+    def __init__(self, resolution=(640, 480), buffers=4):
         self.cap = None
         self.width = resolution[0]
         self.height = resolution[1]
-        self.frame = None
+        self.frames = FrameRing(buffers)
+        self.raw = None      # 需要缩放或矫正时的采集缓冲区
         self.opened = False
         
         #加载参数
         self.param_data = np.load(calibration_param_path + '.npz')
         #获取参数
-        dim = tuple(self.param_data['dim_array'])
-        k = np.array(self.param_data['k_array'].tolist())
-        d = np.array(self.param_data['d_array'].tolist())
-        p = cv2.fisheye.estimateNewCameraMatrixForUndistortRectify(k, d, dim ,None).copy()
-        self.map1, self.map2 = cv2.fisheye.initUndistortRectifyMap(k, d, np.eye(3), p, dim, cv2.CV_16SC2)
+        self.dim = tuple(self.param_data['dim_array'])
+        self.k = np.array(self.param_data['k_array'].tolist())
+        self.d = np.array(self.param_data['d_array'].tolist())
+        self.maps = {}  # 采集尺寸 -> 矫正映射表, 第一次采集到该尺寸的画面时计算
         
         self.th = threading.Thread(target=self.camera_task, args=(), daemon=True)
         self.th.start()
 
+    @property
+    def frame(self):
+        # 最新画面的只读视图, 没有画面时为None
+        latest = self.frames.latest()
+        return None if latest is None else latest[2]
+
+    def wait_next(self, after_seq=-1, timeout=None):
+        # 等待比after_seq新的画面, 返回 (序号, 采集时间, 只读画面), 超时返回None
+        return self.frames.wait_next(after_seq, timeout)
+
     def camera_open(self, correction=False):
         try:
             self.cap = cv2.VideoCapture(-1)
@@ -48,6 +179,7 @@ class Camera:
         try:
             self.opened = False
             time.sleep(0.2)
+            self.frames.invalidate()  # 等摄像头线程写完最后一帧
             if self.cap is not None:
                 self.cap.release()
                 time.sleep(0.05)
@@ -55,22 +187,40 @@ class Camera:
         except Exception as e:
             print('关闭摄像头失败:', e)
 
+    def undistort_maps(self, src_size):
+        if src_size not in self.maps:
+            self.maps[src_size] = cached_undistort_maps(self.k, self.d, self.dim, src_size, (self.width, self.height))
+        return self.maps[src_size]
+
+    def read_frame(self):
+        # 把一帧画面读入环形缓冲区, 尺寸相同且不需要矫正时直接读入, 否则读入采集缓冲区后缩放或矫正到环形缓冲区
+        shape = (self.height, self.width, 3)
+        direct = not self.correction and (self.raw is None or self.raw.shape == shape)
+        buf = self.frames.slot(shape) if direct else self.raw
+        ret, frame_tmp = self.cap.read(buf)
+        if not ret:
+            return False
+        timestamp = time.monotonic()
+        if direct and frame_tmp is buf:
+            self.frames.publish(timestamp)
+            return True
+        self.raw = frame_tmp  # 采集尺寸不同时, 之后读入采集缓冲区
+        out = self.frames.slot(shape)
+        if self.correction:
+            # 缩放和矫正在同一次remap中完成
+            map1, map2 = self.undistort_maps((frame_tmp.shape[1], frame_tmp.shape[0]))
+            cv2.remap(frame_tmp, map1, map2, interpolation=cv2.INTER_LINEAR, dst=out, borderMode=cv2.BORDER_CONSTANT)
+        else:
+            cv2.resize(frame_tmp, (self.width, self.height), out, interpolation=cv2.INTER_NEAREST)
+        self.frames.publish(timestamp)
+        return True
+
     def camera_task(self):
         while True:
             try:
                 if self.opened and self.cap.isOpened():
-                    ret, frame_tmp = self.cap.read()
-                    if ret:
-                        frame_resize = cv2.resize(frame_tmp, (self.width, self.height), interpolation=cv2.INTER_NEAREST)
-                        
-                        if self.correction:
-                            self.frame = cv2.remap(frame_resize, self.map1, self.map2, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
-                        else:
-                            self.frame = frame_resize
-                            
-                        ret = False
-                    else:
-                        self.frame = None
+                    if not self.read_frame():
+                        self.frames.invalidate()
                         self.cap.release()
                         cap = cv2.VideoCapture(-1)
                         ret, _ = cap.read()
@@ -91,12 +241,17 @@ class Camera:
 if __name__ == '__main__':
     camera = Camera()
     camera.camera_open()
+    seq = -1
     while True:
-        img = camera.frame
-        if img is not None:
+        ret = camera.wait_next(seq, 1)
+        if ret is not None:
+            last_seq = seq
+            seq, timestamp, img = ret
+            if last_seq >= 0 and seq - last_seq > 1:
+                print('skipped %d frames' % (seq - last_seq - 1))
             cv2.imshow('img', img)
             key = cv2.waitKey(1)
             if key == 27:
                 break
-    my_camera.camera_close()
+    camera.camera_close()
     cv2.destroyAllWindows()
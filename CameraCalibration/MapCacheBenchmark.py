@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# encoding:utf-8
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from Camera import undistort_maps, cached_undistort_maps
+from CalibrationConfig import *
+
+# 畸变矫正映射表启动耗时测试: 每次计算 和 从缓存文件(mmap)加载
+# 缓存写在临时目录中, 不影响摄像头使用的缓存
+# python3 MapCacheBenchmark.py --capture 640x480 --output 640x480
+
+def size_arg(text):
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+def measure(func, count):
+    times = []
+    for _ in range(count):
+        t = time.perf_counter()
+        maps = func()
+        times.append(time.perf_counter() - t)
+    return min(times) * 1000, maps
+
+if __name__ == '__main__':
+    arg = argparse.ArgumentParser(description='Undistortion map compute vs cache load benchmark')
+    arg.add_argument('--capture', type=size_arg, default=(640, 480), help='capture size WxH')
+    arg.add_argument('--output', type=size_arg, default=(640, 480), help='output size WxH')
+    arg.add_argument('--count', type=int, default=20)
+    arg.add_argument('--param', default=calibration_param_path)
+    args = arg.parse_args()
+
+    param_data = np.load(args.param + '.npz')
+    dim = tuple(param_data['dim_array'])
+    k = np.array(param_data['k_array'].tolist())
+    d = np.array(param_data['d_array'].tolist())
+
+    cache_path = tempfile.mkdtemp()
+    try:
+        t_compute, (map1, map2) = measure(lambda: undistort_maps(k, d, dim, args.capture, args.output), args.count)
+        t = time.perf_counter()
+        cached_undistort_maps(k, d, dim, args.capture, args.output, cache_path=cache_path)
+        t_miss = (time.perf_counter() - t) * 1000
+        t_hit, (cache1, cache2) = measure(lambda: cached_undistort_maps(k, d, dim, args.capture, args.output, cache_path=cache_path), args.count)
+        # mmap加载后第一次remap时才真正读取文件, 这里包含读取全部数据的时间
+        t_touch, _ = measure(lambda: [np.array(i) for i in cached_undistort_maps(k, d, dim, args.capture, args.output, cache_path=cache_path)], args.count)
+        assert np.array_equal(map1, cache1) and np.array_equal(map2, cache2)
+        print('%dx%d -> %dx%d  compute %.2f ms  first run (compute+save) %.2f ms  cache load %.2f ms  cache load+read %.2f ms  (%.1fx)' % (
+            *args.capture, *args.output, t_compute, t_miss, t_hit, t_touch, t_compute / t_touch))
+    finally:
+        shutil.rmtree(cache_path)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# encoding:utf-8
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cv2
+import time
+import argparse
+import numpy as np
+from Camera import undistort_maps
+from CalibrationConfig import *
+
+# 畸变矫正耗时测试: 先缩放再remap(两次全画面处理) 和 缩放合并进映射表的一次remap
+# 使用合成画面, 不需要摄像头; 两种方式都使用和输出尺寸匹配的映射表, 差异来自缩放方式(最近邻缩放和remap中的线性插值)
+# python3 RemapBenchmark.py --capture 640x480
+
+def size_arg(text):
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+def measure(func, frame, count):
+    func(frame)
+    t = time.perf_counter()
+    for _ in range(count):
+        out = func(frame)
+    return (time.perf_counter() - t) / count * 1000, out
+
+if __name__ == '__main__':
+    arg = argparse.ArgumentParser(description='Resize+remap vs fused remap benchmark')
+    arg.add_argument('--capture', type=size_arg, default=(640, 480), help='capture size WxH')
+    arg.add_argument('--count', type=int, default=200)
+    arg.add_argument('--param', default=calibration_param_path)
+    args = arg.parse_args()
+
+    param_data = np.load(args.param + '.npz')
+    dim = tuple(param_data['dim_array'])
+    k = np.array(param_data['k_array'].tolist())
+    d = np.array(param_data['d_array'].tolist())
+
+    # 带纹理的合成画面, 比较两种方式的结果差异
+    w, h = args.capture
+    x, y = np.meshgrid(np.arange(w), np.arange(h))
+    frame = np.dstack([(x * 255 // w), (y * 255 // h), ((x // 16 + y // 16) % 2) * 255]).astype(np.uint8)
+
+    for size in [(640, 480), (320, 240)]:
+        # 原来的方式: 缩放到输出尺寸, 再用输出尺寸的映射表remap
+        map1, map2 = undistort_maps(k, d, dim, size, size)
+        def resize_remap(img):
+            img = cv2.resize(img, size, interpolation=cv2.INTER_NEAREST)
+            return cv2.remap(img, map1, map2, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        fused1, fused2 = undistort_maps(k, d, dim, (w, h), size)
+        def fused(img):
+            return cv2.remap(img, fused1, fused2, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+        t_old, out_old = measure(resize_remap, frame, args.count)
+        t_new, out_new = measure(fused, frame, args.count)
+        diff = np.abs(out_old.astype(np.int16) - out_new.astype(np.int16))
+        print('%dx%d -> %dx%d  resize+remap %.2f ms  fused remap %.2f ms  (%.1fx)  mean diff %.2f' % (
+            w, h, size[0], size[1], t_old, t_new, t_old / t_new, diff.mean()))
@@ -7,13 +7,15 @@ import time
 import signal
 import Camera
 import threading
-import numpy as np
+import collections
 import yaml_handle
-import pandas as pd
 import HiwonderSDK.Sonar as Sonar
 import HiwonderSDK.mecanum as mecanum
+from HiwonderSDK.stream_filter import StreamFilter
+from HiwonderSDK.telemetry import latency_summary
 
 # 超声波避障
+# 避障控制在单独的固定频率循环中运行, 直接使用超声波后台测距的数据, 不依赖摄像头帧率, run(img)只负责显示
 
 if sys.version_info.major == 2:
     print('Please run this program with python3!')
@@ -25,7 +27,13 @@ speed = 40
 old_speed = 0
 distance = 500
 Threshold = 30.0
-distance_data = []
+distance_filter = StreamFilter(5, 'sigma')  # 最近5次测距中去掉偏离均值超过1倍标准差的数据后求平均
+last_sample = 0.0  # 已经处理过的超声波样本的时间戳
+rate = 50  # 避障控制频率Hz
+
+obstacle_time = None  # 连续低于阈值的第一个超声波样本的时间, 即障碍物出现的时间
+reaction = collections.deque(maxlen=100)  # 障碍物出现到发出转向命令的时间(ms)
+loop_overruns = 0
 
 TextSize = 12
 TextColor = (0, 255, 255)
@@ -54,6 +62,8 @@ def reset():
     global old_speed
     global Threshold
     global stopMotor
+    global obstacle_time
+    global loop_overruns
     global __isRunning
     
     speed = 40
@@ -63,6 +73,10 @@ def reset():
     turn = True
     forward = True
     stopMotor = True
+    obstacle_time = None
+    reaction.clear()
+    distance_filter.reset()  # 上一次运行的距离数据不带到这次
+    loop_overruns = 0
     __isRunning = False
     
 # app初始化调用
@@ -101,8 +115,7 @@ def exit():
     car.set_velocity(0,90,0)
     time.sleep(0.3)
     car.set_velocity(0,90,0) # 控制机器人移动函数,线速度0(0~100)，方向角90(0~360)，偏航角速度0(-2~2)
-    HWSONAR.setPixelColor(0, (0, 0, 0))
-    HWSONAR.setPixelColor(1, (0, 0, 0))
+    HWSONAR.setPixelColors((0, 0, 0), (0, 0, 0))
     print("Avoidance Exit")
 
 # 设置避障速度
@@ -122,6 +135,30 @@ def getThreshold(args):
     global Threshold
     return (True, (Threshold,))
 
+# 获取障碍物出现到转向命令的反应时间 平均值, p95, 最大值(ms)
+def getReactionTime(args=()):
+    return (True, latency_summary(reaction))
+
+# 读取新的超声波数据并更新滤波后的距离
+def update_distance():
+    global distance
+    global last_sample
+    global obstacle_time
+
+    if HWSONAR.running:
+        # 超声波在后台测距, 只处理上一次之后的新样本
+        samples = [(float(sample[0]), int(sample[1])) for sample in HWSONAR.distance_data.since(last_sample)]
+    else:
+        samples = [(time.monotonic(), HWSONAR.getDistance())] # 获取超声波传感器距离数据
+    for timestamp, dist in samples:
+        last_sample = timestamp
+        distance = distance_filter.update(dist / 10.0)
+        if dist / 10.0 <= Threshold:
+            if obstacle_time is None:
+                obstacle_time = timestamp
+        else:
+            obstacle_time = None
+
 # 机器人移动逻辑处理
 def move():
     global turn
@@ -131,21 +168,31 @@ def move():
     global Threshold
     global old_speed
     global stopMotor
+    global loop_overruns
     global __isRunning
 
+    period = 1.0 / rate
+    next_time = time.monotonic()
+    turn_until = 0
     while True:
-        if __isRunning:   
+        if __isRunning and HWSONAR is not None:
+            update_distance()
+            now = time.monotonic()
             if speed != old_speed:   # 同样的速度值只设置一次 
                 old_speed = speed
                 car.set_velocity(speed,90,0) # 控制机器人移动函数,线速度speed(0~100)，方向角90(0~360)，偏航角速度0(-2~2)
                 
-            if distance <= Threshold:   # 检测是否达到距离阈值
+            if now < turn_until:  # 转向至少持续0.5秒
+                pass
+            elif distance <= Threshold:   # 检测是否达到距离阈值
                 if turn: # 做一个判断防止重复发指令
                     turn = False
                     forward = True
                     stopMotor = True
                     car.set_velocity(0,90,-0.5) # 距离小于阈值，设置机器人向左转
-                    time.sleep(0.5)
+                    if obstacle_time is not None:
+                        reaction.append((time.monotonic() - obstacle_time) * 1000)
+                    turn_until = now + 0.5
                 
             else:
                 if forward: # 做一个判断防止重复发指令
@@ -159,7 +206,17 @@ def move():
                 car.set_velocity(0,90,0)  # 关闭所有电机
             turn = True
             forward = True
-            time.sleep(0.03)
+            turn_until = 0
+
+        # 等到下一个周期, 超时的周期不补发
+        next_time += period
+        delay = next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            if __isRunning:
+                loop_overruns += 1
+            next_time = time.monotonic()
  
 # 运行子线程
 th = threading.Thread(target=move)
@@ -168,25 +225,11 @@ th.start()
 
 # 机器人图像和传感器检测处理
 def run(img):
-    global HWSONAR
-    global distance
-    global distance_data
-    
-    dist = HWSONAR.getDistance() / 10.0 # 获取超声波传感器距离数据
-
-    distance_data.append(dist) # 距离数据缓存到列表
-    data = pd.DataFrame(distance_data)
-    data_ = data.copy()
-    u = data_.mean()  # 计算均值
-    std = data_.std()  # 计算标准差
-
-    data_c = data[np.abs(data - u) <= std]
-    distance = data_c.mean()[0]
-
-    if len(distance_data) == 5: # 多次检测取平均值
-        distance_data.remove(distance_data[0])
-
-    return cv2.putText(img, "Dist:%.1fcm"%distance, (30, 480-30), cv2.FONT_HERSHEY_SIMPLEX, 1.2, TextColor, 2)  # 把超声波测距值打印在画面上
+    # 距离由避障循环更新, 这里只把超声波测距值和反应时间打印在画面上
+    img = cv2.putText(img, "Dist:%.1fcm"%distance, (30, 480-30), cv2.FONT_HERSHEY_SIMPLEX, 1.2, TextColor, 2)
+    if reaction:
+        img = cv2.putText(img, "React:%.0fms"%reaction[-1], (30, 480-70), cv2.FONT_HERSHEY_SIMPLEX, 0.8, TextColor, 2)
+    return img
 
 
 #关闭前处理
@@ -199,26 +242,30 @@ def manual_stop(signum, frame):
 
 if __name__ == '__main__':
     import HiwonderSDK.ros_robot_controller_sdk as rrc
-    board = rrc.Board()
+    board = rrc.acquire_board()
+    car.board = board
 
     init()
     start()
-    HWSONAR = Sonar.Sonar()
+    HWSONAR = Sonar.Sonar().start()
     camera = Camera.Camera()
     camera.camera_open(correction=True) # 开启畸变矫正,默认不开启
     signal.signal(signal.SIGINT, manual_stop)
+    seq = -1
     while __isRunning:
-        img = camera.frame
-        if img is not None:
-            frame = img.copy() # 复制图像
+        ret = camera.wait_next(seq, 0.1) # 等待新的一帧, 同一帧不会处理两次
+        if ret is not None:
+            seq, timestamp, img = ret
+            frame = img.copy() # run()会在画面上画图, 需要可写的拷贝
             Frame = run(frame)  
             frame_resize = cv2.resize(Frame, (320, 240)) # 画面缩放到320*240
             cv2.imshow('frame', frame_resize)
             key = cv2.waitKey(1)
             if key == 27:
                 break
-        else:
-            time.sleep(0.01)
+    ok, (avg, p95, worst) = getReactionTime()
+    print('reaction time avg %.1f ms  p95 %.1f ms  max %.1f ms  (%d turns)  overruns %d' % (
+        avg, p95, worst, len(reaction), loop_overruns))
     camera.camera_close()
     cv2.destroyAllWindows()
     
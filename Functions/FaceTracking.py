@@ -226,23 +226,24 @@ def manual_stop(signum, frame):
 
 if __name__ == '__main__':
     import HiwonderSDK.ros_robot_controller_sdk as rrc
-    board = rrc.Board()
+    board = rrc.acquire_board()
+    car.board = board
     init()
     start()
     camera = Camera.Camera()
     camera.camera_open(correction=True) # 开启畸变矫正,默认不开启
     signal.signal(signal.SIGINT, manual_stop)
+    seq = -1
     while __isRunning:
-        img = camera.frame
-        if img is not None:
-            frame = img.copy()
+        ret = camera.wait_next(seq, 0.1) # 等待新的一帧, 同一帧不会处理两次
+        if ret is not None:
+            seq, timestamp, img = ret
+            frame = img.copy() # run()会在画面上画图, 需要可写的拷贝
             Frame = run(frame)  
             frame_resize = cv2.resize(Frame, (320, 240)) # 画面缩放到320*240
             cv2.imshow('frame', frame_resize)
             key = cv2.waitKey(1)
             if key == 27:
                 break
-        else:
-            time.sleep(0.01)
     camera.camera_close()
     cv2.destroyAllWindows()
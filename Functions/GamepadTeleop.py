@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+# coding=utf8
+import sys
+sys.path.append('/home/pi/TurboPi/')
+import cv2
+import time
+import signal
+import threading
+import collections
+import HiwonderSDK.mecanum as mecanum
+import HiwonderSDK.ros_robot_controller_sdk as rrc
+from HiwonderSDK.telemetry import latency_summary
+
+# 手柄/SBUS遥控直接驱动底盘
+# 扩展板上报的手柄和SBUS数据在机器人上直接转换成底盘速度, 不经过app和RPC
+# 控制循环固定频率运行, 收到新的遥控数据时提前处理, 摇杆带死区和指数曲线, 信号丢失或数据超时时停车
+# 左摇杆平移, 右摇杆左右旋转; SBUS: 通道1左右, 通道2前后, 通道4旋转
+
+if sys.version_info.major == 2:
+    print('Please run this program with python3!')
+    sys.exit(0)
+board = None
+car = mecanum.MecanumChassis()
+
+rate = 100           # 控制频率Hz
+source = 'auto'      # 'gamepad', 'sbus', 'auto'(使用最近有数据的一个)
+max_speed = 60       # 最大线速度(0~100)
+max_rate = 0.5       # 最大偏航角速度
+deadzone = 0.08      # 摇杆死区
+expo = 0.4           # 指数曲线系数, 0为线性, 1为三次曲线
+timeout = 0.2        # 超过这个时间没有新数据时停车(s)
+
+TextColor = (0, 255, 255)
+
+state = 'idle'       # 'idle', 'gamepad', 'sbus', 'failsafe'
+command = (0, 90, 0)
+latency = collections.deque(maxlen=200)  # 摇杆数据到达到发出电机命令的时间(ms)
+loop_overruns = 0
+new_input = threading.Event()  # 收到新的手柄/SBUS数据
+subscribed = None  # 已订阅上报数据的board
+__isRunning = False
+
+# 变量重置
+def reset():
+    global state
+    global command
+    global loop_overruns
+    global __isRunning
+
+    state = 'idle'
+    command = (0, 90, 0)
+    latency.clear()
+    loop_overruns = 0
+    __isRunning = False
+
+# app初始化调用
+def init():
+    global subscribed
+    print("GamepadTeleop Init")
+    reset()
+    if subscribed is not board:
+        board.subscribe('gamepad', on_input)
+        board.subscribe('sbus', on_input)
+        subscribed = board
+    car.set_velocity(0,90,0)
+
+# app开始玩法调用
+def start():
+    global __isRunning
+    __isRunning = True
+    print("GamepadTeleop Start")
+
+# app停止玩法调用
+def stop():
+    global __isRunning
+    __isRunning = False
+    car.set_velocity(0,90,0)
+    print("GamepadTeleop Stop")
+
+# app退出玩法调用
+def exit():
+    global __isRunning
+    __isRunning = False
+    car.set_velocity(0,90,0)
+    print("GamepadTeleop Exit")
+
+# 设置最大速度
+def setSpeed(args):
+    global max_speed
+    max_speed = int(args[0])
+    return (True, ())
+
+# 设置遥控数据来源
+def setSource(args):
+    global source
+    if args[0] not in ('gamepad', 'sbus', 'auto'):
+        return (False, 'setSource: Invalid argument')
+    source = args[0]
+    return (True, (source,))
+
+# 获取摇杆到电机命令的延时 平均值, p95, 最大值(ms)
+def getLatency(args=()):
+    return (True, latency_summary(latency))
+
+def on_input(data):
+    new_input.set()
+
+# 死区和指数曲线
+def shape(x):
+    if abs(x) < deadzone:
+        return 0.0
+    sign = 1 if x > 0 else -1
+    x = (abs(x) - deadzone) / (1 - deadzone)
+    return sign * ((1 - expo) * x + expo * x ** 3)
+
+# 读取最新的遥控数据, 返回 (来源, 到达时间, 左右, 前后, 旋转), 范围-1~1, 没有有效数据时返回None
+def read_sticks(now):
+    gamepad = board.gamepad_data.latest() if source != 'sbus' else None
+    sbus = board.sbus_data.latest() if source != 'gamepad' else None
+    if gamepad is not None and now - gamepad[0] > timeout:
+        gamepad = None
+    if sbus is not None and (now - sbus[0] > timeout or sbus[19] or sbus[20]):  # signal_loss, fail_safe
+        sbus = None
+    if sbus is not None and (gamepad is None or sbus[0] >= gamepad[0]):
+        channels = rrc.decode_sbus([int(i) for i in sbus[1:]])
+        return 'sbus', sbus[0], channels[0] * 2 - 1, channels[1] * 2 - 1, channels[3] * 2 - 1
+    if gamepad is not None:
+        axes, buttons = rrc.decode_gamepad([int(i) for i in gamepad[1:]])
+        # axes的左和上为正
+        return 'gamepad', gamepad[0], -axes[0], axes[1], -axes[2]
+    return None
+
+# 固定频率的控制循环
+def teleop():
+    global state
+    global command
+    global loop_overruns
+
+    period = 1.0 / rate
+    next_time = time.monotonic()
+    while True:
+        if not __isRunning or board is None:
+            if state != 'idle':
+                state = 'idle'
+                command = (0, 90, 0)
+                car.set_velocity(0,90,0)
+            time.sleep(0.03)
+            next_time = time.monotonic()
+            continue
+
+        now = time.monotonic()
+        sticks = read_sticks(now)
+        if sticks is None:
+            state = 'failsafe'
+            new_command = (0, 90, 0)  # 信号丢失或超时, 停车
+        else:
+            state, arrived, x, y, turn = sticks
+            velocity, direction = car.translation(shape(x) * max_speed, shape(y) * max_speed, fake=True)
+            new_command = (velocity, direction, shape(turn) * max_rate)
+        if new_command != command:  # 同样的命令只发一次
+            command = new_command
+            car.set_velocity(*command)
+            if sticks is not None:
+                latency.append(float(time.monotonic() - arrived) * 1000)
+
+        # 等到下一个周期或者收到新数据
+        delay = next_time + period - time.monotonic()
+        if delay > 0:
+            if new_input.wait(delay):
+                new_input.clear()
+                next_time = time.monotonic()
+            else:
+                next_time += period
+        else:  # 超时的周期不补发
+            loop_overruns += 1
+            next_time = time.monotonic()
+
+# 运行子线程
+th = threading.Thread(target=teleop)
+th.daemon = True
+th.start()
+
+# 在画面上显示遥控状态
+def run(img):
+    ok, (avg, p95, worst) = getLatency()
+    text = "%s v:%.0f r:%.2f lat:%.1f/%.1fms" % (state, command[0], command[2], avg, p95)
+    return cv2.putText(img, text, (30, 480-30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, TextColor, 2)
+
+#关闭前处理
+def manual_stop(signum, frame):
+    global __isRunning
+
+    print('关闭中...')
+    __isRunning = False
+
+if __name__ == '__main__':
+    board = rrc.acquire_board()
+    car.board = board
+
+    init()
+    start()
+    signal.signal(signal.SIGINT, manual_stop)
+    while __isRunning:
+        time.sleep(1)
+        ok, (avg, p95, worst) = getLatency()
+        print('%-8s command %s  latency avg %.2f ms  p95 %.2f ms  max %.2f ms  overruns %d' % (
+            state, tuple(round(i, 2) for i in command), avg, p95, worst, loop_overruns))
+    car.set_velocity(0,90,0)
+    time.sleep(0.1)
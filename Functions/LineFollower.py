@@ -15,6 +15,7 @@ import HiwonderSDK.FourInfrared as infrared
 
 # 红绿灯行驶
 # 颜色识别
+# 巡线传感器在后台线程中读取, 状态变化时唤醒控制线程, 同样的电机和彩灯命令只发一次
 board = None
 if sys.version_info.major == 2:
     print('Please run this program with python3!')
@@ -22,6 +23,11 @@ if sys.version_info.major == 2:
 
 car = mecanum.MecanumChassis()
 line = infrared.FourInfrared()
+line_rate = 500  # 巡线传感器读取频率Hz
+line_changed = threading.Event()  # 巡线传感器状态变化
+line.subscribe(lambda data, timestamp: line_changed.set())
+command = None  # 最近一次发送的底盘命令
+move_cpu = 0.0  # 控制线程开始玩法后的CPU占用(%)
 
 servo1 = 1500
 servo2 = 1500
@@ -62,8 +68,10 @@ def reset():
     global detect_color
     global start_pick_up
     global servo1, servo2
+    global command
     
     car_stop = False
+    command = None
     color_list = []
     detect_color = 'None'
     servo1 = servo_data['servo1']
@@ -80,8 +88,9 @@ def init():
 def start():
     global __isRunning
     reset()
+    line.start(line_rate)
     __isRunning = True
-    car.set_velocity(35,90,0)
+    set_velocity(35,90,0)
     print("LineFollower Start")
 
 # app停止玩法调用
@@ -90,6 +99,7 @@ def stop():
     global __isRunning
     car_stop = True
     __isRunning = False
+    line.stop()
     set_rgb('None')
     print("LineFollower Stop")
 
@@ -99,6 +109,7 @@ def exit():
     global __isRunning
     car_stop = True
     __isRunning = False
+    line.stop()
     set_rgb('None')
     print("LineFollower Exit")
 
@@ -120,6 +131,17 @@ def set_rgb(color):
     else:
         board.set_rgb([[1, 0, 0, 0], [2, 0, 0, 0]])
 
+# 同样的底盘命令只发一次
+def set_velocity(velocity, direction, angular):
+    global command
+    if command != (velocity, direction, angular):
+        command = (velocity, direction, angular)
+        car.set_velocity(velocity, direction, angular)
+
+# 获取I2C总线线程和控制线程的CPU占用(%)
+def getCpuUsage(args=()):
+    return (True, (line.stats()['cpu_percent'], move_cpu))
+
 # 找出面积最大的轮廓
 # 参数为要比较的轮廓的列表
 def getAreaMaxContour(contours):
@@ -139,60 +161,75 @@ def getAreaMaxContour(contours):
 
 def move():
     global car_stop
+    global move_cpu
     global __isRunning
     global detect_color    
 
+    rgb_color = None
+    cpu_start = None
     while True:
         if __isRunning:
+            if cpu_start is None:
+                cpu_start = (time.monotonic(), time.thread_time())
+            # 传感器状态变化时立即处理, 否则每20ms检查一次颜色识别结果
+            line_changed.wait(0.02)
+            line_changed.clear()
+            if not __isRunning:
+                continue
             if detect_color != 'red':
-                set_rgb(detect_color) # 设置扩展板上的彩灯与检测到的颜色一样
+                if rgb_color != detect_color:
+                    rgb_color = detect_color
+                    set_rgb(detect_color) # 设置扩展板上的彩灯与检测到的颜色一样
                 sensor_data = line.readData() # 读取4路循传感器数据
                 # 2，3号传感器检测到黑线
                 if not sensor_data[0] and sensor_data[1] and sensor_data[2] and not sensor_data[3]:
-                    car.set_velocity(35,90,0) # 机器人向前移动,线速度35(0~100)，方向角90(0~360)，偏航角速度0(-2~2)
+                    set_velocity(35,90,0) # 机器人向前移动,线速度35(0~100)，方向角90(0~360)，偏航角速度0(-2~2)
                     car_stop = True
                 # 3号传感器检测到黑线
                 elif not sensor_data[0] and not sensor_data[1] and sensor_data[2] and not sensor_data[3]:
-                    car.set_velocity(35,90,0.03) # 机器人小右转
+                    set_velocity(35,90,0.03) # 机器人小右转
                     car_stop = True
                 # 2号传感器检测到黑线
                 elif not sensor_data[0] and  sensor_data[1] and not sensor_data[2] and not sensor_data[3]:
-                    car.set_velocity(35,90,-0.03) # 机器人小左转
+                    set_velocity(35,90,-0.03) # 机器人小左转
                     car_stop = True
                 # 4号传感器检测到黑线
                 elif not sensor_data[0] and not sensor_data[1] and not sensor_data[2] and sensor_data[3]:
-                    car.set_velocity(35,90,0.3) # 机器人大右转
+                    set_velocity(35,90,0.3) # 机器人大右转
                     car_stop = True
                 # 1号传感器检测到黑线
                 elif sensor_data[0] and not sensor_data[1] and not sensor_data[2] and not sensor_data[3]:
-                    car.set_velocity(35,90,-0.3) # 机器人大左转
+                    set_velocity(35,90,-0.3) # 机器人大左转
                     car_stop = True
                 
                 # 所有传感器检测到黑线,检测到横线，或者机器人被拿起了
                 elif sensor_data[0] and sensor_data[1] and sensor_data[2] and sensor_data[3]:
                     if car_stop:
-                        car.set_velocity(0,90,0) # 机器人停止移动
+                        set_velocity(0,90,0) # 机器人停止移动
                         car_stop = False
-                    time.sleep(0.01)
                     
                 if detect_color == 'green': # 检测到绿色
                     if not car_stop:
-                        car.set_velocity(35,90,0) # 机器人向前移动
+                        set_velocity(35,90,0) # 机器人向前移动
                         car_stop = True
 
             else:  # 检测到红色
                 if car_stop:
                     board.set_buzzer(1900, 0.1, 0.9, 1)# 设置蜂鸣器响0.1秒
+                    rgb_color = detect_color
                     set_rgb(detect_color) # 设置扩展板上的彩灯与检测到的颜色一样
-                    car.set_velocity(0,90,0) # 机器人停止移动
+                    set_velocity(0,90,0) # 机器人停止移动
                     car_stop = False
-                time.sleep(0.01)
                     
         else:
             if car_stop:
-                car.set_velocity(0,90,0) # 机器人停止移动
+                set_velocity(0,90,0) # 机器人停止移动
                 car_stop = False
+            rgb_color = None
+            cpu_start = None
             time.sleep(0.01)
+        if cpu_start is not None and time.monotonic() > cpu_start[0]:
+            move_cpu = (time.thread_time() - cpu_start[1]) / (time.monotonic() - cpu_start[0]) * 100
 
 # 运行子线程
 th = threading.Thread(target=move)
@@ -281,24 +318,27 @@ def manualcar_stop(signum, frame):
 
 if __name__ == '__main__':
     import HiwonderSDK.ros_robot_controller_sdk as rrc
-    board = rrc.Board()
+    board = rrc.acquire_board()
+    car.board = board
     init()
     start()
     camera = Camera.Camera()
     camera.camera_open(correction=True) # 开启畸变矫正,默认不开启
     signal.signal(signal.SIGINT, manualcar_stop)
+    seq = -1
     while __isRunning:
-        img = camera.frame
-        if img is not None:
-            frame = img.copy()
+        ret = camera.wait_next(seq, 0.1) # 等待新的一帧, 同一帧不会处理两次
+        if ret is not None:
+            seq, timestamp, img = ret
+            frame = img.copy() # run()会在画面上画图, 需要可写的拷贝
             Frame = run(frame)  
             frame_resize = cv2.resize(Frame, (320, 240))
             cv2.imshow('frame', frame_resize)
             key = cv2.waitKey(1)
             if key == 27:
                 break
-        else:
-            time.sleep(0.01)
+    ok, (line_cpu, control_cpu) = getCpuUsage()
+    print('CPU: I2C bus thread %.1f%%  control thread %.1f%%' % (line_cpu, control_cpu), line.stats())
     camera.camera_close()
     cv2.destroyAllWindows()
 
@@ -10,6 +10,7 @@ import Functions.ColorTracking as ColorTracking
 import Functions.VisualPatrol as VisualPatrol
 import Functions.QuickMark as QuickMark
 import Functions.Avoidance as Avoidance
+import Functions.GamepadTeleop as GamepadTeleop
 
 RunningFunc = 0
 LastHeartbeat = 0
@@ -23,7 +24,7 @@ FUNCTIONS = {
     4: VisualPatrol,     # 视觉巡线
     5: QuickMark,        # 二维码识别
     6: Avoidance,        # 智能避障
-    7: None, 
+    7: GamepadTeleop,    # 手柄/SBUS遥控
     8: None,
     9: lab_adjust        # lab校准 
 }
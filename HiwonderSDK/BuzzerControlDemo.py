@@ -13,9 +13,10 @@ Tips:
  * 按下Ctrl+C可关闭此次程序运行，若失败请多次尝试！
 ----------------------------------------------------------
 ''')
-board = rrc.Board()
+board = rrc.acquire_board()  # 共享的扩展板连接, 结束时release()
 board.set_buzzer(1900, 0.1, 0.9, 1) # 以1900Hz的频率，持续响0.1秒，关闭0.9秒，重复1次
 time.sleep(2)
 board.set_buzzer(1000, 0.5, 0.5, 0) # 以1000Hz的频率，持续响0.5秒，关闭0.5秒，一直重复
 time.sleep(3)
 board.set_buzzer(1000, 0.0, 0.0, 1) # 关闭
+board.release()
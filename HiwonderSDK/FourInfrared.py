@@ -1,27 +1,100 @@
 #!/usr/bin/python3
 # coding=utf8
+import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
 import time
-import smbus
+from HiwonderSDK.telemetry import TelemetryRing
+from HiwonderSDK.i2c_bus import acquire_bus
 
 #四路巡线传感器使用例程
+# 读取通过I2C总线管理器(i2c_bus.py)在总线线程中执行, 和超声波共用总线不会交错
+# start(rate)之后由总线线程按固定频率读取, 保存最新的4位原始数据和时间戳,
+# 只在数据变化时调用订阅的回调并记录到环形缓冲区, readData()直接返回最新数据, 不访问总线
+
+# 4位原始数据对应的各传感器状态, True表示识别到黑线, 返回给调用者时转换成新的列表
+patterns = [tuple(value & bit > 0 for bit in (0x01, 0x02, 0x04, 0x08)) for value in range(16)]
 
 class FourInfrared:
 
-    def __init__(self, address=0x78, bus=1):
+    def __init__(self, address=0x78, bus=1, i2c=None):
         self.address = address
-        self.bus = smbus.SMBus(bus)
+        self.bus = acquire_bus(bus) if i2c is None else i2c
+        self.value = None       # 最新的4位原始数据
+        self.timestamp = None   # 最新数据的读取时间
+        self.changes = TelemetryRing(1, 256)  # 每次变化的 时间戳, 原始数据
+        self.subscribers = []
+        self.rate = 0
+        self.running = False
+
+    def read_bus(self, bus, register=0x01):
+        # 在总线线程中执行
+        return bus.read_byte_data(self.address, register) & 0x0F
+
+    def readRaw(self, register=0x01):
+        return self.bus.call(lambda bus: self.read_bus(bus, register))
 
     def readData(self, register=0x01):
-        value = self.bus.read_byte_data(self.address, register)
-        return [True if value & v > 0 else False for v in [0x01, 0x02, 0x04, 0x08]]
-              
+        # 后台读取运行时返回最新数据, 否则直接读取
+        if self.running and self.value is not None:
+            return list(patterns[self.value])
+        return list(patterns[self.readRaw(register)])
+
+    def subscribe(self, callback):
+        # 传感器状态变化时在总线线程中调用callback(data, timestamp), data和readData()相同
+        # 回调需要尽快返回, 否则会推迟下一次读取
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def start(self, rate=500):
+        # 开启后台读取, rate为每秒读取次数
+        self.rate = rate
+        self.bus.add_read('infrared', rate, self.read_bus, self.on_value)
+        self.running = True
+        return self
+
+    def stop(self):
+        self.running = False
+        self.bus.remove_read('infrared')
+        self.value = None
+
+    def on_value(self, value, timestamp):
+        # 在总线线程中调用
+        self.timestamp = timestamp
+        if value != self.value:
+            self.value = value
+            self.changes.append(timestamp, (value, ))
+            for callback in list(self.subscribers):
+                try:
+                    callback(list(patterns[value]), timestamp)
+                except Exception as e:
+                    print('infrared callback error:', e)
+
+    def stats(self):
+        # cpu_percent为整个I2C总线线程的CPU占用
+        stats = self.bus.stats()
+        read = stats['reads'].get('infrared', {'samples': 0, 'errors': 0, 'overruns': 0})
+        return {
+            'rate': self.rate,
+            'samples': read['samples'],
+            'changes': self.changes.count,
+            'errors': read['errors'],
+            'overruns': read['overruns'],
+            'cpu_percent': stats['cpu_percent']
+        }
 
 if __name__ == "__main__":
     line = FourInfrared()
+    line.subscribe(lambda data, timestamp: print("%.3f" % timestamp, "Sensor1:", data[0], " Sensor2:", data[1], " Sensor3:", data[2], " Sensor4:", data[3]))
+    line.start()
     while True:
-        data = line.readData()
         #True表示识别到黑线，False表示没有识别到黑线
-        print("Sensor1:", data[0], " Sensor2:", data[1], " Sensor3:", data[2], " Sensor4:", data[3])
-        time.sleep(0.5)
-
-
+        time.sleep(5)
+        print(line.stats())
@@ -22,7 +22,7 @@ Tips:
  * 按下Ctrl+C可关闭此次程序运行，若失败请多次尝试！
 ----------------------------------------------------------
 ''')
-board = rrc.Board()
+board = rrc.acquire_board()  # 共享的扩展板连接, 结束时release()
 
 start = True
 #关闭前处理
@@ -47,6 +47,7 @@ if __name__ == '__main__':
             board.set_motor_duty([[1, 0], [2, 0], [3, 0], [4, 0]])  # 关闭所有电机
             print('已关闭')
             break
+    board.release()
     
     
         
@@ -24,7 +24,7 @@ Tips:
 ----------------------------------------------------------
 ''')
 
-board = rrc.Board()
+board = rrc.acquire_board()  # 共享的扩展板连接, 结束时release()
 start = True
 #关闭前处理
 def Stop(signum, frame):
@@ -51,6 +51,7 @@ if __name__ == '__main__':
             time.sleep(1)
             print('已关闭')
             break
+    board.release()
     
     
         
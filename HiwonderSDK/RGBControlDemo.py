@@ -22,7 +22,7 @@ def Stop(signum, frame):
 
     start = False
     print('关闭中...')
-board = rrc.Board()
+board = rrc.acquire_board()  # 共享的扩展板连接, 结束时release()
 #先将所有灯关闭
 board.set_rgb([[1, 0, 0, 0], [2, 0, 0, 0]])
 signal.signal(signal.SIGINT, Stop)
@@ -49,3 +49,4 @@ while True:
         board.set_rgb([[1, 0, 0, 0], [2, 0, 0, 0]])
         print('已关闭')
         break
+board.release()
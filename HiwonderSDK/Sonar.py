@@ -1,8 +1,23 @@
 import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
 import time
-from smbus2 import SMBus, i2c_msg
+from HiwonderSDK.telemetry import TelemetryRing
+from HiwonderSDK.stream_filter import StreamFilter
+from HiwonderSDK.i2c_bus import acquire_bus
+try:
+    from smbus2 import i2c_msg
+except ImportError:  # 没有smbus2时只能使用模拟的总线(见i2c_bus.py的自检)
+    i2c_msg = None
 
 # 幻尔科技iic超声波库
+# 所有读写通过I2C总线管理器(i2c_bus.py)在总线线程中执行, 和巡线传感器共用总线不会交错, 写入不等待
+# start()之后由总线线程按固定频率测距, 结果带时间戳存入环形缓冲区,
+# getDistance()/getFilteredDistance()直接返回最近的结果, 不访问总线
 
 if sys.version_info.major == 2:
     print('Please run this program with python3!')
@@ -26,11 +41,16 @@ class Sonar:
     __RGB2_R_BREATHING_CYCLE = 12
     __RGB2_G_BREATHING_CYCLE = 13
     __RGB2_B_BREATHING_CYCLE = 14
-    def __init__(self):
+    def __init__(self, filter_size=5, filter_mode='median', i2c=None):
         self.i2c_addr = 0x77
         self.i2c = 1
+        self.i2c_bus = acquire_bus(self.i2c) if i2c is None else i2c
         self.Pixels = [0,0]
         self.RGBMode = 0
+        self.filter = StreamFilter(filter_size, filter_mode)  # 只在总线线程中更新
+        self.distance_data = TelemetryRing(2, 256)  # 时间戳, 原始距离(mm), 滤波后的距离(mm)
+        self.rate = 0
+        self.running = False
 
     def __getattr(self, attr):
         if attr in self.__units:
@@ -40,10 +60,23 @@ class Sonar:
         else:
             raise AttributeError('Unknow attribute : %s'%attr)
 
+    def write(self, reg, data):
+        # 放入总线队列, 不等待写入完成
+        data = list(data)
+        future = self.i2c_bus.call(lambda bus: bus.write_i2c_block_data(self.i2c_addr, reg, data), wait=False)
+        future.add_done_callback(self.write_done)
+
+    def write_byte(self, reg, value):
+        future = self.i2c_bus.call(lambda bus: bus.write_byte_data(self.i2c_addr, reg, value), wait=False)
+        future.add_done_callback(self.write_done)
+
+    def write_done(self, future):
+        if future.exception() is not None:
+            print(future.exception())
+
     def setRGBMode(self, mode):
         try:
-            with SMBus(self.i2c) as bus:
-                bus.write_byte_data(self.i2c_addr, self.__RGB_MODE, mode)
+            self.write_byte(self.__RGB_MODE, mode)
         except BaseException as e:
             print(e)
 
@@ -59,11 +92,18 @@ class Sonar:
             if index != 0 and index != 1:
                 return 
             start_reg = 3 if index == 0 else 6
-            with SMBus(self.i2c) as bus:
-                bus.write_byte_data(self.i2c_addr, start_reg, 0xFF & (color >> 16))
-                bus.write_byte_data(self.i2c_addr, start_reg+1, 0xFF & (color >> 8))
-                bus.write_byte_data(self.i2c_addr, start_reg+2, 0xFF & color)
-                self.Pixels[index] = color
+            # R, G, B寄存器地址连续, 一次块写入
+            self.write(start_reg, (0xFF & (color >> 16), 0xFF & (color >> 8), 0xFF & color))
+            self.Pixels[index] = color
+        except BaseException as e:
+            print(e)
+
+    def setPixelColors(self, rgb1, rgb2):
+        # 两个灯的6个寄存器地址连续, 一次块写入
+        try:
+            self.write(self.__RGB1_R, [0xFF & i for i in (*rgb1, *rgb2)])
+            self.Pixels[0] = (rgb1[0] << 16) | (rgb1[1] << 8) | rgb1[2]
+            self.Pixels[1] = (rgb2[0] << 16) | (rgb2[1] << 8) | rgb2[2]
         except BaseException as e:
             print(e)
 
@@ -82,8 +122,7 @@ class Sonar:
                 return
             start_reg = 9 if index == 0 else 12
             cycle = int(cycle / 100)
-            with SMBus(self.i2c) as bus:
-                bus.write_byte_data(self.i2c_addr, start_reg + rgb, cycle)
+            self.write_byte(start_reg + rgb, cycle)
         except BaseException as e:
             print(e)
 
@@ -96,21 +135,62 @@ class Sonar:
         self.setBreathCycle(2,1, 2000)
         self.setBreathCycle(2,2, 3400)
 
+    def read_bus(self, bus):
+        # 在总线线程中执行, 单位mm
+        # 和原来相同, 先写寄存器地址, 再单独读2字节, 是两次独立的事务(超声波模块不一定支持重复起始条件),
+        # 两次事务都在总线线程中连续执行, 中间不会插入其他设备的读写
+        bus.i2c_rdwr(i2c_msg.write(self.i2c_addr, [self.__dist_reg]))
+        read = i2c_msg.read(self.i2c_addr, 2)
+        bus.i2c_rdwr(read)
+        dist = int.from_bytes(bytes(list(read)), byteorder='little', signed=False)
+        return min(dist, 5000)
+
+    def read_distance(self):
+        return self.i2c_bus.call(self.read_bus)
+
     def getDistance(self):
+        # 后台测距运行时返回最近一次的原始距离, 否则直接读取
+        if self.running:
+            sample = self.distance_data.latest()
+            return 99999 if sample is None else int(sample[1])
         dist = 99999
         try:
-            with SMBus(self.i2c) as bus:
-                msg = i2c_msg.write(self.i2c_addr, [0,])
-                bus.i2c_rdwr(msg)
-                read = i2c_msg.read(self.i2c_addr, 2)
-                bus.i2c_rdwr(read)
-                dist = int.from_bytes(bytes(list(read)), byteorder='little', signed=False)
-                if dist > 5000:
-                    dist = 5000
+            dist = self.read_distance()
         except BaseException as e:
             print(e)
         return dist
 
+    def getFilteredDistance(self):
+        # 滤波后的距离(mm), 默认为最近filter_size个样本的中值, 需要先start(), 没有数据时返回None
+        sample = self.distance_data.latest()
+        return None if sample is None else float(sample[2])
+
+    def on_distance(self, dist, timestamp):
+        self.distance_data.append(timestamp, (dist, self.filter.update(dist)))
+
+    def start(self, rate=20):
+        # 开启后台测距, rate为每秒测距次数
+        self.rate = rate
+        self.i2c_bus.add_read('sonar', rate, self.read_bus, self.on_distance)
+        self.running = True
+        return self
+
+    def stop(self):
+        self.running = False
+        self.i2c_bus.remove_read('sonar')
+
+    def stats(self):
+        stats = self.i2c_bus.stats()['reads'].get('sonar', {'samples': 0, 'errors': 0, 'overruns': 0})
+        return {
+            'rate': self.rate,
+            'samples': stats['samples'],
+            'errors': stats['errors'],
+            'overruns': stats['overruns']
+        }
+
+    def close(self):
+        self.stop()
+
 if __name__ == '__main__':
     s = Sonar()
     s.setRGBMode(0)
@@ -131,7 +211,8 @@ if __name__ == '__main__':
     s.show()
     time.sleep(1)
     s.startSymphony()
+    s.start()
     while True:
         time.sleep(0.1)
-        print(s.getDistance())
+        print(s.getDistance(), s.getFilteredDistance())
 
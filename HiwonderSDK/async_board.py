@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# stm32 python sdk, asyncio版本
+import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import struct
+import serial
+import asyncio
+import HiwonderSDK.ros_robot_controller_sdk as rrc
+
+class AsyncBoard:
+    # 在asyncio事件循环中运行的扩展板接口, 不创建接收线程
+    # 串口文件描述符设置为非阻塞, 由事件循环通知可读/可写;
+    # 命令都是协程, 上报数据通过async for读取, 总线舵机配置后的等待使用asyncio.sleep
+    #
+    # async with AsyncBoard() as board:
+    #     await board.set_motor_duty([[1, 30]])
+    #     async for ax, ay, az, gx, gy, gz in board.imu_stream():
+    #         ...
+    bus_servo_read_fields = rrc.Board.bus_servo_read_fields
+    pwm_servo_read_fields = rrc.Board.pwm_servo_read_fields
+
+    def __init__(self, device="/dev/ttyAMA0", baudrate=1000000, read_timeout=0.1, read_retries=2, stream_size=16):
+        self.device = device
+        self.baudrate = baudrate
+        self.read_timeout = read_timeout
+        self.read_retries = read_retries
+        self.stream_size = stream_size
+
+        self.port = None
+        self.fd = None
+        self.loop = None
+        self.tx_buf = bytearray()
+        self.tx_drained = None
+        self.encoder = rrc.PacketEncoder()
+        self.pending = {}  # (功能码, 子命令, 舵机ID) -> [future, ...]
+        self.streams = {
+            'battery': set(),
+            'key': set(),
+            'imu': set(),
+            'gamepad': set(),
+            'sbus': set()
+        }
+        self.parser = rrc.PacketParser({
+            rrc.PacketFunction.PACKET_FUNC_SYS: self.packet_report_sys,
+            rrc.PacketFunction.PACKET_FUNC_KEY: self.packet_report_key,
+            rrc.PacketFunction.PACKET_FUNC_IMU: self.packet_report_imu,
+            rrc.PacketFunction.PACKET_FUNC_GAMEPAD: self.packet_report_gamepad,
+            rrc.PacketFunction.PACKET_FUNC_BUS_SERVO: self.packet_report_serial_servo,
+            rrc.PacketFunction.PACKET_FUNC_SBUS: self.packet_report_sbus,
+            rrc.PacketFunction.PACKET_FUNC_PWM_SERVO: self.packet_report_pwm_servo
+        })
+
+    async def open(self):
+        self.loop = asyncio.get_running_loop()
+        self.port = serial.Serial(None, self.baudrate, timeout=0)
+        self.port.rts = False
+        self.port.dtr = False
+        self.port.setPort(self.device)
+        self.port.open()
+        self.fd = self.port.fileno()
+        os.set_blocking(self.fd, False)
+        self.loop.add_reader(self.fd, self.on_readable)
+        return self
+
+    async def close(self):
+        if self.fd is not None:
+            await self.drain()
+            self.loop.remove_reader(self.fd)
+            self.port.close()
+            self.fd = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def on_readable(self):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        if data:
+            self.parser.feed(data)
+
+    def write(self, data):
+        # 先尝试直接写入, 写不完的部分放进发送缓冲区等待可写通知, 保证数据包顺序
+        if not self.tx_buf:
+            try:
+                n = os.write(self.fd, data)
+            except BlockingIOError:
+                n = 0
+            if n == len(data):
+                return
+            data = data[n:]
+            self.loop.add_writer(self.fd, self.on_writable)
+            self.tx_drained = self.loop.create_future()
+        self.tx_buf += data
+
+    def on_writable(self):
+        try:
+            n = os.write(self.fd, self.tx_buf)
+        except BlockingIOError:
+            return
+        del self.tx_buf[:n]
+        if not self.tx_buf:
+            self.loop.remove_writer(self.fd)
+            self.tx_drained.set_result(None)
+
+    async def drain(self):
+        if self.tx_buf:
+            await asyncio.shield(self.tx_drained)
+
+    async def send(self, encode, *args):
+        # 编码结果是编码器缓冲区的视图, write在返回前已经写出或拷贝
+        self.write(encode(*args))
+        await self.drain()
+
+    def publish(self, kind, value, stamp):
+        # 队列中保存(接收时间ns, 数据)
+        for queue in self.streams[kind]:
+            if queue.full():  # 读取太慢时丢弃最旧的数据
+                queue.get_nowait()
+            queue.put_nowait((stamp, value))
+
+    def packet_report_sys(self, data, stamp=None):
+        battery = rrc.unpack_battery(data)
+        if battery is not None:
+            self.publish('battery', battery, stamp)
+
+    def packet_report_key(self, data, stamp=None):
+        key = rrc.unpack_key(data)
+        if key is not None:
+            self.publish('key', key, stamp)
+
+    def packet_report_imu(self, data, stamp=None):
+        self.publish('imu', rrc.unpack_imu(data), stamp)
+
+    def packet_report_gamepad(self, data, stamp=None):
+        self.publish('gamepad', rrc.unpack_gamepad(data), stamp)
+
+    def packet_report_sbus(self, data, stamp=None):
+        self.publish('sbus', rrc.unpack_sbus(data), stamp)
+
+    def resolve(self, key, data):
+        futures = self.pending.get(key)
+        if not futures:  # 读取ID时请求使用广播ID 254
+            futures = self.pending.get((key[0], key[1], 254))
+        while futures:
+            future = futures.pop(0)
+            if not future.done():
+                future.set_result(data)
+                break
+
+    def packet_report_serial_servo(self, data, stamp=None):
+        if len(data) >= 2:
+            self.resolve((rrc.PacketEncoder.FUNC_BUS_SERVO, data[1], data[0]), data)
+
+    def packet_report_pwm_servo(self, data, stamp=None):
+        if len(data) >= 2:
+            self.resolve((rrc.PacketEncoder.FUNC_PWM_SERVO, data[1], data[0]), data)
+
+    # with_stamp=True时得到(接收时间, 数据), 接收时间和Board相同, 为数据包校验通过时的time.monotonic_ns()
+    async def stream(self, kind, size=None, with_stamp=False):
+        queue = asyncio.Queue(self.stream_size if size is None else size)
+        self.streams[kind].add(queue)
+        try:
+            while True:
+                stamp, value = await queue.get()
+                yield (stamp, value) if with_stamp else value
+        finally:
+            self.streams[kind].discard(queue)
+
+    def battery_stream(self, size=None, with_stamp=False):
+        return self.stream('battery', size, with_stamp)
+
+    def key_stream(self, size=None, with_stamp=False):
+        return self.stream('key', size, with_stamp)
+
+    def imu_stream(self, size=None, with_stamp=False):
+        return self.stream('imu', size, with_stamp)
+
+    def gamepad_stream(self, size=None, with_stamp=False):
+        return self.stream('gamepad', size, with_stamp)
+
+    def sbus_stream(self, size=None, with_stamp=False):
+        return self.stream('sbus', size, with_stamp)
+
+    async def set_led(self, on_time, off_time, repeat=1, led_id=1):
+        await self.send(self.encoder.led, led_id, int(on_time*1000), int(off_time*1000), repeat)
+
+    async def set_buzzer(self, freq, on_time, off_time, repeat=1):
+        await self.send(self.encoder.buzzer, freq, int(on_time*1000), int(off_time*1000), repeat)
+
+    async def set_motor_speed(self, speeds):
+        await self.send(self.encoder.motor_speed, speeds)
+
+    async def set_motor_duty(self, dutys):
+        await self.send(self.encoder.motor_duty, dutys)
+
+    async def set_oled_text(self, line, text):
+        await self.send(self.encoder.oled_text, line, text)
+
+    async def set_rgb(self, pixels):
+        await self.send(self.encoder.rgb, pixels)
+
+    async def pwm_servo_set_position(self, duration, positions):
+        await self.send(self.encoder.pwm_servo_position, duration, positions)
+
+    async def pwm_servo_set_offset(self, servo_id, offset):
+        await self.send(self.encoder.encode, rrc.PacketEncoder.FUNC_PWM_SERVO, rrc.PacketEncoder.U8x2_I8, 0x07, servo_id, int(offset))
+
+    async def bus_servo_set_position(self, duration, positions):
+        await self.send(self.encoder.bus_servo_position, duration, positions)
+
+    async def bus_servo_stop(self, servo_id):
+        await self.send(self.encoder.bus_servo_stop, servo_id)
+
+    async def bus_servo_config(self, packer, *values):
+        # 总线舵机配置命令之间需要间隔20ms
+        await self.send(self.encoder.encode, rrc.PacketEncoder.FUNC_BUS_SERVO, packer, *values)
+        await asyncio.sleep(0.02)
+
+    async def bus_servo_enable_torque(self, servo_id, enable):
+        await self.bus_servo_config(rrc.PacketEncoder.U8x2, 0x0B if enable else 0x0C, servo_id)
+
+    async def bus_servo_set_id(self, servo_id_now, servo_id_new):
+        await self.bus_servo_config(rrc.PacketEncoder.U8x3, 0x10, servo_id_now, servo_id_new)
+
+    async def bus_servo_set_offset(self, servo_id, offset):
+        await self.bus_servo_config(rrc.PacketEncoder.U8x2_I8, 0x20, servo_id, int(offset))
+
+    async def bus_servo_save_offset(self, servo_id):
+        await self.bus_servo_config(rrc.PacketEncoder.U8x2, 0x24, servo_id)
+
+    async def bus_servo_set_angle_limit(self, servo_id, limit):
+        await self.bus_servo_config(rrc.PacketEncoder.U8x2_U16x2, 0x30, servo_id, int(limit[0]), int(limit[1]))
+
+    async def bus_servo_set_vin_limit(self, servo_id, limit):
+        await self.bus_servo_config(rrc.PacketEncoder.U8x2_U16x2, 0x34, servo_id, int(limit[0]), int(limit[1]))
+
+    async def bus_servo_set_temp_limit(self, servo_id, limit):
+        await self.bus_servo_config(rrc.PacketEncoder.U8x2_I8, 0x38, servo_id, int(limit))
+
+    async def servo_read(self, func, servo_id, cmd):
+        # 超时后重发, 重试次数用完返回None
+        key = (func, cmd, servo_id)
+        for _ in range(self.read_retries + 1):
+            future = self.loop.create_future()
+            self.pending.setdefault(key, []).append(future)
+            await self.send(self.encoder.encode, func, rrc.PacketEncoder.U8x2, cmd, servo_id)
+            try:
+                return await asyncio.wait_for(future, self.read_timeout)
+            except asyncio.TimeoutError:
+                futures = self.pending.get(key)
+                if futures and future in futures:
+                    futures.remove(future)
+
+    async def bus_servo_read(self, servo_id, field):
+        cmd, unpack = self.bus_servo_read_fields[field]
+        data = await self.servo_read(rrc.PacketEncoder.FUNC_BUS_SERVO, servo_id, cmd)
+        if data is not None:
+            servo_id, cmd, success, *info = struct.unpack(unpack, data)
+            if success == 0:
+                return info
+
+    async def pwm_servo_read(self, servo_id, field):
+        cmd, unpack = self.pwm_servo_read_fields[field]
+        data = await self.servo_read(rrc.PacketEncoder.FUNC_PWM_SERVO, servo_id, cmd)
+        if data is not None:
+            servo_id, cmd, info = struct.unpack(unpack, data)
+            return info
+
+    async def bus_servo_read_many(self, servo_ids, field):
+        servo_ids = list(servo_ids)
+        values = await asyncio.gather(*[self.bus_servo_read(i, field) for i in servo_ids])
+        return dict(zip(servo_ids, values))
+
+    async def pwm_servo_read_many(self, servo_ids, field):
+        servo_ids = list(servo_ids)
+        values = await asyncio.gather(*[self.pwm_servo_read(i, field) for i in servo_ids])
+        return dict(zip(servo_ids, values))
+
+async def main(device):
+    async with AsyncBoard(device) as board:
+        print("START...")
+        await board.set_motor_duty([[1, -50], [2, 50], [3, 50], [4, -50]])
+        await asyncio.sleep(0.5)
+        await board.set_motor_duty([[1, 0], [2, 0], [3, 0], [4, 0]])
+
+        async def print_battery():
+            async for battery in board.battery_stream():
+                print('battery:', battery)
+
+        async def print_imu():
+            async for imu in board.imu_stream(size=1):
+                print('imu:', imu)
+                await asyncio.sleep(0.5)
+
+        await asyncio.gather(print_battery(), print_imu())
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "/dev/ttyAMA0"))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+# coding=utf8
+import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import stat
+import time
+import serial
+import socket
+import argparse
+import functools
+import threading
+import collections
+import HiwonderSDK.ros_robot_controller_sdk as rrc
+
+# 扩展板代理守护进程, 让多个进程同时使用扩展板
+# 守护进程独占串口, 通过Unix域套接字转发数据, 套接字上使用和串口相同的0xAA 0x55数据包格式:
+# 串口收到的数据原样放入每个客户端的发送队列, 由各客户端的发送线程写入套接字, 客户端发来的数据包校验后写入串口
+# 读取太慢的客户端的队列满时丢弃最旧的数据(客户端的解析器会重新同步), 1秒内发送不出去的客户端被断开
+# 执行器(电机, 舵机, RGB, 蜂鸣器, LED, OLED)按功能码分配给最近控制它的客户端,
+# 其他客户端在lease秒内的控制命令会被丢弃, 舵机读取命令不受限制; 控制电机的客户端断开时停止电机
+#
+# python3 board_broker.py &
+# 之后rrc.acquire_board()会自动通过守护进程连接, 也可以直接使用BrokerBoard()
+
+SOCKET_PATH = '/tmp/turbopi_board.sock'
+
+ACTUATORS = {
+    rrc.PacketFunction.PACKET_FUNC_LED,
+    rrc.PacketFunction.PACKET_FUNC_BUZZER,
+    rrc.PacketFunction.PACKET_FUNC_MOTOR,
+    rrc.PacketFunction.PACKET_FUNC_PWM_SERVO,
+    rrc.PacketFunction.PACKET_FUNC_BUS_SERVO,
+    rrc.PacketFunction.PACKET_FUNC_OLED,
+    rrc.PacketFunction.PACKET_FUNC_RGB
+}
+
+# 不需要控制权的读取命令
+READ_COMMANDS = {
+    rrc.PacketFunction.PACKET_FUNC_BUS_SERVO: {cmd for cmd, unpack in rrc.Board.bus_servo_read_fields.values()},
+    rrc.PacketFunction.PACKET_FUNC_PWM_SERVO: {cmd for cmd, unpack in rrc.Board.pwm_servo_read_fields.values()}
+}
+
+def broker_running(path=SOCKET_PATH):
+    # 只检查套接字文件, 不建立连接; 守护进程异常退出留下的文件在连接时才能发现, 见acquire_board()
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+class BrokerClient:
+    def __init__(self, sock, number, queue_size=256):
+        self.sock = sock
+        self.name = 'client%d' % number
+        self.commands = 0
+        self.rejected = 0
+        self.cond = threading.Condition()
+        self.queue = collections.deque()  # 等待发送给客户端的串口数据块
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.closed = False
+
+    def push(self, data):
+        # 在串口接收线程中调用, 不阻塞
+        with self.cond:
+            if len(self.queue) >= self.queue_size:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append(data)
+            self.cond.notify()
+
+class BoardBroker:
+    def __init__(self, device="/dev/ttyAMA0", baudrate=1000000, path=SOCKET_PATH, lease=0.5):
+        self.path = path
+        self.lease = lease
+        self.port = serial.Serial(None, baudrate, timeout=1)
+        self.port.rts = False
+        self.port.dtr = False
+        self.port.setPort(device)
+        self.port.open()
+
+        self.encoder = rrc.PacketEncoder()  # 只在持有write_lock时使用
+        self.write_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.clients = set()
+        self.owners = {}  # 功能码 -> [客户端, 最后一次控制的时间]
+        self.count = 0
+        self.bytes_in = 0
+        self.commands = 0
+        self.rejected = 0
+
+        if os.path.exists(path):
+            os.remove(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(8)
+
+    def write(self, func, data):
+        with self.write_lock:
+            self.port.write(self.encoder.raw(int(func), data))
+
+    def recv_task(self):
+        # 串口数据不解析, 直接广播, 由客户端各自解析
+        while True:
+            data = self.port.read(self.port.in_waiting or 1)
+            if not data:
+                continue
+            self.bytes_in += len(data)
+            with self.lock:
+                clients = list(self.clients)
+            for client in clients:
+                client.push(data)
+
+    def send_task(self, client):
+        # 每个客户端一个发送线程, 一次发出队列中积累的全部数据
+        while True:
+            with client.cond:
+                while not client.queue and not client.closed:
+                    client.cond.wait()
+                if client.closed:
+                    return
+                data = b''.join(client.queue)
+                client.queue.clear()
+            try:
+                client.sock.sendall(data)
+            except OSError:  # 包括超时
+                break
+        self.disconnect(client)
+
+    def allowed(self, client, func, data):
+        if func not in ACTUATORS:
+            return True
+        if func in READ_COMMANDS and data and data[0] in READ_COMMANDS[func]:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            owner = self.owners.get(func)
+            if owner is None or owner[0] is client or now - owner[1] > self.lease:
+                if owner is not None and owner[0] is not client:
+                    print('%s takes %s from %s' % (client.name, func.name, owner[0].name))
+                self.owners[func] = [client, now]
+                return True
+            return False
+
+    def on_command(self, client, func, data, stamp):
+        if self.allowed(client, func, data):
+            self.write(func, data)
+            client.commands += 1
+            self.commands += 1
+        else:
+            client.rejected += 1
+            self.rejected += 1
+
+    def client_task(self, client):
+        parser = rrc.PacketParser({func: functools.partial(self.on_command, client, func)
+                                   for func in rrc.PacketFunction if func != rrc.PacketFunction.PACKET_FUNC_NONE})
+        while True:
+            try:
+                data = client.sock.recv(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not data:
+                break
+            parser.feed(data)
+        self.disconnect(client)
+
+    def disconnect(self, client):
+        with self.lock:
+            if client not in self.clients:
+                return
+            self.clients.discard(client)
+            owned = [func for func, owner in self.owners.items() if owner[0] is client]
+            for func in owned:
+                del self.owners[func]
+        with client.cond:
+            client.closed = True
+            client.cond.notify()
+        client.sock.close()
+        if rrc.PacketFunction.PACKET_FUNC_MOTOR in owned:  # 控制电机的程序退出时停止电机
+            with self.write_lock:
+                self.port.write(self.encoder.motor_duty([[1, 0], [2, 0], [3, 0], [4, 0]]))
+        print('%s disconnected, %d commands, %d rejected, %d chunks dropped' % (
+            client.name, client.commands, client.rejected, client.dropped))
+
+    def serve_forever(self):
+        threading.Thread(target=self.recv_task, daemon=True).start()
+        while True:
+            sock, _ = self.server.accept()
+            sock.settimeout(1)  # 客户端1秒内不读取时断开
+            self.count += 1
+            client = BrokerClient(sock, self.count)
+            with self.lock:
+                self.clients.add(client)
+            threading.Thread(target=self.client_task, args=(client, ), daemon=True).start()
+            threading.Thread(target=self.send_task, args=(client, ), daemon=True).start()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'clients': sorted(client.name for client in self.clients),
+                'dropped': {client.name: client.dropped for client in self.clients if client.dropped},
+                'owners': {func.name[12:].lower(): owner[0].name for func, owner in self.owners.items()},
+                'bytes_in': self.bytes_in,
+                'commands': self.commands,
+                'rejected': self.rejected
+            }
+
+    def close(self):
+        self.server.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.port.close()
+
+class SocketPort:
+    # 代替serial.Serial, 只实现Board用到的接口
+    in_waiting = 0
+
+    def __init__(self, path, timeout):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.cancelled = False
+        self.connected = True
+
+    def read(self, size=1):
+        data = self.sock.recv(max(size, 4096))
+        if not data and not self.cancelled:
+            if self.connected:
+                self.connected = False
+                print('board broker disconnected')
+            time.sleep(0.1)
+        return data
+
+    def write(self, data):
+        self.sock.sendall(data)
+        return len(data)
+
+    def cancel_read(self):
+        self.cancelled = True
+        self.sock.shutdown(socket.SHUT_RD)
+
+    def close(self):
+        self.sock.close()
+
+class BrokerBoard(rrc.Board):
+    # 通过代理守护进程连接的Board, 方法和Board完全相同
+    def __init__(self, path=SOCKET_PATH, **kwargs):
+        super().__init__(path, **kwargs)
+
+    def open_port(self, device, baudrate, timeout):
+        return SocketPort(device, timeout)
+
+if __name__ == '__main__':
+    arg = argparse.ArgumentParser(description='Share the expansion board between processes')
+    arg.add_argument('--device', default='/dev/ttyAMA0')
+    arg.add_argument('--baudrate', type=int, default=1000000)
+    arg.add_argument('--socket', default=SOCKET_PATH)
+    arg.add_argument('--lease', type=float, default=0.5, help='seconds an actuator stays with its last controller')
+    arg.add_argument('--status', type=float, default=0, help='print status every N seconds')
+    args = arg.parse_args()
+
+    broker = BoardBroker(args.device, args.baudrate, args.socket, args.lease)
+    print('board broker on %s' % args.socket, flush=True)
+    if args.status:
+        def status_task():
+            while True:
+                time.sleep(args.status)
+                print(broker.stats(), flush=True)
+        threading.Thread(target=status_task, daemon=True).start()
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+# coding=utf8
+import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import time
+import argparse
+import subprocess
+import HiwonderSDK.ros_robot_controller_sdk as rrc
+from HiwonderSDK.virtual_board import VirtualBoard
+from HiwonderSDK.board_broker import BrokerBoard, broker_running
+
+# 代理守护进程增加的延时: 对比直接连接和通过守护进程读取总线舵机位置的往返时间
+# 守护进程在单独的进程中运行, 使用虚拟扩展板, 不需要连接硬件
+
+def measure(board, count):
+    times = []
+    for _ in range(count):
+        t = time.perf_counter()
+        board.bus_servo_read_position(1)
+        times.append(time.perf_counter() - t)
+    times.sort()
+    return sum(times) / len(times) * 1000, times[len(times) // 2] * 1000, times[int(len(times) * 0.99) - 1] * 1000
+
+if __name__ == '__main__':
+    arg = argparse.ArgumentParser(description='Board broker latency benchmark')
+    arg.add_argument('--count', type=int, default=1000)
+    arg.add_argument('--socket', default='/tmp/turbopi_board_benchmark.sock')
+    args = arg.parse_args()
+
+    virtual = VirtualBoard(reply_delay=0, battery_rate=0).start()
+    results = {}
+
+    board = rrc.Board(device=virtual.device)
+    board.enable_reception()
+    results['direct'] = measure(board, args.count)
+    board.close()
+
+    broker = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'board_broker.py'),
+                               '--device', virtual.device, '--socket', args.socket], stdout=subprocess.DEVNULL)
+    try:
+        while not broker_running(args.socket):
+            time.sleep(0.05)
+        board = BrokerBoard(args.socket)
+        board.enable_reception()
+        results['broker'] = measure(board, args.count)
+        board.close()
+    finally:
+        broker.terminate()
+        broker.wait()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+    for name, (avg, p50, p99) in results.items():
+        print('%-8s avg %6.3f ms  p50 %6.3f ms  p99 %6.3f ms' % (name, avg, p50, p99))
+    print('added round trip latency: avg %.3f ms  p50 %.3f ms' % (
+        results['broker'][0] - results['direct'][0], results['broker'][1] - results['direct'][1]))
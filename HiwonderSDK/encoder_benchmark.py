@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+# coding=utf8
+import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import time
+import struct
+import argparse
+from serial.serialutil import to_bytes
+import HiwonderSDK.ros_robot_controller_sdk as rrc
+
+# 数据包编码速度测试(packets/s), 对比旧版列表拼接方式和PacketEncoder
+# 写入端模拟pyserial的to_bytes转换, 不需要连接扩展板
+
+def legacy_buf_write(func, data):
+    buf = [0xAA, 0x55, int(func)]
+    buf.append(len(data))
+    buf.extend(data)
+    buf.append(rrc.checksum_crc8(bytes(buf[2:])))
+    return buf
+
+def legacy_motor_duty(dutys):
+    data = [0x05, len(dutys)]
+    for i in dutys:
+        data.extend(struct.pack("<Bf", int(i[0] - 1), float(i[1])))
+    return legacy_buf_write(rrc.PacketFunction.PACKET_FUNC_MOTOR, data)
+
+def legacy_pwm_servo_position(duration, positions):
+    duration = int(duration * 1000)
+    data = [0x01, duration & 0xFF, 0xFF & (duration >> 8), len(positions)]
+    for i in positions:
+        data.extend(struct.pack("<BH", i[0], i[1]))
+    return legacy_buf_write(rrc.PacketFunction.PACKET_FUNC_PWM_SERVO, data)
+
+def legacy_rgb(pixels):
+    data = [0x01, len(pixels), ]
+    for index, r, g, b in pixels:
+        data.extend(struct.pack("<BBBB", int(index - 1), int(r), int(g), int(b)))
+    return legacy_buf_write(rrc.PacketFunction.PACKET_FUNC_RGB, data)
+
+def legacy_bus_servo_offset(servo_id, offset):
+    return legacy_buf_write(rrc.PacketFunction.PACKET_FUNC_BUS_SERVO, struct.pack("<BBb", 0x20, servo_id, int(offset)))
+
+encoder = rrc.PacketEncoder()
+CASES = [
+    ('set_motor_duty',
+     legacy_motor_duty, encoder.motor_duty,
+     ([[1, -35], [2, 35], [3, -35], [4, 35]],)),
+    ('pwm_servo_set_position',
+     legacy_pwm_servo_position, encoder.pwm_servo_position,
+     (0.02, [[1, 1500], [2, 1620]])),
+    ('set_rgb',
+     legacy_rgb, encoder.rgb,
+     ([[1, 255, 0, 0], [2, 0, 255, 0]],)),
+    ('bus_servo_set_offset',
+     legacy_bus_servo_offset,
+     lambda servo_id, offset: encoder.encode(rrc.PacketEncoder.FUNC_BUS_SERVO, rrc.PacketEncoder.U8x2_I8, 0x20, servo_id, offset),
+     (3, -12)),
+]
+
+def rate(build, args, count):
+    t = time.perf_counter()
+    for _ in range(count):
+        to_bytes(build(*args))
+    return count / (time.perf_counter() - t)
+
+if __name__ == '__main__':
+    arg = argparse.ArgumentParser(description='Packet encoder benchmark')
+    arg.add_argument('--count', type=int, default=200000, help='packets per case')
+    args = arg.parse_args()
+
+    for name, legacy, new, params in CASES:
+        # 先确认两种方式编码结果一致
+        assert bytes(legacy(*params)) == bytes(new(*params)), name
+        old_rate = rate(legacy, params, args.count)
+        new_rate = rate(new, params, args.count)
+        print('%-24s legacy %10.0f packets/s  encoder %10.0f packets/s  x%.2f' % (
+            name, old_rate, new_rate, new_rate / old_rate))
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+# coding=utf8
+import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import time
+import random
+import argparse
+from HiwonderSDK.stream_filter import StreamFilter
+
+# 避障距离滤波耗时测试: 原来每帧用pandas计算的方式和StreamFilter对比, 并检查两者结果一致
+# 使用合成的超声波数据(带少量跳变), 不需要连接硬件
+# python3 filter_benchmark.py --count 20000
+
+def make_distances(count, seed=0):
+    rand = random.Random(seed)
+    distances = []
+    dist = 50.0
+    for _ in range(count):
+        dist = min(max(dist + rand.gauss(0, 1), 5.0), 400.0)
+        if rand.random() < 0.05:  # 超声波偶尔的错误读数
+            distances.append(rand.choice([2.0, 500.0]))
+        else:
+            distances.append(round(dist, 1))
+    return distances
+
+def pandas_filter(distances):
+    # 原来Avoidance.run中的计算
+    import numpy as np
+    import pandas as pd
+    distance_data = []
+    results = []
+    for dist in distances:
+        distance_data.append(dist)
+        data = pd.DataFrame(distance_data)
+        data_ = data.copy()
+        u = data_.mean()
+        std = data_.std()
+        data_c = data[np.abs(data - u) <= std]
+        results.append(data_c.mean()[0])
+        if len(distance_data) == 5:
+            distance_data.remove(distance_data[0])
+    return results
+
+def stream_filter(distances, mode='sigma'):
+    distance_filter = StreamFilter(5, mode)
+    return [distance_filter.update(dist) for dist in distances]
+
+def measure(func, distances):
+    t = time.perf_counter()
+    results = func(distances)
+    return (time.perf_counter() - t) / len(distances), results
+
+if __name__ == '__main__':
+    arg = argparse.ArgumentParser(description='Avoidance distance filter benchmark')
+    arg.add_argument('--count', type=int, default=20000)
+    args = arg.parse_args()
+
+    distances = make_distances(args.count)
+    t = time.perf_counter()
+    try:
+        import pandas
+    except ImportError:
+        pandas = None
+    print('pandas import %.1f ms' % ((time.perf_counter() - t) * 1000) if pandas else 'pandas not installed, skipping the pandas path')
+
+    results = {}
+    for mode in StreamFilter.modes:
+        results[mode] = measure(lambda data: stream_filter(data, mode), distances)
+    if pandas is not None:
+        results['pandas'] = measure(pandas_filter, distances[:min(args.count, 2000)])
+
+    for name, (per_sample, values) in results.items():
+        print('%-7s %9.2f us per frame' % (name, per_sample * 1e6))
+
+    if pandas is not None:
+        # 只有1个数据时pandas的标准差为NaN, 结果也是NaN, 从第2个数据开始比较, 之后的结果应该完全相同
+        reference = results['pandas'][1]
+        values = results['sigma'][1]
+        differences = [abs(a - b) for a, b in zip(reference[1:], values[1:])]
+        print('sigma mode vs pandas: %d/%d frames differ, max difference %.3g cm, speedup %.0fx' % (
+            sum(1 for i in differences if i != 0), len(differences), max(differences),
+            results['pandas'][0] / results['sigma'][0]))
@@ -21,7 +21,7 @@ Tips:
  * 按下Ctrl+C可关闭此次程序运行，若失败请多次尝试！
 ----------------------------------------------------------
 ''')
-board = rrc.Board()
+board = rrc.acquire_board()  # 共享的扩展板连接, 结束时release()
 board.pwm_servo_set_position(0.3, [[1, 1800]]) 
 time.sleep(0.3)
 board.pwm_servo_set_position(0.3, [[1, 1500]]) 
@@ -60,3 +60,4 @@ time.sleep(0.5)
 board.set_motor_duty([[4, 0]])
 time.sleep(1)
 
+board.release()
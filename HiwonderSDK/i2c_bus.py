@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+# coding=utf8
+import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import time
+import heapq
+import threading
+import collections
+from concurrent.futures import Future
+from HiwonderSDK.telemetry import TelemetryRing
+
+# I2C总线管理: 一个后台线程独占总线(/dev/i2c-1), 所有传感器的读写都在这个线程中依次执行, 不会交错
+# 周期读取(超声波测距, 巡线传感器)按各自的频率轮流执行, 结果带时间戳存入self.data[名称]的环形缓冲区,
+# 写入(RGB等)放入队列, 在两次周期读取之间执行
+# 同一进程中的传感器通过acquire_bus()共用一个I2CBus
+#
+# bus = acquire_bus()
+# bus.add_read('sonar', 20, read_func, callback)  # read_func(bus)在总线线程中执行, 返回数值
+# bus.call(lambda b: b.write_i2c_block_data(0x77, 3, [255, 0, 0]), wait=False)
+
+def open_smbus(bus):
+    from smbus2 import SMBus
+    return SMBus(bus)
+
+class PeriodicRead:
+    def __init__(self, name, rate, func, callback):
+        self.name = name
+        self.period = 1.0 / rate
+        self.func = func
+        self.callback = callback
+        self.next_time = time.monotonic()
+        self.samples = 0
+        self.errors = 0
+        self.overruns = 0
+
+    def __lt__(self, other):
+        return self.next_time < other.next_time
+
+class I2CBus:
+    def __init__(self, bus=1, backend=open_smbus):
+        self.bus_id = bus
+        self.backend = backend  # backend(bus)返回SMBus兼容的对象
+        self.bus = None
+        self.cond = threading.Condition()
+        self.reads = {}      # 名称 -> PeriodicRead
+        self.schedule = []   # 按下一次读取时间排列的PeriodicRead
+        self.queue = collections.deque()  # (func, future)
+        self.data = {}       # 名称 -> TelemetryRing(时间戳, 数值)
+        self.transactions = 0
+        self.errors = 0
+        self.queue_max = 0
+        self.cpu_time = 0.0
+        self.run_time = 0.0
+        self.thread = None
+
+    def start(self):
+        with self.cond:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.bus_task, daemon=True)
+                self.thread.start()
+        return self
+
+    def call(self, func, wait=True, timeout=1):
+        # 在总线线程中执行func(bus), wait为True时等待并返回结果(出错时抛出异常), 否则返回Future
+        self.start()
+        future = Future()
+        with self.cond:
+            self.queue.append((func, future))
+            self.queue_max = max(self.queue_max, len(self.queue))
+            self.cond.notify()
+        if wait:
+            return future.result(timeout)
+        return future
+
+    def add_read(self, name, rate, func, callback=None, size=256):
+        # 每秒rate次在总线线程中执行func(bus), 结果存入self.data[name],
+        # 并在总线线程中调用callback(数值, 时间戳), 回调需要尽快返回
+        with self.cond:
+            if name in self.reads:
+                self.reads[name].period = 1.0 / rate
+                return self.data[name]
+            read = PeriodicRead(name, rate, func, callback)
+            self.reads[name] = read
+            self.data[name] = TelemetryRing(1, size)
+            heapq.heappush(self.schedule, read)
+            self.cond.notify()
+        self.start()
+        return self.data[name]
+
+    def remove_read(self, name):
+        with self.cond:
+            read = self.reads.pop(name, None)
+            if read in self.schedule:  # 正在读取时不在schedule中, 读完后不再加入
+                self.schedule.remove(read)
+                heapq.heapify(self.schedule)
+
+    def latest(self, name):
+        # 最近一次读取的 (时间戳, 数值), 没有数据时返回None
+        ring = self.data.get(name)
+        sample = None if ring is None else ring.latest()
+        return None if sample is None else (float(sample[0]), sample[1])
+
+    def next_job(self, last_was_queued):
+        # 有到期的周期读取时和队列中的写入交替执行, 写入不会让读取一直等待
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                due = self.schedule and self.schedule[0].next_time <= now
+                if self.queue and not (due and last_was_queued):
+                    return self.queue.popleft()
+                if due:
+                    return heapq.heappop(self.schedule), None
+                self.cond.wait(self.schedule[0].next_time - now if self.schedule else None)
+
+    def transfer(self, func):
+        if self.bus is None:
+            self.bus = self.backend(self.bus_id)
+        try:
+            self.transactions += 1
+            return func(self.bus)
+        except OSError:
+            self.errors += 1
+            try:
+                self.bus.close()
+            except OSError:
+                pass
+            self.bus = None  # 出错后重新打开总线
+            raise
+
+    def bus_task(self):
+        start_time = time.monotonic()
+        start_cpu = time.thread_time()
+        last_was_queued = False
+        while True:
+            job, future = self.next_job(last_was_queued)
+            last_was_queued = future is not None
+            if future is not None:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(self.transfer(job))
+                    except BaseException as e:
+                        future.set_exception(e)
+            else:
+                self.run_read(job)
+            self.cpu_time = time.thread_time() - start_cpu
+            self.run_time = time.monotonic() - start_time
+
+    def run_read(self, read):
+        try:
+            value = self.transfer(read.func)
+        except Exception as e:
+            if read.errors == 0:  # 只打印第一次错误
+                print('%s: %s' % (read.name, e))
+            read.errors += 1
+        else:
+            now = time.monotonic()
+            read.samples += 1
+            self.data[read.name].append(now, (value, ))
+            if read.callback is not None:
+                try:
+                    read.callback(value, now)
+                except Exception as e:
+                    print('%s callback error: %s' % (read.name, e))
+        with self.cond:
+            if self.reads.get(read.name) is not read:  # 已经被remove_read
+                return
+            read.next_time += read.period
+            now = time.monotonic()
+            if read.next_time < now:  # 跟不上时不补读
+                read.overruns += 1
+                read.next_time = now
+            heapq.heappush(self.schedule, read)
+
+    def stats(self):
+        with self.cond:
+            return {
+                'transactions': self.transactions,
+                'errors': self.errors,
+                'queued': len(self.queue),
+                'queue_max': self.queue_max,
+                'cpu_percent': self.cpu_time / self.run_time * 100 if self.run_time else 0.0,
+                'reads': {name: {
+                    'rate': 1.0 / read.period,
+                    'samples': read.samples,
+                    'errors': read.errors,
+                    'overruns': read.overruns
+                } for name, read in self.reads.items()}
+            }
+
+shared_lock = threading.Lock()
+shared_buses = {}
+
+def acquire_bus(bus=1):
+    # 进程内共用的I2C总线管理器
+    with shared_lock:
+        if bus not in shared_buses:
+            shared_buses[bus] = I2CBus(bus)
+        return shared_buses[bus]
+
+if __name__ == '__main__':
+    # 手动运行的自检(仓库没有自动测试), 用模拟的I2C设备: 超声波(0x77)和巡线传感器(0x78)同时读取, 同时写RGB, 检查事务不会交错
+    import random
+    import HiwonderSDK.Sonar as sonar_module
+    from HiwonderSDK.Sonar import Sonar
+    from HiwonderSDK.FourInfrared import FourInfrared
+
+    class FakeMsg:
+        # 代替smbus2.i2c_msg
+        def __init__(self, addr, read, data):
+            self.addr = addr
+            self.is_read = read
+            self.buf = bytearray(data)
+
+        def __iter__(self):
+            return iter(self.buf)
+
+    FakeMsg.write = staticmethod(lambda addr, data: FakeMsg(addr, False, data))
+    FakeMsg.read = staticmethod(lambda addr, length: FakeMsg(addr, True, bytes(length)))
+    sonar_module.i2c_msg = FakeMsg
+
+    class FakeBus:
+        def __init__(self):
+            self.opened = 0
+            self.busy = False
+            self.overlaps = 0
+            self.registers = {0x77: bytearray(16), 0x78: bytearray(2)}
+            self.writes = []
+
+        def open(self, bus):
+            self.opened += 1
+            return self
+
+        def access(self, seconds):
+            # 上一个事务还没结束时又开始新的事务, 记录为交错
+            if self.busy:
+                self.overlaps += 1
+            self.busy = True
+            time.sleep(seconds)
+            self.busy = False
+
+        def i2c_rdwr(self, *msgs):
+            self.access(0.00015)
+            for msg in msgs:
+                if msg.is_read:
+                    msg.buf[:] = random.randint(295, 305).to_bytes(2, 'little')
+
+        def read_byte_data(self, addr, reg):
+            self.access(0.0001)
+            return self.registers[addr][reg]
+
+        def write_byte_data(self, addr, reg, value):
+            self.access(0.0001)
+            self.registers[addr][reg] = value
+            self.writes.append((addr, reg, [value]))
+
+        def write_i2c_block_data(self, addr, reg, data):
+            self.access(0.0002)
+            self.registers[addr][reg:reg + len(data)] = bytes(data)
+            self.writes.append((addr, reg, list(data)))
+
+        def close(self):
+            pass
+
+    device = FakeBus()
+    bus = I2CBus(1, device.open)
+    sonar = Sonar(i2c=bus).start(50)
+    line = FourInfrared(i2c=bus).start(500)
+    edges = []
+    line.subscribe(lambda data, timestamp: edges.append(data))
+
+    for i in range(20):
+        device.registers[0x78][1] = i % 16
+        sonar.setPixelColors((i, 0, 0), (0, i, 0))
+        time.sleep(0.05)
+    time.sleep(0.1)
+
+    stats = bus.stats()
+    print(stats)
+    assert device.opened == 1, 'bus opened more than once'
+    assert device.overlaps == 0, 'transactions interleaved'
+    assert 40 <= stats['reads']['sonar']['samples'] <= 60, stats['reads']['sonar']
+    assert 400 <= stats['reads']['infrared']['samples'] <= 600, stats['reads']['infrared']
+    assert len(device.writes) == 20 and all(len(data) == 6 for addr, reg, data in device.writes), 'RGB not block written'
+    assert bytes(device.registers[0x77][3:9]) == bytes([19, 0, 0, 0, 19, 0])
+    assert 295 <= sonar.getDistance() <= 305 and 295 <= sonar.getFilteredDistance() <= 305
+    assert line.readData() == [True, True, False, False] and len(edges) == 20, edges
+    print('self test passed: %d transactions, %d writes, no interleaving' % (stats['transactions'], len(device.writes)))
@@ -10,23 +10,39 @@ sys.path.append(parent_dir)
 import math
 import HiwonderSDK.ros_robot_controller_sdk as rrc
 
-board = rrc.Board()
-
 class MecanumChassis:
     # A = 67  # mm
     # B = 59  # mm
     # WHEEL_DIAMETER = 65  # mm
 
-    def __init__(self, a=67, b=59, wheel_diameter=65):
+    def __init__(self, a=67, b=59, wheel_diameter=65, board=None):
         self.a = a
         self.b = b
         self.wheel_diameter = wheel_diameter
+        self.board = board  # 没有传入时在第一次控制电机时获取共享的扩展板连接
+        self.acquired = False  # 扩展板连接是否由自己获取, 是的话在close()中释放
         self.velocity = 0
         self.direction = 0
         self.angular_rate = 0
 
+    def set_motor_duty(self, dutys):
+        if self.board is None:
+            self.board = rrc.acquire_board()
+            self.acquired = True
+        self.board.set_motor_duty(dutys)
+
+    def close(self):
+        # 停止电机, 释放自己获取的扩展板连接, 之后再控制电机时重新获取
+        if self.board is None:
+            return
+        self.reset_motors()
+        if self.acquired:
+            self.board.release()
+            self.board = None
+            self.acquired = False
+
     def reset_motors(self):
-        board.set_motor_duty([[1, 0], [2, 0], [3, 0], [4, 0]])
+        self.set_motor_duty([[1, 0], [2, 0], [3, 0], [4, 0]])
             
         self.velocity = 0
         self.direction = 0
@@ -54,7 +70,7 @@ class MecanumChassis:
         v4 = int(vy + vx + vp)
         if fake:
             return
-        board.set_motor_duty([[1, -v1], [2, v2], [3, -v3], [4, v4]])
+        self.set_motor_duty([[1, -v1], [2, v2], [3, -v3], [4, v4]])
         self.velocity = velocity
         self.direction = direction
         self.angular_rate = angular_rate
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+# coding=utf8
+import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import time
+import random
+import struct
+import argparse
+import HiwonderSDK.ros_robot_controller_sdk as rrc
+
+# 串口数据解析吞吐量测试, 使用合成的数据流, 不需要连接扩展板
+# python3 parser_benchmark.py --size 4 --chunk 256
+
+def make_packet(func, data):
+    buf = bytes([int(func), len(data)]) + bytes(data)
+    return b'\xAA\x55' + buf + bytes([rrc.checksum_crc8(buf)])
+
+def make_stream(size, noise=0.01, seed=0):
+    # 按实际上报比例生成IMU, 电池, 手柄, SBUS数据包, 并混入少量噪声字节
+    rand = random.Random(seed)
+    packets = [
+        make_packet(rrc.PacketFunction.PACKET_FUNC_IMU, struct.pack('<6f', 0.01, -0.02, 9.8, 0.1, 0.2, 0.3)),
+        make_packet(rrc.PacketFunction.PACKET_FUNC_IMU, struct.pack('<6f', 0.02, -0.01, 9.7, 0.3, 0.2, 0.1)),
+        make_packet(rrc.PacketFunction.PACKET_FUNC_GAMEPAD, struct.pack('<HB4b', 0x0101, 15, 10, -20, 127, -128)),
+        make_packet(rrc.PacketFunction.PACKET_FUNC_SBUS, struct.pack('<16hBBBB', *range(16), 0, 1, 0, 0)),
+        make_packet(rrc.PacketFunction.PACKET_FUNC_SYS, struct.pack('<BH', 0x04, 7600)),
+    ]
+    stream = bytearray()
+    count = 0
+    while len(stream) < size:
+        stream += rand.choice(packets)
+        count += 1
+        if rand.random() < noise:
+            stream += bytes([rand.randrange(256)])
+    return bytes(stream), count
+
+def legacy_feed(parser, data):
+    # 旧版recv_task中的逐字节状态机, 用于对比
+    for dat in data:
+        if parser.state == rrc.PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE1:
+            if dat == 0xAA:
+                parser.state = rrc.PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE2
+            continue
+        elif parser.state == rrc.PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE2:
+            if dat == 0x55:
+                parser.state = rrc.PacketControllerState.PACKET_CONTROLLER_STATE_FUNCTION
+            else:
+                parser.state = rrc.PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE1
+            continue
+        elif parser.state == rrc.PacketControllerState.PACKET_CONTROLLER_STATE_FUNCTION:
+            if dat < int(rrc.PacketFunction.PACKET_FUNC_NONE):
+                parser.frame = [dat, 0]
+                parser.state = rrc.PacketControllerState.PACKET_CONTROLLER_STATE_LENGTH
+            else:
+                parser.frame = []
+                parser.state = rrc.PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE1
+            continue
+        elif parser.state == rrc.PacketControllerState.PACKET_CONTROLLER_STATE_LENGTH:
+            parser.frame[1] = dat
+            parser.recv_count = 0
+            if dat == 0:
+                parser.state = rrc.PacketControllerState.PACKET_CONTROLLER_STATE_CHECKSUM
+            else:
+                parser.state = rrc.PacketControllerState.PACKET_CONTROLLER_STATE_DATA
+            continue
+        elif parser.state == rrc.PacketControllerState.PACKET_CONTROLLER_STATE_DATA:
+            parser.frame.append(dat)
+            parser.recv_count += 1
+            if parser.recv_count >= parser.frame[1]:
+                parser.state = rrc.PacketControllerState.PACKET_CONTROLLER_STATE_CHECKSUM
+            continue
+        elif parser.state == rrc.PacketControllerState.PACKET_CONTROLLER_STATE_CHECKSUM:
+            crc8 = rrc.checksum_crc8(bytes(parser.frame))
+            if crc8 == dat:
+                func = rrc.PacketFunction(parser.frame[0])
+                data = bytes(parser.frame[2:])
+                if func in parser.parsers:
+                    parser.parsers[func](data)
+            parser.state = rrc.PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE1
+            continue
+
+class LegacyParser:
+    def __init__(self, parsers):
+        self.parsers = parsers
+        self.state = rrc.PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE1
+        self.frame = []
+        self.recv_count = 0
+
+    def feed(self, data):
+        legacy_feed(self, data)
+
+def run(parser_class, stream, chunk, repeat):
+    counter = [0]
+    def count(data, stamp=None):
+        counter[0] += 1
+    parsers = {func: count for func in rrc.PacketFunction if func != rrc.PacketFunction.PACKET_FUNC_NONE}
+    best = None
+    for _ in range(repeat):
+        counter[0] = 0
+        parser = parser_class(parsers)
+        t = time.perf_counter()
+        for i in range(0, len(stream), chunk):
+            parser.feed(stream[i:i + chunk])
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best, counter[0]
+
+if __name__ == '__main__':
+    arg = argparse.ArgumentParser(description='Packet parser throughput benchmark')
+    arg.add_argument('--size', type=float, default=2, help='stream size in MB')
+    arg.add_argument('--chunk', type=int, default=256, help='bytes handed to the parser per read')
+    arg.add_argument('--repeat', type=int, default=3)
+    arg.add_argument('--skip-legacy', action='store_true', help='only run the chunked parser')
+    args = arg.parse_args()
+
+    stream, count = make_stream(int(args.size * 1024 * 1024))
+    print('stream: %d bytes, %d packets, chunk %d' % (len(stream), count, args.chunk))
+
+    results = [('chunked', rrc.PacketParser)]
+    if not args.skip_legacy:
+        results.append(('legacy', LegacyParser))
+    for name, parser_class in results:
+        t, parsed = run(parser_class, stream, args.chunk, args.repeat)
+        print('%-8s %8.2f MB/s %10.0f packets/s  (%d packets)' % (
+            name, len(stream) / t / 1e6, parsed / t, parsed))
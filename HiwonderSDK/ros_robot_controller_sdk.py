@@ -1,13 +1,27 @@
 #!/usr/bin/env python3
 # encoding: utf-8
 # stm32 python sdk
+import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
 import enum
 import time
 import copy
-import queue
 import struct
+import bisect
 import serial
+import atexit
+import functools
 import threading
+import collections
+import numpy as np
+from concurrent.futures import Future
+from HiwonderSDK.telemetry import TelemetryRing
+from HiwonderSDK import traffic_log
 
 class PacketControllerState(enum.IntEnum):
     # 通信协议的格式
@@ -73,6 +87,677 @@ def checksum_crc8(data):
         check = crc8_table[check ^ b]
     return check & 0x00FF
 
+class LinkStats:
+    # 串口链路统计, 计数器只由接收线程或发送线程各自修改, 其他线程读取时不需要加锁
+    # snapshot()返回当前数据的字典
+    LATENCY_BINS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200)
+
+    def __init__(self):
+        self.bytes_in = [0] * 256
+        self.packets_in = [0] * 256
+        self.bytes_out = [0] * 256
+        self.packets_out = [0] * 256
+        self.crc_errors = 0
+        self.resyncs = 0        # 丢失同步后重新查找帧头的次数
+        self.skipped_bytes = 0  # 重新同步时丢弃的字节数
+        # 每种上报数据的到达间隔, 用Welford算法计算均值和方差
+        self.last_arrival = [0.0] * 256
+        self.intervals = [0] * 256
+        self.interval_mean = [0.0] * 256
+        self.interval_m2 = [0.0] * 256
+        self.interval_max = [0.0] * 256
+        self.read_latency = [0] * (len(self.LATENCY_BINS_MS) + 1)
+
+    def packet_in(self, func, size, now):
+        self.bytes_in[func] += size
+        self.packets_in[func] += 1
+        last = self.last_arrival[func]
+        self.last_arrival[func] = now
+        if last:
+            interval = now - last
+            n = self.intervals[func] + 1
+            self.intervals[func] = n
+            delta = interval - self.interval_mean[func]
+            self.interval_mean[func] += delta / n
+            self.interval_m2[func] += delta * (interval - self.interval_mean[func])
+            if interval > self.interval_max[func]:
+                self.interval_max[func] = interval
+
+    def packet_out(self, func, size):
+        self.bytes_out[func] += size
+        self.packets_out[func] += 1
+
+    def resync(self, skipped):
+        self.resyncs += 1
+        self.skipped_bytes += skipped
+
+    def read_latency_sample(self, latency):
+        ms = latency * 1000
+        for i, limit in enumerate(self.LATENCY_BINS_MS):
+            if ms <= limit:
+                self.read_latency[i] += 1
+                return
+        self.read_latency[-1] += 1
+
+    def snapshot(self):
+        functions = {}
+        for func in PacketFunction:
+            if func == PacketFunction.PACKET_FUNC_NONE:
+                continue
+            if self.packets_in[func] or self.packets_out[func]:
+                n = self.intervals[func]
+                functions[func.name[12:].lower()] = {
+                    'bytes_in': self.bytes_in[func],
+                    'packets_in': self.packets_in[func],
+                    'bytes_out': self.bytes_out[func],
+                    'packets_out': self.packets_out[func],
+                    'interval_ms': self.interval_mean[func] * 1000,
+                    'jitter_ms': (self.interval_m2[func] / n) ** 0.5 * 1000 if n else 0.0,
+                    'interval_max_ms': self.interval_max[func] * 1000
+                }
+        bins = ['<=%gms' % i for i in self.LATENCY_BINS_MS] + ['>%gms' % self.LATENCY_BINS_MS[-1]]
+        return {
+            'bytes_in': sum(self.bytes_in),
+            'packets_in': sum(self.packets_in),
+            'bytes_out': sum(self.bytes_out),
+            'packets_out': sum(self.packets_out),
+            'crc_errors': self.crc_errors,
+            'resyncs': self.resyncs,
+            'skipped_bytes': self.skipped_bytes,
+            'functions': functions,
+            'read_latency': dict(zip(bins, self.read_latency))
+        }
+
+class PacketParser:
+    # 按块解析串口数据, 一次处理in_waiting中的所有字节
+    # 数据先追加到可复用的bytearray中, 用bytes.find查找帧头0xAA 0x55,
+    # 再按长度字节切出整帧, 通过memoryview计算校验, 避免逐字节的状态机
+    SYNC = b'\xAA\x55'
+    FUNC_NONE = int(PacketFunction.PACKET_FUNC_NONE)
+
+    def __init__(self, parsers, stats=None):
+        self.parsers = parsers
+        self.stats = LinkStats() if stats is None else stats
+        self.buf = bytearray()
+
+    def feed(self, data, stamp=None):
+        # 每个数据包在校验通过时记录time.monotonic_ns(), 和数据一起传给parser(data, stamp)
+        # 回放时传入录制的时间stamp(ns), 同一块数据中的数据包使用同一个时间
+        buf = self.buf
+        buf += data
+        end = len(buf)
+        start = 0
+        stats = self.stats
+        monotonic_ns = time.monotonic_ns
+        with memoryview(buf) as view:
+            while True:
+                index = buf.find(self.SYNC, start)
+                if index < 0:
+                    # 保留末尾可能是半个帧头的0xAA
+                    keep = end - 1 if end and buf[-1] == 0xAA else end
+                    if keep > start:
+                        stats.resync(keep - start)
+                    start = keep
+                    break
+                if index > start:
+                    stats.resync(index - start)
+                if end - index < 5:  # 帧头+功能码+长度+校验至少5个字节
+                    start = index
+                    break
+                func = buf[index + 2]
+                if func >= self.FUNC_NONE:
+                    stats.resync(2)
+                    start = index + 2
+                    continue
+                length = buf[index + 3]
+                checksum_index = index + 4 + length
+                if checksum_index >= end:  # 帧不完整, 等待更多数据
+                    start = index
+                    break
+                if checksum_crc8(view[index + 2:checksum_index]) == buf[checksum_index]:
+                    packet_stamp = monotonic_ns() if stamp is None else stamp
+                    stats.packet_in(func, length + 5, packet_stamp * 1e-9)
+                    parser = self.parsers.get(func)
+                    start = checksum_index + 1
+                    if parser is not None:
+                        # 处理出错时只丢弃这一帧, 不影响后面的数据和接收线程
+                        try:
+                            parser(bytes(view[index + 4:checksum_index]), packet_stamp)
+                        except Exception as e:
+                            print('packet 0x%02X handler error: %s' % (func, e))
+                else:
+                    # 校验失败, 跳过帧头重新同步
+                    stats.crc_errors += 1
+                    stats.resync(2)
+                    start = index + 2
+        del buf[:start]
+
+class PacketEncoder:
+    # 数据包编码, 每种命令使用预编译的struct对象直接打包进预先分配的bytearray,
+    # 校验在打包完成后对memoryview一次计算, 返回整帧的memoryview, 不产生中间列表
+    # 校验仍然是逐字节查表, 占编码时间的一半左右(4个电机的命令约1.4us/2.6us):
+    # 缓存帧头部分的校验状态再继续计算数据部分, 或用16位的查找表每次处理2个字节, 实测都没有更快,
+    # 在Python中节省的几次查表抵不上构造缓存键或转换memoryview的开销
+    HEADER = struct.Struct("<BBBB")  # 0xAA 0x55 Function Length
+    HEADER_U8x2 = struct.Struct("<BBBBBB")  # 帧头 + 子命令 + 数量
+    HEADER_U8_U16_U8 = struct.Struct("<BBBBBHB")  # 帧头 + 子命令 + 时间 + 数量
+    U8 = struct.Struct("<B")
+    U8x2 = struct.Struct("<BB")
+    U8x3 = struct.Struct("<BBB")
+    U8x4 = struct.Struct("<BBBB")
+    U8x2_I8 = struct.Struct("<BBb")
+    U8_U16 = struct.Struct("<BH")
+    U8_F32 = struct.Struct("<Bf")
+    U8x2_U16x2 = struct.Struct("<BBHH")
+    U8_U16x3 = struct.Struct("<BHHH")
+    U16x4 = struct.Struct("<HHHH")
+
+    # 枚举成员的属性访问较慢, 编码时使用整数
+    FUNC_LED = int(PacketFunction.PACKET_FUNC_LED)
+    FUNC_BUZZER = int(PacketFunction.PACKET_FUNC_BUZZER)
+    FUNC_MOTOR = int(PacketFunction.PACKET_FUNC_MOTOR)
+    FUNC_PWM_SERVO = int(PacketFunction.PACKET_FUNC_PWM_SERVO)
+    FUNC_BUS_SERVO = int(PacketFunction.PACKET_FUNC_BUS_SERVO)
+    FUNC_OLED = int(PacketFunction.PACKET_FUNC_OLED)
+    FUNC_RGB = int(PacketFunction.PACKET_FUNC_RGB)
+
+    def __init__(self, size=260):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+
+    def end(self, offset):
+        # 校验范围为功能码, 长度和数据
+        crc = 0
+        for b in self.view[2:offset]:
+            crc = crc8_table[crc ^ b]
+        self.buf[offset] = crc
+        return self.view[:offset + 1]
+
+    def encode(self, func, packer, *values):
+        self.HEADER.pack_into(self.buf, 0, 0xAA, 0x55, func, packer.size)
+        packer.pack_into(self.buf, 4, *values)
+        return self.end(4 + packer.size)
+
+    def raw(self, func, data):
+        offset = 4 + len(data)
+        self.HEADER.pack_into(self.buf, 0, 0xAA, 0x55, func, len(data))
+        self.buf[4:offset] = data
+        return self.end(offset)
+
+    def led(self, led_id, on_time, off_time, repeat):
+        return self.encode(self.FUNC_LED, self.U8_U16x3, led_id, on_time, off_time, repeat)
+
+    def buzzer(self, freq, on_time, off_time, repeat):
+        return self.encode(self.FUNC_BUZZER, self.U16x4, freq, on_time, off_time, repeat)
+
+    def motor(self, cmd, values):
+        buf = self.buf
+        self.HEADER_U8x2.pack_into(buf, 0, 0xAA, 0x55, self.FUNC_MOTOR, 2 + 5 * len(values), cmd, len(values))
+        pack_into = self.U8_F32.pack_into
+        offset = 6
+        for i in values:
+            pack_into(buf, offset, int(i[0] - 1), float(i[1]))
+            offset += 5
+        return self.end(offset)
+
+    def motor_speed(self, speeds):
+        return self.motor(0x01, speeds)
+
+    def motor_duty(self, dutys):
+        return self.motor(0x05, dutys)
+
+    def oled_text(self, line, text):
+        # 第二个字节是字符串长度，该长度包含'\0'字符串结束符
+        data = bytes(text, encoding='utf-8')
+        offset = 6 + len(data)
+        self.HEADER_U8x2.pack_into(self.buf, 0, 0xAA, 0x55, self.FUNC_OLED, 2 + len(data), line, len(text))
+        self.buf[6:offset] = data
+        return self.end(offset)
+
+    def rgb(self, pixels):
+        buf = self.buf
+        self.HEADER_U8x2.pack_into(buf, 0, 0xAA, 0x55, self.FUNC_RGB, 2 + 4 * len(pixels), 0x01, len(pixels))
+        pack_into = self.U8x4.pack_into
+        offset = 6
+        for index, r, g, b in pixels:
+            pack_into(buf, offset, int(index - 1), int(r), int(g), int(b))
+            offset += 4
+        return self.end(offset)
+
+    def servo_position(self, func, duration, positions):
+        buf = self.buf
+        self.HEADER_U8_U16_U8.pack_into(buf, 0, 0xAA, 0x55, func, 4 + 3 * len(positions), 0x01, int(duration * 1000) & 0xFFFF, len(positions))
+        pack_into = self.U8_U16.pack_into
+        offset = 8
+        for i in positions:
+            pack_into(buf, offset, i[0], i[1])
+            offset += 3
+        return self.end(offset)
+
+    def pwm_servo_position(self, duration, positions):
+        return self.servo_position(self.FUNC_PWM_SERVO, duration, positions)
+
+    def bus_servo_position(self, duration, positions):
+        return self.servo_position(self.FUNC_BUS_SERVO, duration, positions)
+
+    def bus_servo_stop(self, servo_ids):
+        offset = 6 + len(servo_ids)
+        self.HEADER_U8x2.pack_into(self.buf, 0, 0xAA, 0x55, self.FUNC_BUS_SERVO, 2 + len(servo_ids), 0x03, len(servo_ids))
+        self.buf[6:offset] = bytes(servo_ids)
+        return self.end(offset)
+
+class ServoReadRequests:
+    # 舵机读取的请求/应答匹配
+    # 应答按(功能码, 子命令, 舵机ID)与未完成的请求对应, 每个请求返回一个Future,
+    # 超时后自动重发, 重试次数用完后Future以TimeoutError结束, 不同舵机的读取可以同时进行
+    def __init__(self, timeout=0.1, retries=2, stats=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.link_stats = stats
+        self.cond = threading.Condition()
+        self.pending = {}  # key -> [request, ...], 同一个key按发送顺序应答
+
+        self.requests = 0
+        self.completed = 0
+        self.resends = 0
+        self.timeouts = 0
+        self.unmatched = 0
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+        self.latency_total = 0.0
+
+        self.running = True
+        self.thread = threading.Thread(target=self.timeout_task, daemon=True)
+        self.thread.start()
+
+    def submit(self, key, send, unpack, timeout=None, retries=None):
+        # send: 发送请求的函数, unpack: 应答数据转换为结果的函数
+        future = Future()
+        now = time.monotonic()
+        timeout = self.timeout if timeout is None else timeout
+        request = [key, send, unpack, future, now, now + timeout, timeout, self.retries if retries is None else retries]
+        with self.cond:
+            if not self.running:
+                future.set_exception(TimeoutError('board closed'))
+                return future
+            self.pending.setdefault(key, []).append(request)
+            self.requests += 1
+            self.cond.notify()
+        send()
+        return future
+
+    def resolve(self, key, data):
+        with self.cond:
+            requests = self.pending.get(key)
+            if not requests:  # 读取ID时请求使用广播ID 254
+                key = (key[0], key[1], 254)
+                requests = self.pending.get(key)
+            if not requests:
+                self.unmatched += 1
+                return
+            key, send, unpack, future, start, *_ = requests.pop(0)
+            if not requests:
+                del self.pending[key]
+            latency = time.monotonic() - start
+            self.completed += 1
+            self.latency_last = latency
+            self.latency_total += latency
+            if latency > self.latency_max:
+                self.latency_max = latency
+            if self.link_stats is not None:
+                self.link_stats.read_latency_sample(latency)
+        try:
+            future.set_result(unpack(data))
+        except Exception as e:
+            future.set_exception(e)
+
+    def timeout_task(self):
+        while self.running:
+            resend = []
+            with self.cond:
+                now = time.monotonic()
+                deadline = None
+                for key in list(self.pending):
+                    requests = self.pending[key]
+                    for request in list(requests):
+                        if request[5] > now:
+                            deadline = request[5] if deadline is None else min(deadline, request[5])
+                        elif request[7] > 0:
+                            request[7] -= 1
+                            request[5] = now + request[6]
+                            deadline = request[5] if deadline is None else min(deadline, request[5])
+                            self.resends += 1
+                            resend.append(request[1])
+                        else:
+                            requests.remove(request)
+                            self.timeouts += 1
+                            request[3].set_exception(TimeoutError('servo read %s timed out' % (key, )))
+                    if not requests:
+                        del self.pending[key]
+                if not resend:
+                    self.cond.wait(None if deadline is None else deadline - now)
+            for send in resend:
+                send()
+
+    def close(self):
+        # 停止超时线程, 未完成的请求以TimeoutError结束
+        with self.cond:
+            self.running = False
+            pending = [request for requests in self.pending.values() for request in requests]
+            self.pending.clear()
+            self.cond.notify_all()
+        self.thread.join(1)
+        for request in pending:
+            if not request[3].done():
+                request[3].set_exception(TimeoutError('board closed'))
+
+    def stats(self):
+        with self.cond:
+            return {
+                'requests': self.requests,
+                'completed': self.completed,
+                'pending': sum(len(r) for r in self.pending.values()),
+                'resends': self.resends,
+                'timeouts': self.timeouts,
+                'unmatched': self.unmatched,
+                'latency_last_ms': self.latency_last * 1000,
+                'latency_avg_ms': self.latency_total / self.completed * 1000 if self.completed else 0.0,
+                'latency_max_ms': self.latency_max * 1000,
+            }
+
+class BusServoConfig:
+    # 总线舵机配置命令队列, 舵机写入配置后约20ms内不能接收下一条命令
+    # 按舵机ID分别排队: 同一个舵机的命令间隔interval秒, 不同舵机的命令互不等待
+    # 可以读回的配置在间隔之后读回校验, 不一致时重写, retries次后仍不一致Future结果为False
+    def __init__(self, send, read_async, interval=0.02, retries=1):
+        # send(packer, *values): 发送配置命令, read_async(servo_id, cmd, unpack): 读取, 返回Future
+        self.send = send
+        self.read_async = read_async
+        self.interval = interval
+        self.retries = retries
+        self.cond = threading.Condition()
+        self.queues = {}     # 舵机ID -> deque([command, ...])
+        self.next_time = {}  # 舵机ID -> 下次可以发送命令的时间
+
+        self.submitted = 0
+        self.written = 0
+        self.verified = 0
+        self.rewrites = 0
+        self.failed = 0
+
+        self.running = True
+        self.thread = threading.Thread(target=self.config_task, daemon=True)
+        self.thread.start()
+
+    def submit(self, servo_id, packer, values, verify=None, wait=False):
+        # verify: (读回的舵机ID, 子命令, 应答格式, 期望值), None表示不读回
+        # wait为True时等到命令写入发送队列再返回, 保证之后的读取在它之后发送
+        # 返回Future, 写入(和校验)完成后结果为True
+        future = Future()
+        written = threading.Event()
+        # 舵机ID, 命令格式, 数据, 校验, Future, 剩余重写次数, 状态('write'/'verify'/'reading'), 已写入
+        command = [servo_id, packer, values, verify, future, self.retries, 'write', written]
+        with self.cond:
+            if not self.running:
+                future.set_result(False)
+                return future
+            self.queues.setdefault(servo_id, collections.deque()).append(command)
+            self.submitted += 1
+            self.cond.notify()
+        if wait:
+            written.wait()
+        return future
+
+    def config_task(self):
+        while self.running:
+            writes = []
+            reads = []
+            with self.cond:
+                now = time.monotonic()
+                wait = None
+                for servo_id in list(self.queues):
+                    queue = self.queues[servo_id]
+                    if not queue:
+                        del self.queues[servo_id]
+                        continue
+                    command = queue[0]
+                    if command[6] == 'reading':
+                        continue
+                    next_time = self.next_time.get(servo_id, 0)
+                    if next_time > now:
+                        wait = next_time - now if wait is None else min(wait, next_time - now)
+                        continue
+                    if command[6] == 'write':
+                        self.next_time[servo_id] = now + self.interval
+                        writes.append(command)
+                        if command[3] is None:
+                            queue.popleft()
+                        else:
+                            command[6] = 'verify'
+                    else:
+                        command[6] = 'reading'
+                        reads.append(command)
+                if not writes and not reads:
+                    self.cond.wait(wait)
+                    continue
+                if not self.running:
+                    break
+                self.written += len(writes)
+            for command in writes:
+                self.send(command[1], *command[2])
+                command[7].set()
+                if command[3] is None:
+                    command[4].set_result(True)
+            for command in reads:
+                servo_id, cmd, unpack, expected = command[3]
+                future = self.read_async(servo_id, cmd, unpack)
+                future.add_done_callback(functools.partial(self.check, command))
+
+    def check(self, command, future):
+        # 读回结果, 在接收线程或超时线程中调用
+        try:
+            value = future.result()
+        except Exception:
+            value = None
+        done = value == command[3][3]
+        with self.cond:
+            if done:
+                self.verified += 1
+            elif command[5] > 0:
+                command[5] -= 1
+                command[6] = 'write'
+                self.rewrites += 1
+            else:
+                self.failed += 1
+                done = True
+            if done and self.queues.get(command[0]):
+                self.queues[command[0]].popleft()
+            self.cond.notify()
+        if done and not command[4].done():
+            command[4].set_result(value == command[3][3])
+
+    def close(self):
+        # 停止配置线程, 还没完成的命令Future结果为False
+        with self.cond:
+            self.running = False
+            commands = [command for queue in self.queues.values() for command in queue]
+            self.queues.clear()
+            self.cond.notify_all()
+        self.thread.join(1)
+        for command in commands:
+            command[7].set()
+            if not command[4].done():
+                command[4].set_result(False)
+
+    def stats(self):
+        with self.cond:
+            return {
+                'submitted': self.submitted,
+                'written': self.written,
+                'verified': self.verified,
+                'rewrites': self.rewrites,
+                'failed': self.failed,
+                'queued': sum(len(queue) for queue in self.queues.values())
+            }
+
+def gather_futures(futures):
+    # 等待一批Future, 返回一个Future, 全部完成后结果为各自结果的列表
+    futures = list(futures)
+    batch = Future()
+    results = [None] * len(futures)
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    if not futures:
+        batch.set_result(results)
+
+    def done(index, future):
+        try:
+            results[index] = future.result()
+        except Exception as e:
+            results[index] = e
+        with lock:
+            remaining[0] -= 1
+            finished = remaining[0] == 0
+        if finished:
+            batch.set_result(results)
+
+    for i, future in enumerate(futures):
+        future.add_done_callback(functools.partial(done, i))
+    return batch
+
+class CommandScheduler:
+    # 串口发送调度, 所有命令都由一个发送线程写入串口
+    # 普通命令按顺序发送; 带通道的命令(电机, PWM舵机, RGB, 蜂鸣器)只保留最新的一条, 通道为(类型, ID...),
+    # 每个通道最多每秒发送rate次; 紧急命令(如停止电机)优先发送, 并丢弃同类通道中排队的命令
+    # 每条命令带提交序号, 普通命令发送前先发出比它早提交的通道命令, 两类命令之间保持提交顺序,
+    # 只有两条普通命令之间提交的同一通道的命令才会合并
+    def __init__(self, write, rate=100):
+        self.write = write
+        self.interval = 1.0 / rate
+        self.cond = threading.Condition()
+        self.urgent = collections.deque()
+        self.fifo = collections.deque()  # (序号, 命令, 通道)
+        self.latest = {}     # 通道 -> (序号, 命令)
+        self.next_time = {}  # 通道 -> 下次允许发送的时间
+        self.seq = 0
+        self.busy = False
+
+        self.submitted = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.urgent_sent = 0
+
+        self.running = True
+        self.thread = threading.Thread(target=self.send_task, daemon=True)
+        self.thread.start()
+
+    def submit(self, command, channel=None, urgent=False):
+        with self.cond:
+            self.submitted += 1
+            self.seq += 1
+            if urgent:
+                self.urgent.append(command)
+                if channel is not None:
+                    # 丢弃被这条命令完全覆盖的排队命令, 如停止全部电机时排队的电机速度
+                    covered = set(channel[1:])
+                    def is_covered(key):
+                        return key is not None and key[0] == channel[0] and covered.issuperset(key[1:])
+                    for key in [key for key in self.latest if is_covered(key)]:
+                        del self.latest[key]
+                        self.dropped += 1
+                    fifo = [item for item in self.fifo if not is_covered(item[2])]
+                    self.dropped += len(self.fifo) - len(fifo)
+                    self.fifo = collections.deque(fifo)
+            elif channel is None:
+                self.fifo.append((self.seq, command, None))
+            else:
+                pending = self.latest.get(channel)
+                if pending is not None:
+                    if self.fifo and pending[0] < self.fifo[-1][0]:
+                        # 排队的值在某条普通命令之前提交, 不能被覆盖, 按序号放入普通命令队列
+                        index = bisect.bisect(self.fifo, (pending[0], ))
+                        self.fifo.insert(index, (pending[0], pending[1], channel))
+                    else:
+                        self.coalesced += 1
+                self.latest[channel] = (self.seq, command)
+            self.cond.notify()
+
+    def next_command(self):
+        # 需要在锁内调用, 返回下一条要发送的命令, 都没到发送时间时返回需要等待的时间
+        if self.urgent:
+            self.urgent_sent += 1
+            return self.urgent.popleft(), None
+        now = time.monotonic()
+        if self.fifo:
+            # 先发出比队首普通命令早提交的通道命令, 不等待发送间隔
+            seq = self.fifo[0][0]
+            earlier = [channel for channel, (s, command) in self.latest.items() if s < seq]
+            if earlier:
+                channel = min(earlier, key=lambda channel: self.latest[channel][0])
+                self.next_time[channel] = now + self.interval
+                return self.latest.pop(channel)[1], None
+            seq, command, channel = self.fifo.popleft()
+            if channel is not None:
+                self.next_time[channel] = now + self.interval
+            return command, None
+        wait = None
+        for channel in self.latest:
+            next_time = self.next_time.get(channel, 0)
+            if next_time <= now:
+                self.next_time[channel] = now + self.interval
+                return self.latest.pop(channel)[1], None
+            if wait is None or next_time - now < wait:
+                wait = next_time - now
+        return None, wait
+
+    def send_task(self):
+        while True:
+            with self.cond:
+                self.busy = False
+                self.cond.notify_all()
+                command, wait = self.next_command()
+                while command is None and self.running:
+                    self.cond.wait(wait)
+                    command, wait = self.next_command()
+                if not self.running:
+                    break
+                self.busy = True
+            try:
+                self.write(*command)
+                self.sent += 1
+            except Exception as e:
+                print('send error:', e)
+
+    def flush(self, timeout=1):
+        # 等待排队的命令全部发出
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.running and (self.busy or self.urgent or self.fifo or self.latest):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def close(self):
+        # 停止发送线程, 没有发出的命令丢弃, 需要发出时先调用flush()
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(1)
+
+    def stats(self):
+        with self.cond:
+            return {
+                'submitted': self.submitted,
+                'sent': self.sent,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'urgent': self.urgent_sent,
+                'queued': len(self.urgent) + len(self.fifo) + len(self.latest)
+            }
+
 class SBusStatus:
     def __init__(self):
         self.channels = [0] * 16;
@@ -81,6 +766,214 @@ class SBusStatus:
         self.signal_loss = True
         self.fail_safe = False
 
+# 上报数据解析, Board和AsyncBoard共用
+def unpack_battery(data):
+    # 电池电压, 单位mV
+    if len(data) >= 3 and data[0] == 0x04:
+        return struct.unpack('<H', data[1:])[0]
+
+def unpack_key(data):
+    return decode_key(data[0], data[1])
+
+def decode_key(key_id, key_event):
+    key_event = PacketReportKeyEvents(key_event)
+    if key_event == PacketReportKeyEvents.KEY_EVENT_CLICK:
+        return key_id, 0
+    elif key_event == PacketReportKeyEvents.KEY_EVENT_PRESSED:
+        return key_id, 1
+
+def unpack_imu(data):
+    # ax, ay, az, gx, gy, gz
+    return struct.unpack('<6f', data)
+
+def unpack_gamepad(data):
+    # buttons, hat, lx, ly, rx, ry
+    return decode_gamepad(struct.unpack("<HB4b", data))
+
+# 手柄按键: 位掩码, 名称, decode_gamepad结果中的位置(0: axes, 1: buttons), L3/R3在结果中没有位置
+gamepad_buttons = (
+    (0x0001, 'l2', (0, 5)),
+    (0x0002, 'r2', (0, 4)),
+    (0x0004, 'select', (1, 10)),
+    (0x0008, 'start', (1, 11)),
+    (0x0020, 'l3', None),
+    (0x0040, 'r3', None),
+    (0x0100, 'cross', (1, 0)),
+    (0x0200, 'circle', (1, 1)),
+    (0x0800, 'square', (1, 3)),
+    (0x1000, 'triangle', (1, 4)),
+    (0x4000, 'l1', (1, 6)),
+    (0x8000, 'r1', (1, 7))
+)
+
+def build_button_table(shift):
+    # 按键掩码的一个字节 -> 该字节中按下的按键在结果中的位置
+    table = []
+    for byte in range(256):
+        table.append(tuple(index for mask, name, index in gamepad_buttons
+                           if index is not None and (byte << shift) & mask))
+    return table
+
+def build_axis_table(sign):
+    # int8摇杆值 -> [-1, 1], 负数下标直接对应补码, table[-128]即table[128]
+    table = [0] * 256
+    for value in range(-128, 128):
+        if value > 0:
+            table[value] = sign * value / 127
+        elif value < 0:
+            table[value] = sign * value / 128
+    return table
+
+gamepad_button_table_low = build_button_table(0)
+gamepad_button_table_high = build_button_table(8)
+gamepad_axis_table = build_axis_table(1)
+gamepad_axis_table_inverted = build_axis_table(-1)
+gamepad_hat_table = [(0, 0)] * 256  # 方向键 -> (hat_x, hat_y)
+gamepad_hat_table[9] = (1, 0)
+gamepad_hat_table[13] = (-1, 0)
+gamepad_hat_table[11] = (0, -1)
+gamepad_hat_table[15] = (0, 1)
+
+def decode_gamepad(gamepad_data):
+    # axes: 'lx', 'ly', 'rx', 'ry', 'r2', 'l2', 'hat_x', 'hat_y'
+    # buttons: 'cross', 'circle', '', 'square', 'triangle', '', 'l1', 'r1', 'l2', 'r2', 'select', 'start', '', 'l3', 'r3', ''
+    mask, hat, lx, ly, rx, ry = gamepad_data
+    hat_x, hat_y = gamepad_hat_table[hat]
+    axes = [gamepad_axis_table_inverted[lx], gamepad_axis_table[ly],
+            gamepad_axis_table_inverted[rx], gamepad_axis_table[ry], 0, 0, hat_x, hat_y]
+    buttons = [0] * 16
+    if mask:
+        result = (axes, buttons)
+        for i, index in gamepad_button_table_low[mask & 0xFF] + gamepad_button_table_high[mask >> 8]:
+            result[i][index] = 1
+    return axes, buttons
+
+# decode_gamepad_window中buttons每一列对应的按键掩码
+gamepad_button_masks = np.zeros(16, dtype=np.int64)
+for mask, name, index in gamepad_buttons:
+    if index is not None and index[0] == 1:
+        gamepad_button_masks[index[1]] = mask
+
+def decode_gamepad_window(samples):
+    # 一次解析多个手柄数据, samples为环形缓冲区的窗口: 时间戳, buttons, hat, lx, ly, rx, ry
+    # 返回 axes(n x 8), buttons(n x 16), 和decode_gamepad的结果一致
+    mask = samples[:, 1].astype(np.int64)
+    hat = samples[:, 2]
+    values = samples[:, 3:7]
+    axes = np.zeros((len(samples), 8))
+    axes[:, :4] = np.where(values > 0, values / 127, values / 128) * (-1, 1, -1, 1) + 0.0  # 去掉-0.0
+    axes[:, 4] = (mask & 0x0002) != 0
+    axes[:, 5] = (mask & 0x0001) != 0
+    axes[:, 6] = (hat == 9).astype(int) - (hat == 13)
+    axes[:, 7] = (hat == 15).astype(int) - (hat == 11)
+    buttons = ((mask[:, None] & gamepad_button_masks) != 0).astype(np.int8)
+    return axes, buttons
+
+gamepad_button_names = {mask: name for mask, name, index in gamepad_buttons}
+
+class GamepadEdges:
+    # 根据按键掩码的变化生成事件 (时间戳, 按键名称, 'pressed'/'released'/'held')
+    # 按住超过hold_time秒时产生一次'held'
+    def __init__(self, hold_time=0.5):
+        self.hold_time = hold_time
+        self.mask = 0
+        self.holds = {}  # 等待产生'held'的按键掩码 -> 按下的时间
+
+    def update(self, timestamp, mask):
+        events = []
+        changed = mask ^ self.mask
+        if changed:
+            for bit, name, index in gamepad_buttons:
+                if changed & bit:
+                    if mask & bit:
+                        events.append((timestamp, name, 'pressed'))
+                        self.holds[bit] = timestamp
+                    else:
+                        events.append((timestamp, name, 'released'))
+                        self.holds.pop(bit, None)
+            self.mask = mask
+        if self.holds:
+            for bit, pressed in list(self.holds.items()):
+                if timestamp - pressed >= self.hold_time:
+                    del self.holds[bit]
+                    events.append((timestamp, gamepad_button_names[bit], 'held'))
+        return events
+
+def unpack_sbus(data):
+    return decode_sbus(struct.unpack("<16hBBBB", data))
+
+sbus_signal_loss = [0.5, 0.5, 0.5, 0.5, 0, 0, 0, 0, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5]
+
+def decode_sbus(sbus_data):
+    # 16个通道归一化到[0, 1], 信号丢失时返回中位值, 通道5~8为0
+    if sbus_data[18]:
+        return list(sbus_signal_loss)
+    return [(i - 192) / 1600 for i in sbus_data[:16]]
+
+def decode_sbus_window(samples):
+    # 一次解析多个SBUS数据, samples为环形缓冲区的窗口: 时间戳, 16个通道, ch17, ch18, signal_loss, fail_safe
+    data = (samples[:, 1:17] - 192) / 1600
+    data[samples[:, 19] != 0] = sbus_signal_loss
+    return data
+
+class StampedCallback:
+    # subscribe(..., with_stamp=True)的回调, 调用时带上接收时间
+    def __init__(self, callback):
+        self.callback = callback
+
+class ReportClock:
+    # 扩展板的数据包里没有时间戳, 根据周期性上报的到达时间估计扩展板的发送时刻
+    # 到达时间 = 发送时刻 + 传输延时, 发送时刻按固定周期排列, 延时最小的数据包最接近发送时刻,
+    # 因此用最近window个数据拟合周期, 再取下包络作为相位; 时间都是time.monotonic_ns()
+    def __init__(self, period=None, window=64):
+        self.period = period   # 上报周期(ns), None时自动估计
+        self.window = window
+        self.stamps = collections.deque(maxlen=window)
+        self.origin = None      # 拟合得到的某一个发送时刻
+        self.fitted_period = None
+        self.delay_last = 0
+        self.delay_max = 0
+
+    def update(self, stamp):
+        self.stamps.append(stamp)
+        if len(self.stamps) >= 8 and (self.origin is None or len(self.stamps) % 8 == 0 or len(self.stamps) == self.window):
+            self.fit()
+        if self.origin is not None:
+            self.delay_last = self.delay(stamp)
+            self.delay_max = max(self.delay_max, self.delay_last)
+
+    def fit(self):
+        t = np.array(self.stamps, dtype=np.float64)
+        t -= t[0]
+        period = self.period
+        if period is None:
+            period = float(np.median(np.diff(t)))
+            if period <= 0:
+                return
+        k = np.round(t / period)  # 中间丢失的数据包也按周期编号
+        if self.period is None and k[-1] > 0:
+            period = float(np.polyfit(k, t, 1)[0])
+        self.fitted_period = period
+        self.origin = self.stamps[0] + int((t - k * period).min())
+
+    def sample_time(self, stamp):
+        # 估计的发送时刻(ns), 还没有拟合时返回stamp
+        if self.origin is None:
+            return stamp
+        k = round((stamp - self.origin) / self.fitted_period)
+        return self.origin + int(k * self.fitted_period)
+
+    def delay(self, stamp):
+        # 到达时间比估计的发送时刻晚了多少(ns)
+        return stamp - self.sample_time(stamp)
+
+    def stats(self):
+        return {
+            'period_ms': self.fitted_period / 1e6 if self.fitted_period else None,
+            'delay_last_ms': self.delay_last / 1e6,
+            'delay_max_ms': self.delay_max / 1e6
+        }
+
 class Board:
     buttons_map = {
             'GAMEPAD_BUTTON_MASK_L2':        0x0001,
@@ -97,28 +990,72 @@ class Board:
             'GAMEPAD_BUTTON_MASK_R1':        0x8000
     }
 
-    def __init__(self, device="/dev/ttyAMA0", baudrate=1000000, timeout=5):
+    # 可读取的舵机参数: 子命令, 应答格式
+    bus_servo_read_fields = {
+        'id':           (0x12, "<BBbB"),
+        'offset':       (0x22, "<BBbb"),
+        'position':     (0x05, "<BBbh"),
+        'vin':          (0x07, "<BBbH"),
+        'temp':         (0x09, "<BBbB"),
+        'temp_limit':   (0x3A, "<BBbB"),
+        'angle_limit':  (0x32, "<BBb2H"),
+        'vin_limit':    (0x36, "<BBb2H"),
+        'torque_state': (0x0D, "<BBbb")
+    }
+
+    pwm_servo_read_fields = {
+        'offset':   (0x09, "<BBb"),
+        'position': (0x05, "<BBH")
+    }
+
+    # 上报数据格式
+    BATTERY = struct.Struct("<xH")
+    KEY = struct.Struct("<BB")
+    IMU = struct.Struct("<6f")
+    GAMEPAD = struct.Struct("<HB4b")
+    SBUS = struct.Struct("<16hBBBB")
+
+    def __init__(self, device="/dev/ttyAMA0", baudrate=1000000, timeout=5, read_timeout=0.1, read_retries=2, command_rate=100):
         self.enable_recv = False
-        self.frame = []
-        self.recv_count = 0
-
-        self.port = serial.Serial(None, baudrate, timeout=timeout)
-        self.port.rts = False
-        self.port.dtr = False
-        self.port.setPort(device)
-        self.port.open()
-
-        self.state = PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE1
-        self.servo_read_lock = threading.Lock()
-        self.pwm_servo_read_lock = threading.Lock()
+        self.capture = None  # 正在录制时为TrafficRecorder
+
+        self.port = self.open_port(device, baudrate, timeout)
+
+        # 编码器只在发送线程中使用
+        self.encoder = PacketEncoder()
+        self.scheduler = CommandScheduler(self.port_write, command_rate)
+        atexit.register(self.scheduler.flush)
+        self.stats = LinkStats()
+        self.servo_reads = ServoReadRequests(read_timeout, read_retries, self.stats)
+        self.servo_config = BusServoConfig(
+            functools.partial(self.send, self.encoder.encode, PacketEncoder.FUNC_BUS_SERVO), self.bus_servo_read_async)
         
-        self.sys_queue = queue.Queue(maxsize=1)
-        self.bus_servo_queue = queue.Queue(maxsize=1)
-        self.pwm_servo_queue = queue.Queue(maxsize=1)
-        self.key_queue = queue.Queue(maxsize=1)
-        self.imu_queue = queue.Queue(maxsize=1)
-        self.gamepad_queue = queue.Queue(maxsize=1)
-        self.sbus_queue = queue.Queue(maxsize=1)
+        # 各类上报数据的环形缓冲区, 每行为 时间戳(time.monotonic()) + 数据
+        self.telemetry = {
+            'battery': TelemetryRing(1),   # 电压mV
+            'key': TelemetryRing(2),       # 按键ID, 事件
+            'imu': TelemetryRing(6, 1024), # ax, ay, az, gx, gy, gz
+            'gamepad': TelemetryRing(6),   # buttons, hat, lx, ly, rx, ry
+            'sbus': TelemetryRing(20)      # 16个通道, ch17, ch18, signal_loss, fail_safe
+        }
+        self.battery_data = self.telemetry['battery']
+        self.key_data = self.telemetry['key']
+        self.imu_data = self.telemetry['imu']
+        self.gamepad_data = self.telemetry['gamepad']
+        self.sbus_data = self.telemetry['sbus']
+
+        # 手柄按键事件
+        self.gamepad_edges = GamepadEdges()
+        self.gamepad_events = collections.deque(maxlen=256)
+
+        # 上报数据的订阅者, 由分发线程调用
+        self.subscribers = {kind: [] for kind in self.telemetry}
+        self.subscribers['gamepad_event'] = []
+        self.clocks = {}  # 类型 -> ReportClock, 由estimate_clock()开启
+        self.dispatch_cond = threading.Condition()
+        self.dispatch_queue = collections.deque(maxlen=256)  # (类型, 数据)
+        self.dispatch_dropped = 0
+        self.dispatch_thread = None
 
         self.parsers = {
             PacketFunction.PACKET_FUNC_SYS: self.packet_report_sys,
@@ -129,394 +1066,493 @@ class Board:
             PacketFunction.PACKET_FUNC_SBUS: self.packet_report_sbus,
             PacketFunction.PACKET_FUNC_PWM_SERVO: self.packet_report_pwm_servo
         }
+        self.parser = PacketParser(self.parsers, self.stats)
 
-        threading.Thread(target=self.recv_task, daemon=True).start()
+        self.running = True
+        self.recv_thread = threading.Thread(target=self.recv_task, daemon=True)
+        self.recv_thread.start()
         time.sleep(0.1)
 
-    def packet_report_sys(self, data):
-        try:
-            self.sys_queue.put_nowait(data)
-        except queue.Full:
-            pass
-
-    def packet_report_key(self, data):
-        try:
-            self.key_queue.put_nowait(data)
-        except queue.Full:
-            pass
+    def open_port(self, device, baudrate, timeout):
+        port = serial.Serial(None, baudrate, timeout=timeout)
+        port.rts = False
+        port.dtr = False
+        port.setPort(device)
+        port.open()
+        return port
 
-    def packet_report_imu(self, data):
+    # 上报数据在环形缓冲区中的时间戳为stamp换算成的秒, 和time.monotonic()一致
+    def packet_report(self, kind, unpacker, data, stamp):
         try:
-            self.imu_queue.put_nowait(data)
-        except queue.Full:
-            pass
-
-    def packet_report_gamepad(self, data):
-        try:
-            self.gamepad_queue.put_nowait(data)
-        except queue.Full:
-            pass
-
-    def packet_report_serial_servo(self, data):
-        try:
-            self.bus_servo_queue.put_nowait(data)
-        except queue.Full:
-            pass
-
-    def packet_report_pwm_servo(self, data):
-        try:
-            self.pwm_servo_queue.put_nowait(data)
-        except queue.Full:
-            pass
-
-    def packet_report_sbus(self, data):
-        try:
-            self.sbus_queue.put_nowait(data)
-        except queue.Full:
-            pass
-
-    def get_battery(self):
-        if self.enable_recv:
-            try:
-                data = self.sys_queue.get(block=False)
-                if data[0] == 0x04:
-                    return struct.unpack('<H', data[1:])[0]
-                else:
-                    None
-            except queue.Empty:
-                return None
-        else:
-            # print('enable reception first!')
-            return None
-
-    def get_button(self):
-        if self.enable_recv:
-            try:
-                data = self.key_queue.get(block=False)
-                key_id = data[0]
-                key_event = PacketReportKeyEvents(data[1])
-                if key_event == PacketReportKeyEvents.KEY_EVENT_CLICK:
-                    return key_id, 0
-                elif key_event == PacketReportKeyEvents.KEY_EVENT_PRESSED:
-                    return key_id, 1
-            except queue.Empty:
-                return None
-        else:
-            # print('enable reception first!')
-            return None
-
-    def get_imu(self):
-        if self.enable_recv:
-            try:
-                # ax, ay, az, gx, gy, gz
-                return struct.unpack('<6f', self.imu_queue.get(block=False))
-            except queue.Empty:
-                return None
-        else:
-            # print('enable reception first!')
+            values = unpacker.unpack(data)
+        except struct.error:
+            self.telemetry[kind].dropped += 1
             return None
+        if stamp is None:
+            stamp = time.monotonic_ns()
+        self.telemetry[kind].append(stamp * 1e-9, values)
+        clock = self.clocks.get(kind)
+        if clock is not None:
+            clock.update(stamp)
+        if self.subscribers[kind]:
+            self.dispatch(kind, values, stamp)
+        return stamp, values
+
+    def dispatch(self, kind, value, stamp):
+        with self.dispatch_cond:
+            if len(self.dispatch_queue) == self.dispatch_queue.maxlen:
+                self.dispatch_dropped += 1
+            self.dispatch_queue.append((kind, value, stamp))
+            self.dispatch_cond.notify()
+
+    def packet_report_sys(self, data, stamp=None):
+        if len(data) >= 3 and data[0] == 0x04:  # 电池电压
+            self.packet_report('battery', self.BATTERY, data, stamp)
+
+    def packet_report_key(self, data, stamp=None):
+        self.packet_report('key', self.KEY, data, stamp)
+
+    def packet_report_imu(self, data, stamp=None):
+        self.packet_report('imu', self.IMU, data, stamp)
+
+    def packet_report_gamepad(self, data, stamp=None):
+        report = self.packet_report('gamepad', self.GAMEPAD, data, stamp)
+        if report is not None:
+            stamp, values = report
+            events = self.gamepad_edges.update(stamp * 1e-9, values[0])
+            if events:
+                self.gamepad_events.extend(events)
+                if self.subscribers['gamepad_event']:
+                    for event in events:
+                        self.dispatch('gamepad_event', event, stamp)
+
+    def packet_report_sbus(self, data, stamp=None):
+        self.packet_report('sbus', self.SBUS, data, stamp)
+
+    def packet_report_serial_servo(self, data, stamp=None):
+        # 应答数据: 舵机ID, 子命令, ...
+        if len(data) >= 2:
+            self.servo_reads.resolve((PacketEncoder.FUNC_BUS_SERVO, data[1], data[0]), data)
+
+    def packet_report_pwm_servo(self, data, stamp=None):
+        if len(data) >= 2:
+            self.servo_reads.resolve((PacketEncoder.FUNC_PWM_SERVO, data[1], data[0]), data)
+
+    # 把上报数据转换成get_xxx()返回的格式
+    report_decoders = {
+        'battery': lambda values: int(values[0]),
+        'key': lambda values: decode_key(int(values[0]), int(values[1])),
+        'imu': lambda values: tuple(float(i) for i in values),
+        'gamepad': lambda values: decode_gamepad([int(i) for i in values]),
+        'sbus': lambda values: decode_sbus([int(i) for i in values]),
+        'gamepad_event': lambda event: event
+    }
 
-    def get_gamepad(self):
+    def get_report(self, kind, take=True, with_stamp=False):
+        # with_stamp为True时返回(接收时间ns, 数据)
         if self.enable_recv:
-            try:
-                # buttons, hat, lx, ly, rx, ry
-                gamepad_data = struct.unpack("<HB4b", self.gamepad_queue.get(block=False))
-                # 'lx', 'ly', 'rx', 'ry', 'r2', 'l2', 'hat_x', 'hat_y'
-                axes = [0, 0, 0, 0, 0, 0, 0, 0]
-                # 'cross', 'circle', '', 'square', 'triangle', '', 'l1', 'r1', 'l2', 'r2', 'select', 'start', '', 'l3', 'r3', ''
-                buttons = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0] 
-                for b in self.buttons_map:
-                    if self.buttons_map[b] & gamepad_data[0]:
-                        if b == 'GAMEPAD_BUTTON_MASK_R2':
-                            axes[4] = 1
-                        elif b == 'GAMEPAD_BUTTON_MASK_L2':
-                            axes[5] = 1
-                        elif b == 'GAMEPAD_BUTTON_MASK_CROSS':
-                            buttons[0] = 1
-                        elif b == 'GAMEPAD_BUTTON_MASK_CIRCLE':
-                            buttons[1] = 1
-                        elif b == 'GAMEPAD_BUTTON_MASK_SQUARE':
-                            buttons[3] = 1
-                        elif b == 'GAMEPAD_BUTTON_MASK_TRIANGLE':
-                            buttons[4] = 1
-                        elif b == 'GAMEPAD_BUTTON_MASK_L1':
-                            buttons[6] = 1
-                        elif b == 'GAMEPAD_BUTTON_MASK_R1':
-                            buttons[7] = 1
-                        elif b == 'GAMEPAD_BUTTON_MASK_SELECT':
-                            buttons[10] = 1
-                        elif b == 'GAMEPAD_BUTTON_MASK_START':
-                            buttons[11] = 1
-               
-                if gamepad_data[2] > 0:
-                    axes[0] = -gamepad_data[2] / 127
-                elif gamepad_data[2] < 0:
-                    axes[0] = -gamepad_data[2] / 128
-
-                if gamepad_data[3] > 0:
-                    axes[1] = gamepad_data[3] / 127
-                elif gamepad_data[3] < 0:
-                    axes[1] = gamepad_data[3] / 128
-
-                if gamepad_data[4] > 0:
-                    axes[2] = -gamepad_data[4] / 127
-                elif gamepad_data[4] < 0:
-                    axes[2] = -gamepad_data[4] / 128
-
-                if gamepad_data[5] > 0:
-                    axes[3] = gamepad_data[5] / 127
-                elif gamepad_data[5] < 0:
-                    axes[3] = gamepad_data[5] / 128
-            
-                if gamepad_data[1] == 9:
-                    axes[6] = 1
-                elif gamepad_data[1] == 13:
-                    axes[6] = -1
-                
-                if gamepad_data[1] == 11:
-                    axes[7] = -1
-                elif gamepad_data[1] == 15:
-                    axes[7] = 1
-                return axes, buttons
-            except queue.Empty:
-                return None
+            ring = self.telemetry[kind]
+            sample = ring.take() if take else ring.latest()
+            if sample is not None:
+                value = self.report_decoders[kind](sample[1:])
+                if with_stamp:
+                    # 秒的float64在开机约50天内可以精确还原到ns
+                    return round(sample[0] * 1e9), value
+                return value
         else:
             # print('enable reception first!')
             return None
 
-    def get_sbus(self):
-        if self.enable_recv:
+    # get_xxx()返回上次调用之后收到的最新数据, 没有新数据时返回None, 多个调用者会互相取走数据
+    # 多处读取同一数据时使用latest(kind)或subscribe(kind, callback)
+    # 需要历史数据时使用self.telemetry中的环形缓冲区: latest(), since(t), window(n)
+    # with_stamp=True时返回(接收时间, 数据), 接收时间为数据包校验通过时的time.monotonic_ns()
+    def get_battery(self, with_stamp=False):
+        return self.get_report('battery', with_stamp=with_stamp)
+
+    def get_button(self, with_stamp=False):
+        return self.get_report('key', with_stamp=with_stamp)
+
+    def get_imu(self, with_stamp=False):
+        return self.get_report('imu', with_stamp=with_stamp)
+
+    def get_gamepad(self, with_stamp=False):
+        return self.get_report('gamepad', with_stamp=with_stamp)
+
+    def get_sbus(self, with_stamp=False):
+        return self.get_report('sbus', with_stamp=with_stamp)
+
+    def get_gamepad_window(self, n=None):
+        # 最近n个手柄数据一次解析, 返回 时间戳, axes(n x 8), buttons(n x 16)
+        samples = self.gamepad_data.window(n)
+        axes, buttons = decode_gamepad_window(samples)
+        return samples[:, 0], axes, buttons
+
+    def get_sbus_window(self, n=None):
+        # 最近n个SBUS数据一次解析, 返回 时间戳, 通道(n x 16)
+        samples = self.sbus_data.window(n)
+        return samples[:, 0], decode_sbus_window(samples)
+
+    def get_gamepad_events(self):
+        # 上次调用之后的手柄按键事件 [(时间戳, 按键名称, 'pressed'/'released'/'held'), ...]
+        # 也可以用subscribe('gamepad_event', callback)逐个接收
+        events = []
+        while self.gamepad_events:
+            events.append(self.gamepad_events.popleft())
+        return events
+
+    def latest(self, kind, with_stamp=False):
+        # 最近收到的数据, 不会被取走, 还没有收到时返回None
+        return self.get_report(kind, take=False, with_stamp=with_stamp)
+
+    def estimate_clock(self, kind='battery', period=None, window=64):
+        # 根据kind类型周期性上报的接收时间估计扩展板的发送时刻, 返回ReportClock
+        # board.clocks[kind].sample_time(stamp)把接收时间换算成估计的发送时刻
+        self.clocks[kind] = ReportClock(period, window)
+        return self.clocks[kind]
+
+    def subscribe(self, kind, callback, with_stamp=False):
+        # 每收到一条kind类型的数据调用一次callback(数据), 数据格式和get_xxx()相同
+        # with_stamp为True时调用callback(数据, 接收时间ns)
+        # kind为'gamepad_event'时每个手柄按键事件调用一次
+        # 回调在分发线程中依次执行, 不阻塞接收线程, 回调太慢时丢弃最旧的数据
+        if with_stamp:
+            callback = StampedCallback(callback)
+        with self.dispatch_cond:
+            self.subscribers[kind].append(callback)
+            if self.dispatch_thread is None:
+                self.dispatch_thread = threading.Thread(target=self.dispatch_task, daemon=True)
+                self.dispatch_thread.start()
+        return callback
+
+    def unsubscribe(self, kind, callback):
+        with self.dispatch_cond:
+            for i in self.subscribers[kind]:
+                if i == callback or (isinstance(i, StampedCallback) and i.callback == callback):
+                    self.subscribers[kind].remove(i)
+                    break
+
+    def dispatch_task(self):
+        while True:
+            with self.dispatch_cond:
+                while not self.dispatch_queue and self.running:
+                    self.dispatch_cond.wait()
+                if not self.running:
+                    break
+                kind, values, stamp = self.dispatch_queue.popleft()
+                callbacks = list(self.subscribers[kind])
             try:
-                sbus_data = self.sbus_queue.get(block=False)
-                status = SBusStatus()
-                *status.channels, ch17, ch18, sig_loss, fail_safe = struct.unpack("<16hBBBB", sbus_data)
-                status.channel_17 = ch17 != 0
-                status.channel_18 = ch18 != 0
-                status.signal_loss = sig_loss != 0
-                status.fail_safe = fail_safe != 0
-                data = []
-                if status.signal_loss:
-                    data = 16 * [0.5]
-                    data[4] = 0
-                    data[5] = 0
-                    data[6] = 0
-                    data[7] = 0
-                else:
-                    for i in status.channels:
-                        data.append((i - 192)/(1792 - 192))
-                return data
-            except queue.Empty:
-                return None
-        else:
-            # print('enable reception first!')
-            return None
+                value = self.report_decoders[kind](values)
+            except Exception as e:  # 解码出错只丢弃这一条上报, 分发线程继续运行
+                print('%s decode error: %s' % (kind, e))
+                continue
+            for callback in callbacks:
+                try:
+                    if isinstance(callback, StampedCallback):
+                        callback.callback(value, stamp)
+                    else:
+                        callback(value)
+                except Exception as e:
+                    print('%s callback error: %s' % (kind, e))
+
+    def telemetry_stats(self):
+        return {kind: ring.stats() for kind, ring in self.telemetry.items()}
+
+    def port_write(self, encode, args):
+        # 在发送线程中编码并写入串口
+        data = encode(*args)
+        self.port.write(data)
+        self.stats.packet_out(data[2], len(data))
+        capture = self.capture
+        if capture is not None:
+            capture.record(traffic_log.TX, data)
+
+    def send(self, encode, *args):
+        # 按顺序发送
+        self.scheduler.submit((encode, args))
+
+    def send_latest(self, channel, encode, *args, urgent=False):
+        # 同一通道只发送最新的一条, urgent为True时优先发送
+        self.scheduler.submit((encode, args), channel, urgent)
+
+    def command_stats(self):
+        return self.scheduler.stats()
+
+    def link_stats(self):
+        # 链路统计快照: 收发字节数和包数, 校验失败, 重新同步, 队列溢出, 上报间隔抖动, 舵机读取延时分布
+        snapshot = self.stats.snapshot()
+        telemetry = self.telemetry_stats()
+        commands = self.command_stats()
+        snapshot['queue_overflows'] = sum(i['overruns'] for i in telemetry.values()) + commands['dropped'] + self.dispatch_dropped
+        snapshot['dispatch_dropped'] = self.dispatch_dropped
+        snapshot['telemetry'] = telemetry
+        snapshot['commands'] = commands
+        snapshot['servo_reads'] = self.servo_read_stats()
+        snapshot['servo_config'] = self.servo_config_stats()
+        snapshot['clocks'] = {kind: clock.stats() for kind, clock in self.clocks.items()}
+        return snapshot
+
+    def start_capture(self, path, buffer_size=1 << 20):
+        # 把串口收发的原始数据录制到文件, 用traffic_log.py回放
+        self.stop_capture()
+        self.capture = traffic_log.TrafficRecorder(path, buffer_size)
+
+    def stop_capture(self):
+        # 停止录制, 返回录制的记录数和字节数
+        capture, self.capture = self.capture, None
+        if capture is not None:
+            capture.close()
+            return capture.records, capture.bytes
 
     def buf_write(self, func, data):
-        buf = [0xAA, 0x55, int(func)]
-        buf.append(len(data))
-        buf.extend(data)
-        buf.append(checksum_crc8(bytes(buf[2:])))
-        self.port.write(buf)
+        self.send(self.encoder.raw, int(func), data)
 
     def set_led(self, on_time, off_time, repeat=1, led_id=1):
         on_time = int(on_time*1000)
         off_time = int(off_time*1000)
-        self.buf_write(PacketFunction.PACKET_FUNC_LED, struct.pack("<BHHH", led_id, on_time, off_time, repeat))
+        self.send(self.encoder.led, led_id, on_time, off_time, repeat)
 
     def set_buzzer(self, freq, on_time, off_time, repeat=1):
         on_time = int(on_time*1000)
         off_time = int(off_time*1000)
-        self.buf_write(PacketFunction.PACKET_FUNC_BUZZER, struct.pack("<HHHH", freq, on_time, off_time, repeat))
+        self.send_latest(('buzzer', ), self.encoder.buzzer, freq, on_time, off_time, repeat)
 
     def set_motor_speed(self, speeds):
-        data = [0x01, len(speeds)]
-        for i in speeds:
-            data.extend(struct.pack("<Bf", int(i[0] - 1), float(i[1])))
-        self.buf_write(PacketFunction.PACKET_FUNC_MOTOR, data)
+        self.send_latest(('motor', ) + tuple(i[0] for i in speeds), self.encoder.motor_speed, speeds,
+                         urgent=all(i[1] == 0 for i in speeds))
 
     def set_oled_text(self, line, text):
-        data = [line, len(text)] # 子命令为 0x01 设置 SSID, 第二个字节是字符串长度，该长度包含'\0'字符串结束符
-        data.extend(bytes(text, encoding='utf-8'))
-        self.buf_write(PacketFunction.PACKET_FUNC_OLED, data)
+        self.send(self.encoder.oled_text, line, text)
 
     def set_rgb(self, pixels):
-        data = [0x01, len(pixels), ]
-        for index, r, g, b in pixels:
-            data.extend(struct.pack("<BBBB", int(index - 1), int(r), int(g), int(b)))
-        self.buf_write(PacketFunction.PACKET_FUNC_RGB, data)
+        self.send_latest(('rgb', ) + tuple(i[0] for i in pixels), self.encoder.rgb, pixels)
 
     def set_motor_duty(self, dutys):
-        data = [0x05, len(dutys)]
-        for i in dutys:
-            data.extend(struct.pack("<Bf", int(i[0] - 1), float(i[1])))
-        self.buf_write(PacketFunction.PACKET_FUNC_MOTOR, data)
+        # 所有电机停止的命令优先发送
+        self.send_latest(('motor', ) + tuple(i[0] for i in dutys), self.encoder.motor_duty, dutys,
+                         urgent=all(i[1] == 0 for i in dutys))
 
     def pwm_servo_set_position(self, duration, positions):
-        duration = int(duration * 1000)
-        data = [0x01, duration & 0xFF, 0xFF & (duration >> 8), len(positions)]
-        for i in positions:
-            data.extend(struct.pack("<BH", i[0], i[1]))
-        self.buf_write(PacketFunction.PACKET_FUNC_PWM_SERVO, data)
+        self.send_latest(('pwm_servo', ) + tuple(i[0] for i in positions), self.encoder.pwm_servo_position, duration, positions)
     
     def pwm_servo_set_offset(self, servo_id, offset):
-        data = struct.pack("<BBb", 0x07, servo_id, int(offset))
-        self.buf_write(PacketFunction.PACKET_FUNC_PWM_SERVO, data)
+        self.send(self.encoder.encode, PacketEncoder.FUNC_PWM_SERVO, PacketEncoder.U8x2_I8, 0x07, servo_id, int(offset))
 
-    def pwm_servo_read_and_unpack(self, servo_id, cmd, unpack):
-        with self.servo_read_lock:
-            self.buf_write(PacketFunction.PACKET_FUNC_PWM_SERVO, [cmd, servo_id])
-            data = self.pwm_servo_queue.get(block=True)
-            servo_id, cmd, info = struct.unpack(unpack, data)
+    def servo_read_async(self, func, servo_id, cmd, unpack, timeout=None, retries=None):
+        # 返回Future, 超时和重试次数默认使用构造Board时的设置
+        send = functools.partial(self.send, self.encoder.encode, func, PacketEncoder.U8x2, cmd, servo_id)
+        return self.servo_reads.submit((func, cmd, servo_id), send, unpack, timeout, retries)
+
+    def servo_read_result(self, future):
+        # 同步读取接口在超时后返回None
+        try:
+            return future.result()
+        except TimeoutError:
+            return None
+
+    def pwm_servo_read_async(self, servo_id, cmd, unpack, timeout=None, retries=None):
+        unpacker = struct.Struct(unpack)
+        def unpack_info(data):
+            servo_id, cmd, info = unpacker.unpack(data)
             return info
+        return self.servo_read_async(PacketEncoder.FUNC_PWM_SERVO, servo_id, cmd, unpack_info, timeout, retries)
+
+    def pwm_servo_read_and_unpack(self, servo_id, cmd, unpack):
+        return self.servo_read_result(self.pwm_servo_read_async(servo_id, cmd, unpack))
+
+    def pwm_servo_read_many(self, servo_ids, field):
+        # 连续发出所有读取请求再统一等待应答, 返回{舵机ID: 结果}, 超时的舵机结果为None
+        cmd, unpack = self.pwm_servo_read_fields[field]
+        futures = [(i, self.pwm_servo_read_async(i, cmd, unpack)) for i in servo_ids]
+        return {i: self.servo_read_result(f) for i, f in futures}
 
     def pwm_servo_read_offset(self, servo_id):
-        return self.pwm_servo_read_and_unpack(servo_id, 0x09, "<BBb")
+        return self.pwm_servo_read_and_unpack(servo_id, *self.pwm_servo_read_fields['offset'])
 
     def pwm_servo_read_position(self, servo_id):
-        return self.pwm_servo_read_and_unpack(servo_id, 0x05, "<BBH")
-
-    def bus_servo_enable_torque(self, servo_id, enable):
-        if enable:
-            data = struct.pack("<BB", 0x0B, servo_id)
-        else:
-            data = struct.pack("<BB", 0x0C, servo_id)
-        self.buf_write(PacketFunction.PACKET_FUNC_BUS_SERVO, data)
-        time.sleep(0.02)
-
-    def bus_servo_set_id(self, servo_id_now, servo_id_new):
-        data = struct.pack("<BBB", 0x10, servo_id_now, servo_id_new)
-        self.buf_write(PacketFunction.PACKET_FUNC_BUS_SERVO, data)
-        time.sleep(0.02)
-
-    def bus_servo_set_offset(self, servo_id, offset):
-        data = struct.pack("<BBb", 0x20, servo_id, int(offset))
-        self.buf_write(PacketFunction.PACKET_FUNC_BUS_SERVO, data)
-        time.sleep(0.02)
-
-    def bus_servo_save_offset(self, servo_id):
-        data = struct.pack("<BB", 0x24, servo_id)
-        self.buf_write(PacketFunction.PACKET_FUNC_BUS_SERVO, data)
-        time.sleep(0.02)
-
-    def bus_servo_set_angle_limit(self, servo_id, limit):
-        data = struct.pack("<BBHH", 0x30, servo_id, int(limit[0]), int(limit[1]))
-        self.buf_write(PacketFunction.PACKET_FUNC_BUS_SERVO, data)
-        time.sleep(0.02)
-
-    def bus_servo_set_vin_limit(self, servo_id, limit):
-        data = struct.pack("<BBHH", 0x34, servo_id, int(limit[0]), int(limit[1]))
-        self.buf_write(PacketFunction.PACKET_FUNC_BUS_SERVO, data)
-        time.sleep(0.02)
-
-    def bus_servo_set_temp_limit(self, servo_id, limit):
-        data = struct.pack("<BBb", 0x38, servo_id, int(limit))
-        self.buf_write(PacketFunction.PACKET_FUNC_BUS_SERVO, data)
-        time.sleep(0.02)
+        return self.pwm_servo_read_and_unpack(servo_id, *self.pwm_servo_read_fields['position'])
+
+    # 总线舵机配置, 由BusServoConfig按舵机ID排队发送并读回校验, 返回Future, 结果为是否成功
+    # wait为True时等到命令写入发送队列再返回; 批量配置时用wait=False, 再用gather_futures等待全部完成
+    def bus_servo_config(self, servo_id, packer, values, verify=None, wait=True):
+        if verify is not None:
+            field, expected = verify
+            verify_id = servo_id
+            if field == 'id':
+                verify_id = expected[0]
+            cmd, unpack = self.bus_servo_read_fields[field]
+            verify = (verify_id, cmd, unpack, expected)
+        return self.servo_config.submit(servo_id, packer, values, verify, wait)
+
+    def bus_servo_enable_torque(self, servo_id, enable, wait=True):
+        return self.bus_servo_config(servo_id, PacketEncoder.U8x2, (0x0B if enable else 0x0C, servo_id),
+                                     ('torque_state', [1 if enable else 0]), wait)
+
+    def bus_servo_set_id(self, servo_id_now, servo_id_new, wait=True):
+        return self.bus_servo_config(servo_id_now, PacketEncoder.U8x3, (0x10, servo_id_now, servo_id_new),
+                                     ('id', [servo_id_new]), wait)
+
+    def bus_servo_set_offset(self, servo_id, offset, wait=True):
+        return self.bus_servo_config(servo_id, PacketEncoder.U8x2_I8, (0x20, servo_id, int(offset)),
+                                     ('offset', [int(offset)]), wait)
+
+    def bus_servo_save_offset(self, servo_id, wait=True):
+        return self.bus_servo_config(servo_id, PacketEncoder.U8x2, (0x24, servo_id), None, wait)
+
+    def bus_servo_set_angle_limit(self, servo_id, limit, wait=True):
+        return self.bus_servo_config(servo_id, PacketEncoder.U8x2_U16x2, (0x30, servo_id, int(limit[0]), int(limit[1])),
+                                     ('angle_limit', [int(limit[0]), int(limit[1])]), wait)
+
+    def bus_servo_set_vin_limit(self, servo_id, limit, wait=True):
+        return self.bus_servo_config(servo_id, PacketEncoder.U8x2_U16x2, (0x34, servo_id, int(limit[0]), int(limit[1])),
+                                     ('vin_limit', [int(limit[0]), int(limit[1])]), wait)
+
+    def bus_servo_set_temp_limit(self, servo_id, limit, wait=True):
+        return self.bus_servo_config(servo_id, PacketEncoder.U8x2_I8, (0x38, servo_id, int(limit)),
+                                     ('temp_limit', [int(limit)]), wait)
+
+    def servo_config_stats(self):
+        return self.servo_config.stats()
 
     def bus_servo_stop(self, servo_id):
-        data = [0x03, len(servo_id)] 
-        data.extend(struct.pack("<"+'B'*len(servo_id), *servo_id))
-        self.buf_write(PacketFunction.PACKET_FUNC_BUS_SERVO, data)
+        self.send(self.encoder.bus_servo_stop, servo_id)
 
     def bus_servo_set_position(self, duration, positions):
-        duration = int(duration * 1000)
-        data = [0x01, duration & 0xFF, 0xFF & (duration >> 8), len(positions)] # 0x00 is bus servo sub command
-        for i in positions:
-            data.extend(struct.pack("<BH", i[0], i[1]))
-        self.buf_write(PacketFunction.PACKET_FUNC_BUS_SERVO, data)
+        self.send(self.encoder.bus_servo_position, duration, positions)
 
-    def bus_servo_read_and_unpack(self, servo_id, cmd, unpack):
-        with self.servo_read_lock:
-            self.buf_write(PacketFunction.PACKET_FUNC_BUS_SERVO, [cmd, servo_id])
-            data = self.bus_servo_queue.get(block=True)
-            servo_id, cmd, success, *info = struct.unpack(unpack, data)
+    def bus_servo_read_async(self, servo_id, cmd, unpack, timeout=None, retries=None):
+        unpacker = struct.Struct(unpack)
+        def unpack_info(data):
+            servo_id, cmd, success, *info = unpacker.unpack(data)
             if success == 0:
                 return info
+        return self.servo_read_async(PacketEncoder.FUNC_BUS_SERVO, servo_id, cmd, unpack_info, timeout, retries)
+
+    def bus_servo_read_and_unpack(self, servo_id, cmd, unpack):
+        return self.servo_read_result(self.bus_servo_read_async(servo_id, cmd, unpack))
+
+    def servo_read_stats(self):
+        return self.servo_reads.stats()
+
+    def bus_servo_read_many(self, servo_ids, field):
+        # 连续发出所有读取请求再统一等待应答, 返回{舵机ID: 结果}, 失败或超时的舵机结果为None
+        cmd, unpack = self.bus_servo_read_fields[field]
+        futures = [(i, self.bus_servo_read_async(i, cmd, unpack)) for i in servo_ids]
+        return {i: self.servo_read_result(f) for i, f in futures}
 
     def bus_servo_read_id(self, servo_id=254):
-        return self.bus_servo_read_and_unpack(servo_id, 0x12, "<BBbB")
+        return self.bus_servo_read_and_unpack(servo_id, *self.bus_servo_read_fields['id'])
 
     def bus_servo_read_offset(self, servo_id):
-        return self.bus_servo_read_and_unpack(servo_id, 0x22, "<BBbb")
+        return self.bus_servo_read_and_unpack(servo_id, *self.bus_servo_read_fields['offset'])
     
     def bus_servo_read_position(self, servo_id):
-        return self.bus_servo_read_and_unpack(servo_id, 0x05, "<BBbh")
+        return self.bus_servo_read_and_unpack(servo_id, *self.bus_servo_read_fields['position'])
 
     def bus_servo_read_vin(self, servo_id):
-        return self.bus_servo_read_and_unpack(servo_id, 0x07, "<BBbH")
+        return self.bus_servo_read_and_unpack(servo_id, *self.bus_servo_read_fields['vin'])
     
     def bus_servo_read_temp(self, servo_id):
-        return self.bus_servo_read_and_unpack(servo_id, 0x09, "<BBbB")
+        return self.bus_servo_read_and_unpack(servo_id, *self.bus_servo_read_fields['temp'])
 
     def bus_servo_read_temp_limit(self, servo_id):
-        return self.bus_servo_read_and_unpack(servo_id, 0x3A, "<BBbB")
+        return self.bus_servo_read_and_unpack(servo_id, *self.bus_servo_read_fields['temp_limit'])
 
     def bus_servo_read_angle_limit(self, servo_id):
-        return self.bus_servo_read_and_unpack(servo_id, 0x32, "<BBb2H")
+        return self.bus_servo_read_and_unpack(servo_id, *self.bus_servo_read_fields['angle_limit'])
 
     def bus_servo_read_vin_limit(self, servo_id):
-        return self.bus_servo_read_and_unpack(servo_id, 0x36, "<BBb2H")
+        return self.bus_servo_read_and_unpack(servo_id, *self.bus_servo_read_fields['vin_limit'])
 
     def bus_servo_read_torque_state(self, servo_id):
-        return self.bus_servo_read_and_unpack(servo_id, 0x0D, "<BBbb")
+        return self.bus_servo_read_and_unpack(servo_id, *self.bus_servo_read_fields['torque_state'])
 
     def enable_reception(self, enable=True):
         self.enable_recv = enable
 
+    def close(self):
+        # 发出排队的命令后停止所有后台线程再关闭串口, 共享的Board由release_board()关闭
+        if not self.running:
+            return
+        self.servo_config.close()
+        self.scheduler.flush()
+        self.scheduler.close()
+        self.servo_reads.close()
+        self.stop_capture()
+        with self.dispatch_cond:
+            self.running = False
+            self.dispatch_cond.notify_all()
+        if self.dispatch_thread is not None:
+            self.dispatch_thread.join(1)
+        self.port.cancel_read()
+        self.recv_thread.join(1)
+        self.port.close()
+
     def recv_task(self):
-        while True:
+        while self.running:
             if self.enable_recv:
-                recv_data = self.port.read()
+                # 一次读出缓冲区中的全部数据, 没有数据时阻塞等待至少1个字节
+                recv_data = self.port.read(self.port.in_waiting or 1)
                 if recv_data:
-                    for dat in recv_data:
-                        # print("%0.2X "%dat)
-                        if self.state == PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE1:
-                            if dat == 0xAA:
-                                self.state = PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE2
-                            continue
-                        elif self.state == PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE2:
-                            if dat == 0x55:
-                                self.state = PacketControllerState.PACKET_CONTROLLER_STATE_FUNCTION
-                            else:
-                                self.state = PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE1
-                            continue
-                        elif self.state == PacketControllerState.PACKET_CONTROLLER_STATE_FUNCTION:
-                            if dat < int(PacketFunction.PACKET_FUNC_NONE):
-                                self.frame = [dat, 0]
-                                self.state = PacketControllerState.PACKET_CONTROLLER_STATE_LENGTH
-                            else:
-                                self.frame = []
-                                self.state = PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE1
-                            continue
-                        elif self.state == PacketControllerState.PACKET_CONTROLLER_STATE_LENGTH:
-                            self.frame[1] = dat
-                            self.recv_count = 0
-                            if dat == 0:
-                                self.state = PacketControllerState.PACKET_CONTROLLER_STATE_CHECKSUM
-                            else:
-                                self.state = PacketControllerState.PACKET_CONTROLLER_STATE_DATA
-                            continue
-                        elif self.state == PacketControllerState.PACKET_CONTROLLER_STATE_DATA:
-                            self.frame.append(dat)
-                            self.recv_count += 1
-                            if self.recv_count >= self.frame[1]:
-                                self.state = PacketControllerState.PACKET_CONTROLLER_STATE_CHECKSUM
-                            continue
-                        elif self.state == PacketControllerState.PACKET_CONTROLLER_STATE_CHECKSUM:
-                            crc8 = checksum_crc8(bytes(self.frame))
-                            if crc8 == dat:
-                                func = PacketFunction(self.frame[0])
-                                data = bytes(self.frame[2:])
-                                if func in self.parsers:
-                                    self.parsers[func](data)
-                            else:
-                                print("校验失败")
-                            self.state = PacketControllerState.PACKET_CONTROLLER_STATE_STARTBYTE1
-                            continue
+                    capture = self.capture
+                    if capture is not None:
+                        capture.record(traffic_log.RX, recv_data)
+                    self.parser.feed(recv_data)
             else:
                 time.sleep(0.01)
-        self.port.close()
-        print("END...")
+
+# 进程内共享的扩展板连接, 同一个串口只能有一个接收线程, 否则数据包会被几个线程分别读走
+shared_lock = threading.Lock()
+shared_board = None
+shared_refs = 0
+
+class BoardHandle:
+    # 共享Board的引用句柄, 属性和方法都转发给Board, 最后一个句柄释放时关闭串口
+    def __init__(self, board):
+        self.board = board
+        self.released = False
+
+    def __getattr__(self, name):
+        return getattr(self.board, name)
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            release_board()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def acquire_board(device="/dev/ttyAMA0", baudrate=1000000, **kwargs):
+    # 第一次调用时创建Board并开始接收, 之后返回同一个Board的新句柄, 参数只在创建时使用
+    # board_broker守护进程在运行时通过它访问扩展板, 这样多个进程可以同时使用
+    global shared_board, shared_refs
+    from HiwonderSDK import board_broker
+    with shared_lock:
+        if shared_board is None:
+            if device == "/dev/ttyAMA0" and board_broker.broker_running():
+                try:
+                    shared_board = board_broker.BrokerBoard(**kwargs)
+                except OSError as e:  # 守护进程已经退出, 只留下了套接字文件
+                    print('board broker not available (%s), opening %s directly' % (e, device))
+            if shared_board is None:
+                shared_board = Board(device, baudrate, **kwargs)
+            shared_board.enable_reception()
+        shared_refs += 1
+        return BoardHandle(shared_board)
+
+def release_board():
+    global shared_board, shared_refs
+    with shared_lock:
+        if shared_refs == 0:
+            return
+        shared_refs -= 1
+        if shared_refs == 0:
+            shared_board.close()
+            shared_board = None
 
 def bus_servo_test(board):
     board.bus_servo_set_position(1, [[1, 500], [2, 500]])
@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+# coding=utf8
+import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import time
+import argparse
+import HiwonderSDK.ros_robot_controller_sdk as rrc
+from HiwonderSDK.virtual_board import VirtualBoard
+
+# 读取6个总线舵机位置的耗时对比: 逐个读取 vs bus_servo_read_many一次发出全部请求
+# 使用虚拟扩展板, 不需要连接硬件
+
+def measure(read, count):
+    times = []
+    for _ in range(count):
+        t = time.perf_counter()
+        read()
+        times.append(time.perf_counter() - t)
+    times.sort()
+    return sum(times) / len(times) * 1000, times[int(len(times) * 0.95) - 1] * 1000
+
+if __name__ == '__main__':
+    arg = argparse.ArgumentParser(description='Bulk servo read latency benchmark')
+    arg.add_argument('--count', type=int, default=200)
+    arg.add_argument('--reply-delay', type=float, default=2.0, help='virtual board reply delay in ms')
+    arg.add_argument('--sequential', action='store_true', help='virtual board answers one request at a time')
+    args = arg.parse_args()
+
+    virtual = VirtualBoard(reply_delay=args.reply_delay / 1000, sequential=args.sequential).start()
+    board = rrc.Board(device=virtual.device)
+    board.enable_reception()
+    ids = range(1, 7)
+
+    def one_by_one():
+        return {i: board.bus_servo_read_position(i) for i in ids}
+
+    def many():
+        return board.bus_servo_read_many(ids, 'position')
+
+    assert one_by_one() == many()
+    for name, read in (('one by one', one_by_one), ('read_many', many)):
+        avg, p95 = measure(read, args.count)
+        print('%-12s avg %7.2f ms  p95 %7.2f ms' % (name, avg, p95))
+    print(board.servo_read_stats())
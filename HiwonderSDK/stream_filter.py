@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+# coding=utf8
+import math
+import bisect
+
+# 传感器数据流滤波, 每来一个数据更新一次, 只保存最近size个数据
+# 模式:
+#   'median' 最近size个数据的中值
+#   'sigma'  最近size个数据中与均值相差不超过sigma倍标准差的数据的均值(原来避障用pandas计算的方式)
+#            按和pandas相同的顺序计算均值, 样本标准差和保留数据的均值, 结果与原来逐位相同;
+#            唯一的区别是只有1个数据时pandas的标准差为NaN, 结果为NaN, 这里返回这个数据
+#   'ewma'   指数加权移动平均, alpha越大越跟随新数据
+# 窗口很小(默认5个), 均值和方差每次直接对窗口计算, 中值使用保持排序的列表
+
+class StreamFilter:
+    modes = ('median', 'sigma', 'ewma')
+
+    def __init__(self, size=5, mode='sigma', sigma=1.0, alpha=0.3):
+        if mode not in self.modes:
+            raise ValueError('unknown filter mode: %s' % mode)
+        self.size = size
+        self.mode = mode
+        self.sigma = sigma
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        self.buf = [0.0] * self.size  # 环形缓冲区
+        self.index = 0
+        self.count = 0        # 窗口内的数据个数
+        self.sorted = []      # 窗口内数据排序后的列表, 用于求中值
+        self.ewma = None
+        self.value = None
+
+    def update(self, x):
+        # 加入一个数据, 返回滤波后的值
+        x = float(x)
+        if self.count == self.size:
+            del self.sorted[bisect.bisect_left(self.sorted, self.buf[self.index])]
+        else:
+            self.count += 1
+        self.buf[self.index] = x
+        self.index = (self.index + 1) % self.size
+        bisect.insort(self.sorted, x)
+        self.ewma = x if self.ewma is None else self.ewma + self.alpha * (x - self.ewma)
+
+        if self.mode == 'median':
+            self.value = self.median()
+        elif self.mode == 'sigma':
+            self.value = self.clipped_mean()
+        else:
+            self.value = self.ewma
+        return self.value
+
+    def window(self):
+        # 窗口内的数据, 按时间先后排列
+        if self.count < self.size:
+            return self.buf[:self.count]
+        return self.buf[self.index:] + self.buf[:self.index]
+
+    def mean(self):
+        window = self.window()
+        return sum(window) / len(window) if window else None
+
+    def std(self, mean=None):
+        # 样本标准差(n-1), 和pandas的std()一致, 少于2个数据时为0
+        if self.count < 2:
+            return 0.0
+        window = self.window()
+        if mean is None:
+            mean = sum(window) / len(window)
+        return math.sqrt(sum((i - mean) ** 2 for i in window) / (len(window) - 1))
+
+    def median(self):
+        n = self.count
+        if n == 0:
+            return None
+        if n % 2:
+            return self.sorted[n // 2]
+        return (self.sorted[n // 2 - 1] + self.sorted[n // 2]) / 2
+
+    def clipped_mean(self):
+        # 和原来的pandas代码相同: 按时间顺序求和, 保留与均值之差不超过sigma倍标准差的数据再求平均
+        window = self.window()
+        if not window:
+            return None
+        mean = sum(window) / len(window)
+        limit = self.sigma * self.std(mean)
+        kept = [i for i in window if abs(i - mean) <= limit]
+        return sum(kept) / len(kept) if kept else mean
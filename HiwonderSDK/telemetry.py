@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+import threading
+import numpy as np
+
+def percentile(data, q):
+    # 已排序数据的q分位数(0~1), 取第int(n*q)个数据, 没有数据时返回0
+    if not data:
+        return 0
+    return data[max(int(len(data) * q) - 1, 0)]
+
+def latency_summary(samples):
+    # 延迟样本的 (平均值, 95%分位数, 最大值), 没有样本时全为0
+    if not samples:
+        return (0, 0, 0)
+    data = sorted(samples)
+    return (sum(data) / len(data), percentile(data, 0.95), data[-1])
+
+class TelemetryRing:
+    # 固定大小的上报数据环形缓冲区, 每行为 时间戳 + 数据
+    # 每个样本同时写入i和i+size两行, 因此任意不超过size个的最近样本在内存中都是连续的,
+    # latest/since/window返回只读的视图而不拷贝数据
+    # 视图在被之后写入的size个样本覆盖之前有效, 需要长期保存时请自行copy()
+    def __init__(self, columns, size=256):
+        self.size = size
+        self.columns = columns
+        self.data = np.zeros((2 * size, columns + 1), dtype=np.float64)
+        self.lock = threading.Lock()
+        self.count = 0      # 写入的样本总数
+        self.read_count = 0  # 已被读取过的样本数
+        self.taken = 0      # take()读到的位置
+        self.overruns = 0   # 还没被读取就被覆盖的样本数
+        self.dropped = 0    # 格式错误被丢弃的数据包数
+
+    def append(self, timestamp, values):
+        row = (timestamp, *values)
+        with self.lock:
+            i = self.count % self.size
+            self.data[i] = row
+            self.data[i + self.size] = row
+            self.count += 1
+            if self.count - self.read_count > self.size:
+                self.overruns += 1
+                self.read_count += 1
+
+    def view(self, n):
+        # n个最近的样本, 需要在锁内调用
+        end = self.count % self.size + self.size
+        self.read_count = self.count
+        view = self.data[end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def latest(self):
+        # 最新的一个样本, 没有数据时返回None
+        with self.lock:
+            if self.count == 0:
+                return None
+            return self.view(1)[0]
+
+    def take(self):
+        # 有新样本时返回最新的一个, 否则返回None, 用于兼容原来get_xxx()的轮询方式
+        with self.lock:
+            if self.count == self.taken:
+                return None
+            self.taken = self.count
+            return self.view(1)[0]
+
+    def window(self, n=None):
+        # 最近n个样本, 按时间先后排列
+        with self.lock:
+            available = min(self.count, self.size)
+            n = available if n is None else min(n, available)
+            return self.view(n)
+
+    def since(self, timestamp):
+        # 时间戳大于timestamp的所有样本(最多size个)
+        with self.lock:
+            view = self.view(min(self.count, self.size))
+            return view[np.searchsorted(view[:, 0], timestamp, side='right'):]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'count': self.count,
+                'overruns': self.overruns,
+                'dropped': self.dropped
+            }
@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+# coding=utf8
+import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import mmap
+import time
+import struct
+import argparse
+import threading
+import collections
+
+# 扩展板串口收发数据的二进制记录和回放
+# 文件格式: 8字节文件头, 之后每条记录为 单调时钟时间戳(ns, u64) 方向(u8) 长度(u16) 原始数据
+# 录制: board.start_capture('board.log') ... board.stop_capture()
+# 回放: python3 traffic_log.py board.log --realtime
+
+MAGIC = b'RRCLOG1\n'
+RECORD = struct.Struct('<QBH')
+RX = 0
+TX = 1
+MAX_CHUNK = 0xFFFF
+
+class TrafficRecorder:
+    # 串口线程只把数据放进队列, 由后台线程写入带大缓冲区的文件, 不阻塞收发
+    def __init__(self, path, buffer_size=1 << 20):
+        self.path = path
+        self.file = open(path, 'wb', buffering=buffer_size)
+        self.file.write(MAGIC)
+        self.queue = collections.deque()
+        self.event = threading.Event()
+        self.running = True
+        self.records = 0
+        self.bytes = 0
+        self.thread = threading.Thread(target=self.write_task, daemon=True)
+        self.thread.start()
+
+    def record(self, direction, data):
+        # data可能是编码器缓冲区的视图, 需要立即拷贝
+        t = time.monotonic_ns()
+        for i in range(0, len(data), MAX_CHUNK):
+            self.queue.append((t, direction, bytes(data[i:i + MAX_CHUNK])))
+        self.event.set()
+
+    def write_task(self):
+        while True:
+            self.event.wait(0.1)
+            self.event.clear()
+            while self.queue:
+                t, direction, data = self.queue.popleft()
+                self.file.write(RECORD.pack(t, direction, len(data)))
+                self.file.write(data)
+                self.records += 1
+                self.bytes += len(data)
+            if not self.running:
+                break
+        self.file.close()
+
+    def close(self):
+        self.running = False
+        self.event.set()
+        self.thread.join()
+
+class TrafficLog:
+    # 通过mmap读取记录文件, 迭代得到的数据是文件映射的memoryview, 不拷贝
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError('%s is not a board traffic log' % path)
+        self.view = memoryview(self.map)
+
+    def __iter__(self):
+        view = self.view
+        offset = len(MAGIC)
+        end = len(view) - RECORD.size
+        while offset <= end:
+            t, direction, length = RECORD.unpack_from(view, offset)
+            offset += RECORD.size
+            if offset + length > len(view):  # 录制中断时最后一条记录可能不完整
+                break
+            yield t, direction, view[offset:offset + length]
+            offset += length
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def replay(self, feed, direction=RX, realtime=False, speed=1.0):
+        # 把记录的数据依次交给feed(data, 录制时间(ns)), realtime为True时按原来的时间间隔(除以speed)回放
+        # 返回回放的记录数和字节数
+        records = 0
+        size = 0
+        start = None
+        for t, d, data in self:
+            if d != direction:
+                continue
+            if realtime:
+                if start is None:
+                    start = (t, time.monotonic_ns())
+                delay = (t - start[0]) / speed - (time.monotonic_ns() - start[1])
+                if delay > 0:
+                    time.sleep(delay / 1e9)
+            feed(data, t)
+            records += 1
+            size += len(data)
+        return records, size
+
+if __name__ == '__main__':
+    import HiwonderSDK.ros_robot_controller_sdk as rrc
+
+    arg = argparse.ArgumentParser(description='Replay a recorded board traffic log through the packet parser')
+    arg.add_argument('path')
+    arg.add_argument('--tx', action='store_true', help='replay the transmitted side instead of the received side')
+    arg.add_argument('--realtime', action='store_true', help='keep the original timing')
+    arg.add_argument('--speed', type=float, default=1.0, help='time scale for --realtime')
+    arg.add_argument('--repeat', type=int, default=1, help='replay the log N times (profiling)')
+    args = arg.parse_args()
+
+    with TrafficLog(args.path) as log:
+        # 使用和Board相同的解析器和上报数据解码函数
+        stats = rrc.LinkStats()
+        unpackers = {
+            rrc.PacketFunction.PACKET_FUNC_SYS: rrc.unpack_battery,
+            rrc.PacketFunction.PACKET_FUNC_KEY: rrc.unpack_key,
+            rrc.PacketFunction.PACKET_FUNC_IMU: rrc.unpack_imu,
+            rrc.PacketFunction.PACKET_FUNC_GAMEPAD: rrc.unpack_gamepad,
+            rrc.PacketFunction.PACKET_FUNC_SBUS: rrc.unpack_sbus
+        }
+        parser = rrc.PacketParser({func: lambda data, stamp, unpack=unpack: unpack(data)
+                                   for func, unpack in unpackers.items()}, stats)
+        t = time.perf_counter()
+        for _ in range(args.repeat):
+            records, size = log.replay(parser.feed, TX if args.tx else RX, args.realtime, args.speed)
+        t = time.perf_counter() - t
+        print('%d records, %d bytes per pass, %.3f s, %.2f MB/s' % (records, size, t, size * args.repeat / t / 1e6))
+        snapshot = stats.snapshot()
+        for name, info in snapshot['functions'].items():
+            print('%-10s %8d packets  interval %.2f ms' % (name, info['packets_in'], info['interval_ms']))
+        print('crc_errors %d  resyncs %d  skipped_bytes %d' % (
+            snapshot['crc_errors'], snapshot['resyncs'], snapshot['skipped_bytes']))
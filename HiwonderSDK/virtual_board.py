@@ -0,0 +1,315 @@
+#!/usr/bin/python3
+# coding=utf8
+import sys
+import os
+
+# Get the parent directory of the current file
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import pty
+import tty
+import math
+import time
+import heapq
+import random
+import struct
+import argparse
+import threading
+import HiwonderSDK.ros_robot_controller_sdk as rrc
+
+# 虚拟STM32扩展板, 通过伪终端实现0xAA 0x55通信协议, 用于没有扩展板时测试和性能测试
+# 接收电机, 舵机, RGB, 蜂鸣器等命令并记录状态, 应答总线/PWM舵机读取,
+# 按设定频率上报电池, IMU, 按键, 手柄和SBUS数据, 可按需注入校验错误
+# board = rrc.Board(device=VirtualBoard().start().device)
+# 单独运行: python3 virtual_board.py --imu-rate 100 --link /tmp/ttyVirtualBoard
+
+class VirtualBoard:
+    def __init__(self, reply_delay=0.002, sequential=False, battery_rate=1, imu_rate=0,
+                 key_rate=0, gamepad_rate=0, sbus_rate=0, crc_error_rate=0):
+        # reply_delay: 舵机读取请求到应答的时间
+        # sequential: 为True时按顺序逐个处理读取请求, 模拟单总线依次访问舵机
+        # xxx_rate: 各类数据的上报频率(Hz), 为0时不上报
+        # crc_error_rate: 发出的数据包中校验错误的比例
+        self.reply_delay = reply_delay
+        self.sequential = sequential
+        self.rates = {
+            'battery': battery_rate,
+            'imu': imu_rate,
+            'key': key_rate,
+            'gamepad': gamepad_rate,
+            'sbus': sbus_rate
+        }
+        self.crc_error_rate = crc_error_rate
+        self.crc_errors_pending = 0
+        self.random = random.Random(0)
+        self.commands = {}  # 功能码 -> 收到的命令数
+        self.reports = {kind: 0 for kind in self.rates}
+        self.start_time = time.monotonic()
+
+        self.motors = {i: 0.0 for i in range(1, 5)}
+        self.motor_mode = None  # 'duty' / 'speed'
+        self.rgb = {i: (0, 0, 0) for i in range(1, 3)}
+        self.buzzer = None  # (freq, on_time, off_time, repeat)
+        self.led = None
+        self.oled = {}
+        self.battery = 7600
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.device = os.ttyname(self.slave)
+
+        self.bus_servos = {i: {'position': 500, 'offset': 0, 'vin': 7600, 'temp': 35,
+                               'temp_limit': 85, 'angle_limit': (0, 1000), 'vin_limit': (4500, 14500),
+                               'torque': 0} for i in range(1, 7)}
+        self.pwm_servos = {i: {'position': 1500, 'offset': 0} for i in range(1, 5)}
+
+        self.lock = threading.Condition()
+        self.outgoing = []  # (发送时间, 序号, 数据包)
+        self.sequence = 0
+        self.busy_until = 0
+        handlers = {
+            rrc.PacketFunction.PACKET_FUNC_LED: self.on_led,
+            rrc.PacketFunction.PACKET_FUNC_BUZZER: self.on_buzzer,
+            rrc.PacketFunction.PACKET_FUNC_MOTOR: self.on_motor,
+            rrc.PacketFunction.PACKET_FUNC_PWM_SERVO: self.on_pwm_servo,
+            rrc.PacketFunction.PACKET_FUNC_BUS_SERVO: self.on_bus_servo,
+            rrc.PacketFunction.PACKET_FUNC_OLED: self.on_oled,
+            rrc.PacketFunction.PACKET_FUNC_RGB: self.on_rgb,
+        }
+        self.parser = rrc.PacketParser({func: self.counted(func, handler) for func, handler in handlers.items()})
+
+    def counted(self, func, handler):
+        def handle(data, stamp):
+            self.commands[func] = self.commands.get(func, 0) + 1
+            try:
+                handler(data)
+            except (IndexError, struct.error) as e:
+                print('virtual board: bad %s packet: %s' % (func.name, e))
+        return handle
+
+    def start(self):
+        threading.Thread(target=self.recv_task, daemon=True).start()
+        threading.Thread(target=self.send_task, daemon=True).start()
+        threading.Thread(target=self.report_task, daemon=True).start()
+        return self
+
+    def inject_crc_errors(self, count=1):
+        # 接下来发出的count个数据包校验错误
+        with self.lock:
+            self.crc_errors_pending += count
+
+    def packet(self, func, data):
+        buf = bytes([int(func), len(data)]) + data
+        crc = rrc.checksum_crc8(buf)
+        if self.crc_errors_pending > 0 or (self.crc_error_rate and self.random.random() < self.crc_error_rate):
+            self.crc_errors_pending = max(0, self.crc_errors_pending - 1)
+            crc ^= 0xFF
+        return b'\xAA\x55' + buf + bytes([crc])
+
+    def send(self, func, data, delay=0):
+        with self.lock:
+            now = time.monotonic()
+            if delay and self.sequential:
+                self.busy_until = max(self.busy_until, now) + delay
+                at = self.busy_until
+            else:
+                at = now + delay
+            self.sequence += 1
+            heapq.heappush(self.outgoing, (at, self.sequence, self.packet(func, data)))
+            self.lock.notify()
+
+    def reply(self, func, data):
+        self.send(func, data, self.reply_delay)
+
+    def on_led(self, data):
+        self.led = struct.unpack('<BHHH', data)
+
+    def on_buzzer(self, data):
+        self.buzzer = struct.unpack('<HHHH', data)
+
+    def on_motor(self, data):
+        cmd, count = data[0], data[1]
+        self.motor_mode = 'duty' if cmd == 0x05 else 'speed'
+        for i in range(count):
+            motor_id, value = struct.unpack_from('<Bf', data, 2 + i * 5)
+            self.motors[motor_id + 1] = value
+
+    def on_oled(self, data):
+        self.oled[data[0]] = bytes(data[2:]).decode('utf-8', 'replace')
+
+    def on_rgb(self, data):
+        for i in range(data[1]):
+            index, r, g, b = struct.unpack_from('<BBBB', data, 2 + i * 4)
+            self.rgb[index + 1] = (r, g, b)
+
+    def on_bus_servo(self, data):
+        cmd = data[0]
+        func = rrc.PacketFunction.PACKET_FUNC_BUS_SERVO
+        if cmd == 0x01:  # 设置位置
+            duration, count = struct.unpack_from('<HB', data, 1)
+            for i in range(count):
+                servo_id, position = struct.unpack_from('<BH', data, 4 + i * 3)
+                if servo_id in self.bus_servos:
+                    self.bus_servos[servo_id]['position'] = position
+            return
+        if cmd == 0x03:  # 停止
+            return
+        servo_id = data[1]
+        if servo_id == 254 and cmd == 0x12:
+            servo_id = min(self.bus_servos)
+        servo = self.bus_servos.get(servo_id)
+        if servo is None:  # 不存在的舵机不应答, 由主机超时处理
+            return
+        if cmd in (0x0B, 0x0C):
+            servo['torque'] = 1 if cmd == 0x0B else 0
+        elif cmd == 0x10:
+            self.bus_servos[data[2]] = self.bus_servos.pop(servo_id)
+        elif cmd == 0x20:
+            servo['offset'] = struct.unpack_from('<b', data, 2)[0]
+        elif cmd == 0x30:
+            servo['angle_limit'] = struct.unpack_from('<HH', data, 2)
+        elif cmd == 0x34:
+            servo['vin_limit'] = struct.unpack_from('<HH', data, 2)
+        elif cmd == 0x38:
+            servo['temp_limit'] = struct.unpack_from('<b', data, 2)[0]
+        elif cmd == 0x05:
+            self.reply(func, struct.pack('<BBbh', servo_id, cmd, 0, servo['position']))
+        elif cmd == 0x07:
+            self.reply(func, struct.pack('<BBbH', servo_id, cmd, 0, servo['vin']))
+        elif cmd == 0x09:
+            self.reply(func, struct.pack('<BBbB', servo_id, cmd, 0, servo['temp']))
+        elif cmd == 0x0D:
+            self.reply(func, struct.pack('<BBbb', servo_id, cmd, 0, servo['torque']))
+        elif cmd == 0x12:
+            self.reply(func, struct.pack('<BBbB', servo_id, cmd, 0, servo_id))
+        elif cmd == 0x22:
+            self.reply(func, struct.pack('<BBbb', servo_id, cmd, 0, servo['offset']))
+        elif cmd == 0x32:
+            self.reply(func, struct.pack('<BBb2H', servo_id, cmd, 0, *servo['angle_limit']))
+        elif cmd == 0x36:
+            self.reply(func, struct.pack('<BBb2H', servo_id, cmd, 0, *servo['vin_limit']))
+        elif cmd == 0x3A:
+            self.reply(func, struct.pack('<BBbB', servo_id, cmd, 0, servo['temp_limit']))
+
+    def on_pwm_servo(self, data):
+        cmd = data[0]
+        func = rrc.PacketFunction.PACKET_FUNC_PWM_SERVO
+        if cmd == 0x01:  # 设置位置
+            duration, count = struct.unpack_from('<HB', data, 1)
+            for i in range(count):
+                servo_id, position = struct.unpack_from('<BH', data, 4 + i * 3)
+                if servo_id in self.pwm_servos:
+                    self.pwm_servos[servo_id]['position'] = position
+            return
+        servo = self.pwm_servos.get(data[1])
+        if servo is None:
+            return
+        if cmd == 0x07:
+            servo['offset'] = struct.unpack_from('<b', data, 2)[0]
+        elif cmd == 0x05:
+            self.reply(func, struct.pack('<BBH', data[1], cmd, servo['position']))
+        elif cmd == 0x09:
+            self.reply(func, struct.pack('<BBb', data[1], cmd, servo['offset']))
+
+    def report(self, kind, t):
+        # 生成一条上报数据, 数值随时间平滑变化
+        self.reports[kind] += 1
+        if kind == 'battery':
+            load = sum(abs(v) for v in self.motors.values()) / 400
+            voltage = self.battery - int(600 * load) + self.random.randint(-10, 10)
+            self.send(rrc.PacketFunction.PACKET_FUNC_SYS, struct.pack('<BH', 0x04, voltage))
+        elif kind == 'imu':
+            noise = self.random.gauss
+            turn = (self.motors[2] + self.motors[4] - self.motors[1] - self.motors[3]) / 400
+            self.send(rrc.PacketFunction.PACKET_FUNC_IMU, struct.pack('<6f',
+                noise(0, 0.02), noise(0, 0.02), 9.8 + noise(0, 0.02),
+                noise(0, 0.5), noise(0, 0.5), turn * 90 + noise(0, 0.5)))
+        elif kind == 'key':
+            self.send(rrc.PacketFunction.PACKET_FUNC_KEY, bytes([1, rrc.PacketReportKeyEvents.KEY_EVENT_CLICK]))
+        elif kind == 'gamepad':
+            lx = int(100 * math.sin(t))
+            ly = int(100 * math.cos(t))
+            buttons = 0x0100 if int(t) % 2 else 0  # cross每秒按下/松开一次
+            self.send(rrc.PacketFunction.PACKET_FUNC_GAMEPAD, struct.pack('<HB4b', buttons, 0, lx, ly, 0, 0))
+        elif kind == 'sbus':
+            channels = [992 + int(800 * math.sin(t + i)) for i in range(16)]
+            self.send(rrc.PacketFunction.PACKET_FUNC_SBUS, struct.pack('<16hBBBB', *channels, 0, 0, 0, 0))
+
+    def report_task(self):
+        schedule = [(time.monotonic(), kind) for kind, rate in self.rates.items() if rate > 0]
+        heapq.heapify(schedule)
+        while schedule:
+            at, kind = schedule[0]
+            now = time.monotonic()
+            if at > now:
+                time.sleep(at - now)
+                continue
+            self.report(kind, now - self.start_time)
+            heapq.heapreplace(schedule, (at + 1.0 / self.rates[kind], kind))
+
+    def status(self):
+        return {
+            'commands': {rrc.PacketFunction(func).name[12:].lower(): n for func, n in self.commands.items()},
+            'reports': dict(self.reports),
+            'motors': dict(self.motors),
+            'rgb': dict(self.rgb),
+            'buzzer': self.buzzer,
+            'pwm_servos': {i: s['position'] for i, s in self.pwm_servos.items()},
+            'bus_servos': {i: s['position'] for i, s in self.bus_servos.items()}
+        }
+
+    def recv_task(self):
+        while True:
+            self.parser.feed(os.read(self.master, 4096))
+
+    def send_task(self):
+        while True:
+            with self.lock:
+                while not self.outgoing:
+                    self.lock.wait()
+                at, _, packet = self.outgoing[0]
+                now = time.monotonic()
+                if at > now:
+                    self.lock.wait(at - now)
+                    continue
+                heapq.heappop(self.outgoing)
+            os.write(self.master, packet)
+
+if __name__ == '__main__':
+    arg = argparse.ArgumentParser(description='Virtual STM32 controller board on a pseudo-terminal')
+    arg.add_argument('--reply-delay', type=float, default=2.0, help='servo read reply delay in ms')
+    arg.add_argument('--sequential', action='store_true', help='answer servo reads one at a time')
+    arg.add_argument('--battery-rate', type=float, default=1)
+    arg.add_argument('--imu-rate', type=float, default=100)
+    arg.add_argument('--key-rate', type=float, default=0)
+    arg.add_argument('--gamepad-rate', type=float, default=50)
+    arg.add_argument('--sbus-rate', type=float, default=0)
+    arg.add_argument('--crc-error-rate', type=float, default=0, help='fraction of sent packets with a bad checksum')
+    arg.add_argument('--link', help='create a symlink to the pty, e.g. /tmp/ttyVirtualBoard')
+    arg.add_argument('--status', type=float, default=5, help='print status every N seconds, 0 to disable')
+    args = arg.parse_args()
+
+    board = VirtualBoard(args.reply_delay / 1000, args.sequential, args.battery_rate, args.imu_rate,
+                         args.key_rate, args.gamepad_rate, args.sbus_rate, args.crc_error_rate).start()
+    if args.link:
+        if os.path.islink(args.link):
+            os.remove(args.link)
+        os.symlink(board.device, args.link)
+    print(board.device)
+
+    def stdin_task():
+        # 输入回车注入一个校验错误
+        for _ in iter(sys.stdin.readline, ''):
+            board.inject_crc_errors()
+    threading.Thread(target=stdin_task, daemon=True).start()
+    try:
+        while True:
+            time.sleep(args.status or 1)
+            if args.status:
+                print(board.status())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.link and os.path.islink(args.link):
+            os.remove(args.link)
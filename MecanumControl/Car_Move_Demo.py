@@ -41,5 +41,5 @@ if __name__ == '__main__':
     while start:
         chassis.set_velocity(50,270,0) # left movement only
         time.sleep(1)
-    chassis.set_velocity(0,0,0)  # 关闭所有电机
+    chassis.close()  # 关闭所有电机并释放扩展板
     print('已关闭')
@@ -47,7 +47,7 @@ if __name__ == '__main__':
         time.sleep(1)
         chassis.set_velocity(50,135,0)
         time.sleep(1)
-    chassis.set_velocity(0,0,0)  # 关闭所有电机
+    chassis.close()  # 关闭所有电机并释放扩展板
     print('已关闭')
 
         
@@ -43,7 +43,7 @@ if __name__ == '__main__':
         time.sleep(3)
         chassis.set_velocity(0,90,-0.3)# 逆时针旋转
         time.sleep(3)
-    chassis.set_velocity(0,0,0)  # 关闭所有电机
+    chassis.close()  # 关闭所有电机并释放扩展板
     print('已关闭')
 i
         
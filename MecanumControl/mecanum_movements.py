@@ -5,8 +5,9 @@ import time
 import HiwonderSDK.ros_robot_controller_sdk as rrc
 
 class MecanumMovements:
-    def __init__(self):
-        self.board = rrc.Board()
+    def __init__(self, board=None):
+        # 没有传入board时使用进程内共享的扩展板连接
+        self.board = board if board is not None else rrc.acquire_board()
         self.default_speed = 80
         
     def stop(self):
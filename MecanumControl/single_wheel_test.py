@@ -5,7 +5,7 @@ import time
 import HiwonderSDK.ros_robot_controller_sdk as rrc
 
 # Initialize the board
-board = rrc.Board()
+board = rrc.acquire_board()  # 共享的扩展板连接, 结束时release()
 
 try:
     # Test only motor 1 (front left wheel)
@@ -19,4 +19,5 @@ try:
 except KeyboardInterrupt:
     print("\nStopping motor...")
     board.set_motor_duty([[1, 0]])  # Stop the motor
-    print("Motor stopped") 
\ No newline at end of file
+    print("Motor stopped") 
+    board.release()
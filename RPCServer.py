@@ -10,6 +10,7 @@ from werkzeug.wrappers import Request, Response
 from werkzeug.serving import run_simple
 from jsonrpc import JSONRPCResponseManager, dispatcher
 import HiwonderSDK.mecanum as mecanum
+import HiwonderSDK.ros_robot_controller_sdk as rrc
 import Functions.Running as Running
 import Functions.lab_adjust as lab_adjust
 import Functions.ColorDetect as ColorDetect_
@@ -21,6 +22,7 @@ import Functions.FaceTracking as FaceTracking_
 import Functions.GestureRecognition as GestureRecognition_
 import Functions.LineFollower as LineFollower_
 import Functions.QuickMark as QuickMark_
+import Functions.GamepadTeleop as GamepadTeleop_
 
 if sys.version_info.major == 2:
     print('Please run this program with python3!')
@@ -39,6 +41,10 @@ board = None
 car = mecanum.MecanumChassis()
 
 def set_board():
+    # 所有模块使用同一个扩展板连接
+    car.board = board
+    for module in (Avoidance_, VisualPatrol_, ColorTracking_, FaceTracking_, GestureRecognition_, LineFollower_, QuickMark_, GamepadTeleop_):
+        module.car.board = board
     Avoidance_.board = board
     VisualPatrol_.board = board
     ColorDetect_.board = board
@@ -48,6 +54,7 @@ def set_board():
     GestureRecognition_.board = board
     LineFollower_.board = board
     QuickMark_.board = board
+    GamepadTeleop_.board = board
     ColorDetect_.initMove()
     board.set_buzzer(1900, 0.3, 0.7, 1)
 
@@ -120,7 +127,9 @@ def GetSonarDistance():
     global HWSONAR
     ret = (True, 0, 'GetSonarDistance')
     try:
-        ret = (True, HWSONAR.getDistance(), 'GetSonarDistance')
+        # 后台测距时返回滤波后的距离(mm)
+        dist = HWSONAR.getFilteredDistance()
+        ret = (True, HWSONAR.getDistance() if dist is None else int(round(dist)), 'GetSonarDistance')
     except:
         ret = (False, __RPC_E03, 'GetSonarDistance')
     return ret
@@ -130,7 +139,7 @@ def GetSonarDistance():
 def GetBatteryVoltage():
     ret = (True, 0, 'GetBatteryVoltage')
     try:
-        ret = (True, board.get_battery(), 'GetBatteryVoltage')
+        ret = (True, board.latest('battery'), 'GetBatteryVoltage')
     except Exception as e:
         print(e)
         ret = (False, __RPC_E03, 'GetBatteryVoltage')
@@ -150,8 +159,7 @@ def SetSonarRGB(index, r, g, b):
     global HWSONAR
     # print((r,g,b))
     if index == 0:
-        HWSONAR.setPixelColor(0, (r, g, b))
-        HWSONAR.setPixelColor(1, (r, g, b))
+        HWSONAR.setPixelColors((r, g, b), (r, g, b))
     else:
         HWSONAR.setPixelColor(index, (r, g, b))
     return (True, (r, g, b), 'SetSonarRGB')
@@ -189,6 +197,26 @@ def SetSonarDistanceThreshold(new_threshold=30):
 def GetSonarDistanceThreshold():
     return runbymainth(Avoidance_.getThreshold, ())
 
+# 获取避障反应时间 平均值, p95, 最大值(ms)
+@dispatcher.add_method
+def GetAvoidanceReactionTime():
+    return runbymainth(Avoidance_.getReactionTime, ())
+
+# 设置手柄遥控最大速度
+@dispatcher.add_method
+def SetTeleopSpeed(speed=60):
+    return runbymainth(GamepadTeleop_.setSpeed, (speed,))
+
+# 设置手柄遥控数据来源 'gamepad', 'sbus', 'auto'
+@dispatcher.add_method
+def SetTeleopSource(source='auto'):
+    return runbymainth(GamepadTeleop_.setSource, (source,))
+
+# 获取摇杆到电机命令的延时
+@dispatcher.add_method
+def GetTeleopLatency():
+    return runbymainth(GamepadTeleop_.getLatency, ())
+
 def runbymainth(req, pas):
     if callable(req):
         event = threading.Event()
@@ -254,8 +282,9 @@ def GetBusServosDeviation(args):
     if args != "readDeviation":
         return (False, __RPC_E01, 'GetBusServosDeviation')
     try:
+        devs = board.bus_servo_read_many(range(1, 7), 'offset')
         for i in range(1, 7):
-            dev = board.bus_servo_read_offset(i)
+            dev = devs[i]
             if dev is None:
                 dev = 999
             data.append(dev)
@@ -271,8 +300,10 @@ def SaveBusServosDeviation(args):
     if args != "downloadDeviation":
         return (False, __RPC_E01, 'SaveBusServosDeviation')
     try:
-        for i in range(1, 7):
-            dev = board.bus_servo_save_offset(i)
+        # 6个舵机同时保存, 不用逐个等待
+        batch = rrc.gather_futures(board.bus_servo_save_offset(i, wait=False) for i in range(1, 7))
+        if not all(batch.result(1)):
+            ret = (False, __RPC_E03, 'SaveBusServosDeviation')
     except Exception as e:
         print(e)
         ret = (False, __RPC_E03, 'SaveBusServosDeviation')
@@ -284,11 +315,14 @@ def UnloadBusServo(args):
     if args != 'servoPowerDown':
         return (False, __RPC_E01, 'UnloadBusServo')
     try:
-        for i in range(1, 7):
-            board.bus_servo_enable_torque(i, 1)
+        # 6个舵机同时设置并读回校验
+        batch = rrc.gather_futures(board.bus_servo_enable_torque(i, 1, wait=False) for i in range(1, 7))
+        if not all(batch.result(1)):
+            ret = (False, __RPC_E03, 'UnloadBusServo')
     except Exception as e:
         print(e)
         ret = (False, __RPC_E03, 'UnloadBusServo')
+    return ret
 
 @dispatcher.add_method
 def GetBusServosPulse(args):
@@ -297,8 +331,9 @@ def GetBusServosPulse(args):
     if args != 'angularReadback':
         return (False, __RPC_E01, 'GetBusServosPulse')
     try:
+        pulses = board.bus_servo_read_many(range(1, 7), 'position')
         for i in range(1, 7):
-            pulse = board.bus_servo_read_position(i)
+            pulse = pulses[i]
             if pulse is None:
                 ret = (False, __RPC_E04, 'GetBusServosPulse')
                 return ret
@@ -327,7 +362,9 @@ def GetSonarDistance():
     
     ret = (True, 0, 'GetSonarDistance')
     try:
-        ret = (True, HWSONAR.getDistance(), 'GetSonarDistance')
+        # 后台测距时返回滤波后的距离(mm)
+        dist = HWSONAR.getFilteredDistance()
+        ret = (True, HWSONAR.getDistance() if dist is None else int(round(dist)), 'GetSonarDistance')
     except:
         ret = (False, __RPC_E03, 'GetSonarDistance')
     return ret
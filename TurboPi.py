@@ -22,46 +22,29 @@ if sys.version_info.major == 2:
     print('Please run this program with python3!')
     sys.exit(0)
 
-board = rrc.Board()
-board.enable_reception()
-HWSONAR = Sonar.Sonar() #超声波传感器
+board = rrc.acquire_board()  # 进程内共享的扩展板连接, RPCServer和各功能模块都使用它
+HWSONAR = Sonar.Sonar().start() #超声波传感器, 后台线程测距
 
 QUEUE_RPC = queue.Queue(10)
     
 voltage = 0.0
-def voltageDetection():
-    global voltage
-    vi = 0
-    dat = []
-    previous_time = 0.00
-    try:
-        while True:
-            if time.time() >= previous_time + 1.00 :
-                previous_time = time.time()
-                volt = board.get_battery()
-                if volt is not None:
-                    volt /=1000.0
-                    if 5.0 < volt  < 8.5:
-                        dat.insert(vi, volt)
-                        vi = vi + 1            
-                    if vi >= 3:
-                        vi = 0
-                        volt1 = dat[0]
-                        volt2 = dat[1]
-                        volt3 = dat[2]
-                        voltage = (volt1+volt2+volt3)/3.0 
-                        print('Voltage:','%0.2f' % voltage)
-            else:
-                time.sleep(0.01)
-            
-    except Exception as e:
-        print('Error', e)
-            
-        
-# 运行子线程
-VD = threading.Thread(target=voltageDetection)
-VD.daemon = True
-VD.start()
+voltage_samples = []
+voltage_time = 0.0
+def voltageDetection(volt):
+    # 电池电压回调, 每秒取一个数据, 每3个数据求平均
+    global voltage, voltage_time
+    if time.time() < voltage_time + 0.9:
+        return
+    voltage_time = time.time()
+    volt /= 1000.0
+    if 5.0 < volt < 8.5:
+        voltage_samples.append(volt)
+    if len(voltage_samples) >= 3:
+        voltage = sum(voltage_samples) / 3.0
+        del voltage_samples[:]
+        print('Voltage:','%0.2f' % voltage)
+
+board.subscribe('battery', voltageDetection)
 
 def startTruckPi():
     global HWEXT, HWSONIC
@@ -70,8 +53,7 @@ def startTruckPi():
     previous_time = 0.00
     # 超声波开启后默认关闭灯
     HWSONAR.setRGBMode(0)
-    HWSONAR.setPixelColor(0, (0,0,0))
-    HWSONAR.setPixelColor(1, (0,0,0))
+    HWSONAR.setPixelColors((0,0,0), (0,0,0))
     HWSONAR.show()
     
     # 玩法调用的超声波
@@ -93,9 +75,13 @@ def startTruckPi():
     cam = Camera.Camera()  # 相机读取
     Running.cam = cam
 
+    seq = -1
     while True:
         
-        time.sleep(0.03)
+        # 等待新的一帧画面, 最多等30ms, 没有新画面时也要执行RPC命令
+        latest = cam.wait_next(seq, 0.03)
+        if latest is not None:
+            seq = latest[0]
         # 执行需要在本线程中执行的RPC命令
         while True:
             try:
@@ -109,8 +95,8 @@ def startTruckPi():
         # 执行功能玩法程序：
         try:
             if Running.RunningFunc > 0 and Running.RunningFunc <= 9:
-                if cam.frame is not None:
-                    frame = cam.frame.copy()
+                if latest is not None:  # 每帧画面只处理一次
+                    frame = latest[2].copy()  # run()会在画面上画图, 需要可写的拷贝
                     img = Running.CurrentEXE().run(frame)
                     if Running.RunningFunc == 9:
                         MjpgServer.img_show = np.vstack((img, frame))
@@ -120,11 +106,13 @@ def startTruckPi():
                             MjpgServer.img_show = cv2.putText(img, "Voltage:%.1fV"%voltage, (420, 460), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0,0,255), 2)
                         else:
                             MjpgServer.img_show = cv2.putText(img, "Voltage:%.1fV"%voltage, (420, 460), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0,255,0), 2)
-                else:
+                elif cam.frame is None:
                     MjpgServer.img_show = loading_picture
-            else:
-                MjpgServer.img_show = cam.frame
-                
+            elif latest is not None:
+                MjpgServer.img_show = latest[2].copy()  # 摄像头线程会复用这块缓冲区, 编码时需要拷贝
+            elif cam.frame is None:
+                MjpgServer.img_show = None
+
         except KeyboardInterrupt:
             print('RunningFunc1', Running.RunningFunc)
             break